@@ -0,0 +1,68 @@
+import torch
+import argparse
+import time
+
+from bench_path_adjacency import make_synthetic_paths
+from path_adjacency import build_path_adjacency
+from step6_stgcn_trainer import SimpleSTGCN
+
+# ==========================================
+# 图卷积基准 (CPU)：稠密 A·X vs 稀疏 CSR A·X
+# 邻接矩阵由模拟路径经 build_path_adjacency 生成，稀疏度与真实路径图相近
+# 每个规模测一次完整训练步 (前向 + 反向)，报告 样本/秒 与邻接矩阵占用内存
+# ==========================================
+def _adj_bytes(adj):
+    if adj.layout == torch.sparse_csr:
+        return sum(t.numel() * t.element_size() for t in (adj.crow_indices(), adj.col_indices(), adj.values()))
+    return adj.numel() * adj.element_size()
+
+def time_train_step(model, x, y, repeats):
+    loss_fn = torch.nn.MSELoss()
+    # 预热一次，排除首次调用的分配开销
+    loss_fn(model(x), y).backward()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.zero_grad()
+        loss_fn(model(x), y).backward()
+    return (time.perf_counter() - start) / repeats
+
+def run_benchmark(sizes, batch_size=8, window_size=5, hidden=64, repeats=5, dense_max=10000):
+    print(f"{'节点数':>7} | {'nnz/行':>7} | {'稠密(样本/s)':>12} | {'稀疏(样本/s)':>12} | {'加速':>6} | {'稠密邻接':>9} | {'稀疏邻接':>9}")
+    print("-" * 84)
+    for n in sizes:
+        adj = build_path_adjacency(make_synthetic_paths(n, num_corridors=max(n // 25, 2)))
+        x = torch.rand(batch_size, window_size, n, 1)
+        y = torch.rand(batch_size, 1, n)
+
+        torch.manual_seed(0)
+        sparse_model = SimpleSTGCN(adj, n, 1, hidden, 1, window_size=window_size)
+        t_sparse = time_train_step(sparse_model, x, y, repeats)
+        sparse_mb = _adj_bytes(sparse_model.adj) / 2**20
+
+        if n <= dense_max:
+            torch.manual_seed(0)
+            dense_model = SimpleSTGCN(adj, n, 1, hidden, 1, window_size=window_size, sparse_adj=False)
+            t_dense = time_train_step(dense_model, x, y, repeats)
+            dense_mb = _adj_bytes(dense_model.adj) / 2**20
+            with torch.no_grad():
+                assert torch.allclose(dense_model(x), sparse_model(x), atol=1e-4), "稠密 / 稀疏输出不一致"
+            dense_col = f"{batch_size / t_dense:>12.1f}"
+            speedup = f"{t_dense / t_sparse:>5.1f}x"
+            dense_mem = f"{dense_mb:>7.1f}MB"
+            del dense_model
+        else:
+            dense_col, speedup, dense_mem = f"{'-':>12}", f"{'-':>6}", f"{'-':>9}"
+        print(f"{n:>7} | {adj.nnz / n:>7.1f} | {dense_col} | {batch_size / t_sparse:>12.1f} | {speedup} | "
+              f"{dense_mem} | {sparse_mb:>7.2f}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SimpleSTGCN 稠密 / 稀疏图卷积 CPU 基准")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500, 1000, 2000, 5000, 10000])
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--dense-max', type=int, default=10000, help="超过该节点数不再运行稠密版本")
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    run_benchmark(args.sizes, args.batch_size, repeats=args.repeats, dense_max=args.dense_max)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import time
+import argparse
+import subprocess
+import sys
+import numpy as np
+
+# ==========================================
+# 推理服务压测：C 个并发 keep-alive 连接持续发送 /predict，报告 p50 / p99 延迟与 requests/sec
+# 给出 --checkpoint 时自动在本地启动 serve_predictor.py（可对比 --max-batch 1 与微批合并）
+# ==========================================
+async def _request(reader, writer, host, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    method = 'POST' if payload is not None else 'GET'
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        k, _, v = line.decode().partition(':')
+        if k.lower() == 'content-length':
+            length = int(v)
+    data = await reader.readexactly(length)
+    return status, json.loads(data)
+
+async def _client(host, port, payloads, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status, _ = await _request(reader, writer, host, '/predict', payloads[i % len(payloads)])
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(status)
+            i += 1
+    finally:
+        writer.close()
+
+async def run_load(host, port, concurrency, duration, payloads):
+    reader, writer = await asyncio.open_connection(host, port)
+    _, health = await _request(reader, writer, host, '/health')
+    writer.close()
+    latencies, errors = [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[_client(host, port, payloads, deadline, latencies, errors) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, after = await _request(reader, writer, host, '/health')
+    writer.close()
+    batches = after['batches'] - health['batches']
+    requests = after['requests'] - health['requests']
+    lat = np.array(latencies) * 1000
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(lat, 50)) if len(lat) else float('nan'),
+        'p99_ms': float(np.percentile(lat, 99)) if len(lat) else float('nan'),
+        'avg_batch': requests / batches if batches else 0.0,
+    }
+
+def _make_payloads(health, count=32, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (health['window_size'], health['num_nodes'], health['num_features'])
+    return [{'window': rng.poisson(2.0, size=shape).astype(float).tolist()} for _ in range(count)]
+
+async def _wait_health(host, port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            _, health = await _request(reader, writer, host, '/health')
+            writer.close()
+            return health
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"推理服务 {host}:{port} 未在 {timeout}s 内就绪")
+
+async def main(args):
+    health = await _wait_health(args.host, args.port)
+    payloads = _make_payloads(health)
+    print(f"{'并发':>5} | {'请求数':>7} | {'req/s':>8} | {'p50(ms)':>8} | {'p99(ms)':>8} | {'平均批大小':>9} | 错误")
+    print("-" * 70)
+    for c in args.concurrency:
+        r = await run_load(args.host, args.port, c, args.duration, payloads)
+        print(f"{r['concurrency']:>5} | {r['requests']:>7} | {r['rps']:>8.1f} | {r['p50_ms']:>8.2f} | "
+              f"{r['p99_ms']:>8.2f} | {r['avg_batch']:>9.1f} | {r['errors']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="推理服务压测（p50 / p99 延迟与 requests/sec）")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--duration', type=float, default=5.0, help="每个并发级别的压测秒数")
+    parser.add_argument('--checkpoint', default=None, help="给出时自动启动本地服务")
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = None
+    if args.checkpoint:
+        server = subprocess.Popen([sys.executable, "serve_predictor.py", "--checkpoint", args.checkpoint,
+                                   "--host", args.host, "--port", str(args.port),
+                                   "--max-batch", str(args.max_batch), "--max-wait-ms", str(args.max_wait_ms)])
+    try:
+        asyncio.run(main(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,61 @@
+import pandas as pd
+import numpy as np
+import argparse
+import time
+
+from edge_index import load_edge_index, EDGE_CODE_DTYPE
+from step3_map_matching import make_matcher
+from step4_extract_path import compress_paths
+
+# ==========================================
+# 匹配方法对比：逐点最近路段 vs HMM / Viterbi
+# 指标：吞吐量 (点/秒) + 路径碎片化程度（唯一路径数、Top-50 覆盖率、A->B->A 回跳次数）
+# ==========================================
+def fragmentation_stats(df, edge_idx, index, top_k=50):
+    df = df.copy()
+    df['edge_id'] = edge_idx.astype(EDGE_CODE_DTYPE)
+    paths = compress_paths(df).to_pandas()
+    tuples = paths['edge_id'].apply(tuple)
+    counts = tuples.value_counts()
+
+    # 压缩后的序列中出现 A -> B -> A 即视为路段闪烁
+    flicker = sum(sum(1 for a, c in zip(p[:-2], p[2:]) if a == c) for p in paths['edge_id'])
+    return {
+        'trips': len(paths),
+        'unique_paths': len(counts),
+        'mean_path_len': paths['path_len'].mean(),
+        f'top{top_k}_coverage': counts.head(top_k).sum() / max(len(paths), 1),
+        'flicker_events': flicker,
+    }
+
+def run_benchmark(parquet_path, graph_file, workers=1, top_k=50):
+    df = pd.read_parquet(parquet_path)
+    index = load_edge_index(graph_file)
+    print(f"📄 {parquet_path}: {len(df)} 个点, {df['track_id'].nunique()} 辆车")
+
+    rows = []
+    for method in ['nearest', 'hmm']:
+        matcher = make_matcher(index, method, graph_file, workers)
+        start = time.perf_counter()
+        edge_idx = matcher(df)
+        elapsed = time.perf_counter() - start
+        stats = fragmentation_stats(df, edge_idx, index, top_k)
+        stats.update({'method': method, 'seconds': elapsed, 'points_per_sec': len(df) / elapsed})
+        rows.append(stats)
+
+    report = pd.DataFrame(rows).set_index('method')
+    print("\n" + report.to_string(float_format=lambda v: f"{v:.3f}"))
+    base, hmm = report.loc['nearest'], report.loc['hmm']
+    print(f"\n唯一路径数减少: {1 - hmm['unique_paths'] / base['unique_paths']:.1%} | "
+          f"回跳次数减少: {1 - hmm['flicker_events'] / max(base['flicker_events'], 1):.1%} | "
+          f"Top-{top_k} 覆盖率: {base[f'top{top_k}_coverage']:.1%} -> {hmm[f'top{top_k}_coverage']:.1%}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="地图匹配基准：nearest vs hmm")
+    parser.add_argument('--input', default='processed_data/20181024_d1_0900_0930.parquet')
+    parser.add_argument('--graph-file', default='athens_road_network.graphml')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--top-k', type=int, default=50)
+    args = parser.parse_args()
+    run_benchmark(args.input, args.graph_file, args.workers, args.top_k)
@@ -0,0 +1,65 @@
+import numpy as np
+import argparse
+import time
+
+from path_adjacency import build_path_adjacency
+
+# ==========================================
+# 路径邻接构建基准：旧版 O(N²) 集合求交 vs 稀疏 B · Bᵀ
+# 用随机“走廊”上的连续片段模拟真实路径之间的大量重叠
+# ==========================================
+def make_synthetic_paths(num_paths, num_corridors=200, corridor_len=40, seed=0):
+    rng = np.random.default_rng(seed)
+    node = 0
+    corridors = []
+    for _ in range(num_corridors):
+        nodes = np.arange(node, node + corridor_len + 1)
+        node += corridor_len + 1
+        corridors.append([f"{a}_{b}" for a, b in zip(nodes[:-1], nodes[1:])])
+    paths = []
+    for _ in range(num_paths):
+        c = corridors[rng.integers(num_corridors)]
+        start = rng.integers(0, corridor_len - 2)
+        length = rng.integers(2, min(15, corridor_len - start) + 1)
+        paths.append(tuple(c[start:start + length]))
+    return paths
+
+def legacy_adjacency(paths):
+    n = len(paths)
+    A = np.zeros((n, n))
+    for i in range(n):
+        for j in range(n):
+            if set(paths[i]) & set(paths[j]):
+                A[i, j] = 1
+    return A
+
+def run_benchmark(sizes, legacy_max=1000):
+    print(f"{'路径数':>8} | {'旧版(s)':>9} | {'binary(s)':>9} | {'jaccard(s)':>10} | {'+首尾相接(s)':>12} | {'nnz':>10} | 一致")
+    print("-" * 82)
+    for n in sizes:
+        paths = make_synthetic_paths(n)
+        t0 = time.perf_counter()
+        A = build_path_adjacency(paths, 'binary')
+        t_bin = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        build_path_adjacency(paths, 'jaccard')
+        t_jac = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        build_path_adjacency(paths, 'jaccard', connect_end_start=True)
+        t_conn = time.perf_counter() - t0
+
+        if n <= legacy_max:
+            t0 = time.perf_counter()
+            ref = legacy_adjacency(paths)
+            t_old = f"{time.perf_counter() - t0:>9.3f}"
+            same = '✅' if np.array_equal(A.toarray(), ref) else '❌'
+        else:
+            t_old, same = f"{'-':>9}", '-'
+        print(f"{n:>8} | {t_old} | {t_bin:>9.3f} | {t_jac:>10.3f} | {t_conn:>12.3f} | {A.nnz:>10} | {same}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="路径邻接矩阵构建基准")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500, 1000, 5000, 10000])
+    parser.add_argument('--legacy-max', type=int, default=1000, help="超过该路径数不再运行旧版 O(N²) 实现")
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.legacy_max)
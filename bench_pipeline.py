@@ -0,0 +1,186 @@
+import pandas as pd
+import numpy as np
+import argparse
+import glob
+import multiprocessing as mp
+import os
+import sys
+from queue import Empty
+
+import run_profile
+from synth_pneuma import generate_dataset
+
+# ==========================================
+# 端到端基准：合成 pNEUMA 数据 -> 解析 -> 匹配 -> 路径提取 -> 特征构建 -> 训练 -> 推理
+# 规模以“一个 30 分钟文件”为 1x（默认 1000 辆车 @ 25Hz），10x / 100x 为 10 / 100 个文件
+# （按 日期 / 无人机 / 半小时 命名，与真实数据的组织方式一致）；小于 1 的规模按比例减少车辆数，用于冒烟测试
+# 每个规模在独立的 spawn 子进程中运行，峰值 RSS 互不影响；各阶段的明细记录在 run_profile 报告中，
+# 汇总表 (bench_pipeline.parquet) 可作为 --baseline 与之后的运行对比，吞吐下降 / 内存上升超过阈值时返回非 0
+# 合成 csv 按参数缓存在 <work-dir>/synth_* 下，规模之间、多次运行之间复用（100x 约 15 GB）
+# ==========================================
+def scale_layout(scale, vehicles):
+    """规模 -> (文件数, 每个文件的车辆数)"""
+    if scale >= 1:
+        return int(round(scale)), vehicles
+    return 1, max(int(round(vehicles * scale)), 1)
+
+def _infer(checkpoint, store, batch_size=256):
+    """用训练得到的检查点对存储中的全部有效窗口做批量预测，返回窗口数"""
+    from predictor import FlowPredictor
+    from st_store import load_st_data
+    data = load_st_data(store)
+    predictor = FlowPredictor.from_checkpoint(checkpoint, data=data)
+    x = np.asarray(data['x'], dtype=np.float32)
+    w = predictor.window_size
+    if len(x) < w:
+        return 0
+    windows = np.lib.stride_tricks.sliding_window_view(x, w, axis=0).transpose(0, 3, 1, 2)
+    if data.get('mask') is not None:
+        valid = np.lib.stride_tricks.sliding_window_view(np.asarray(data['mask']), w).all(axis=1)
+        windows = windows[valid]
+    for b0 in range(0, len(windows), batch_size):
+        predictor.predict(windows[b0:b0 + batch_size])
+    return len(windows)
+
+def _run_scale(scale, csv_files, work_dir, opts, queue):
+    """子进程：对 csv_files 跑完整流水线，写出 run_profile 报告，把各阶段汇总放回 queue"""
+    from step1_parse_pneuma import run_batch_parser
+    from step3_map_matching import map_matching
+    from step4_extract_path import extract_path_sequences
+    from step5_build_st_features_batch import build_st_features_batch
+
+    dirs = {name: os.path.join(work_dir, name) for name in ('processed', 'matched', 'paths', 'model', 'ckpt')}
+    run_profile.enable(os.path.join(work_dir, 'report'), opts['profile'],
+                       meta={'scale': scale, 'files': len(csv_files), **opts})
+    rows = {}
+
+    def bench_stage(name, rows_in=None, inputs=()):
+        return run_profile.stage(f'bench.{name}', inputs=inputs, rows_in=rows_in)
+
+    with bench_stage('parse', inputs=csv_files) as rec:
+        stats = run_batch_parser(os.path.dirname(csv_files[0]), dirs['processed'], opts['sampling_rate'],
+                                 workers=opts['workers'], files=csv_files)
+        rec.rows_out = sum(st['points'] for st in stats)
+    rows['parse'] = rec
+
+    traj_files = sorted(p for p in glob.glob(os.path.join(dirs['processed'], '*.parquet')) if '_info' not in p)
+    with bench_stage('match', rows_in=rows['parse'].rows_out, inputs=traj_files) as rec:
+        map_matching(opts['graph_file'], dirs['processed'], dirs['matched'], files=traj_files,
+                     method=opts['match_method'], workers=opts['workers'])
+        rec.rows_out = rec.rows_in
+    rows['match'] = rec
+
+    matched_files = sorted(glob.glob(os.path.join(dirs['matched'], '*_matched.parquet')))
+    with bench_stage('extract', rows_in=rows['match'].rows_out, inputs=matched_files) as rec:
+        extract_path_sequences(dirs['matched'], dirs['paths'], files=matched_files)
+        path_files = sorted(glob.glob(os.path.join(dirs['paths'], '*_paths.parquet')))
+        rec.rows_out = sum(pd.read_parquet(p, columns=['track_id']).shape[0] for p in path_files)
+    rows['extract'] = rec
+
+    with bench_stage('build', rows_in=rows['extract'].rows_out, inputs=path_files) as rec:
+        store = build_st_features_batch(dirs['paths'], dirs['model'], opts['num_top_paths'], opts['time_step_sec'],
+                                        path_files=path_files, graph_file=opts['graph_file'])
+        rec.add_output(store)
+    rows['build'] = rec
+
+    # torch 在训练前才导入，前面各阶段的峰值 RSS 不包含其常驻内存
+    from step6_stgcn_trainer import main as train_main, TRAIN_DEFAULTS
+    train_options = dict(TRAIN_DEFAULTS, checkpoint_dir=dirs['ckpt'], checkpoint_every=opts['epochs'], patience=0)
+    with bench_stage('train', inputs=[store]) as rec:
+        model = train_main(store, opts['window_size'], 1, 0, opts['batch_size'], opts['epochs'], plot=False,
+                           train_options=train_options)
+        rec.rows_in = sum(r['samples_per_sec'] * r['time'] for r in model.history)
+    rows['train'] = rec
+
+    with bench_stage('infer') as rec:
+        rec.rows_in = _infer(os.path.join(dirs['ckpt'], 'last.pt'), store)
+    rows['infer'] = rec
+
+    run_profile.write_report()
+    # 吞吐按输入行数计算；解析阶段的输入是原始 csv，按输出的 (降采样后) 轨迹点数计算
+    queue.put([{'scale': scale, 'files': len(csv_files), 'stage': name, 'wall_s': r.wall_s, 'cpu_s': r.cpu_s,
+                'peak_rss_mb': r.peak_rss_mb, 'rows_in': r.rows_in, 'rows_out': r.rows_out,
+                'bytes_read': r.to_dict()['bytes_read'],
+                'rows_per_sec': (r.rows_in if r.rows_in is not None else r.rows_out or 0) / max(r.wall_s, 1e-9)}
+               for name, r in rows.items()])
+
+def run_benchmark(scales, work_dir='bench_runs', vehicles=1000, duration_sec=1800, hz=25, seed=0, **opts):
+    synth_dir = os.path.join(work_dir, f"synth_v{{}}_d{duration_sec}_h{hz}_s{seed}")
+    ctx = mp.get_context('spawn')
+    results = []
+    for scale in scales:
+        num_files, per_file = scale_layout(scale, vehicles)
+        csv_files = generate_dataset(synth_dir.format(per_file), num_files, per_file, duration_sec, hz,
+                                     opts['graph_file'], seed, workers=opts['workers'])
+        run_dir = os.path.join(work_dir, f"scale_{scale:g}x")
+        print(f"\n🏁 规模 {scale:g}x: {num_files} 个文件 x {per_file} 辆车 -> {run_dir}")
+        queue = ctx.Queue()
+        p = ctx.Process(target=_run_scale, args=(scale, csv_files, run_dir, opts, queue))
+        p.start()
+        while True:
+            try:
+                results.extend(queue.get(timeout=5))
+                break
+            except Empty:
+                if not p.is_alive():
+                    raise RuntimeError(f"规模 {scale:g}x 的子进程异常退出 (exit code {p.exitcode})")
+        p.join()
+
+    report = pd.DataFrame(results)
+    os.makedirs(work_dir, exist_ok=True)
+    output = os.path.join(work_dir, 'bench_pipeline.parquet')
+    report.to_parquet(output, index=False)
+    print(f"\n{'规模':>6} | {'阶段':<8} | {'行数':>12} | {'耗时(s)':>9} | {'rows/s':>12} | {'MB/s':>8} | {'峰值RSS(MB)':>12}")
+    print("-" * 87)
+    for r in report.itertuples():
+        rows = r.rows_in if pd.notna(r.rows_in) else r.rows_out
+        mb_s = r.bytes_read / 1024 ** 2 / max(r.wall_s, 1e-9) if pd.notna(r.bytes_read) else float('nan')
+        print(f"{r.scale:>5g}x | {r.stage:<8} | {rows:>12.0f} | {r.wall_s:>9.2f} | "
+              f"{r.rows_per_sec:>12.0f} | {mb_s:>8.1f} | {r.peak_rss_mb:>12.1f}")
+    print(f"\n📊 汇总已保存: {output}")
+    return report
+
+def find_regressions(report, baseline, tolerance=0.25, min_wall_s=1.0):
+    """
+    与基线逐 (规模, 阶段) 对比：吞吐低于基线 (1 - tolerance) 倍或峰值内存高于 (1 + tolerance) 倍视为退化
+    基线耗时不足 min_wall_s 的阶段计时噪声太大，只检查内存
+    """
+    merged = report.merge(baseline, on=['scale', 'stage'], suffixes=('', '_base'))
+    merged['speed_ratio'] = merged['rows_per_sec'] / merged['rows_per_sec_base']
+    merged['peak_ratio'] = merged['peak_rss_mb'] / merged['peak_rss_mb_base']
+    slow = (merged['speed_ratio'] < 1 - tolerance) & (merged['wall_s_base'] >= min_wall_s)
+    bad = slow | (merged['peak_ratio'] > 1 + tolerance)
+    return merged.loc[bad, ['scale', 'stage', 'rows_per_sec_base', 'rows_per_sec', 'speed_ratio',
+                            'peak_rss_mb_base', 'peak_rss_mb', 'peak_ratio']]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="端到端基准：合成 pNEUMA 数据上的 解析 / 匹配 / 提取 / 构建 / 训练 / 推理")
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100], help="1 = 一个 30 分钟文件")
+    parser.add_argument('--vehicles', type=int, default=1000, help="1x 规模下每个文件的车辆数")
+    parser.add_argument('--duration-sec', type=int, default=1800)
+    parser.add_argument('--hz', type=int, default=25)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', default='bench_runs')
+    parser.add_argument('--graph-file', default='athens_road_network.graphml')
+    parser.add_argument('--match-method', choices=['nearest', 'hmm'], default='nearest')
+    parser.add_argument('--workers', type=int, default=1, help="合成 / step1 / HMM 匹配的并行进程数")
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--window-size', type=int, default=5)
+    parser.add_argument('--profile', default=None, help="用 cProfile 采集的热点（见 run_profile）")
+    parser.add_argument('--baseline', default=None, help="之前运行的 bench_pipeline.parquet，对比并检查退化")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-wall-s', type=float, default=1.0, help="基线耗时短于此值的阶段不检查吞吐")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.scales, args.work_dir, args.vehicles, args.duration_sec, args.hz, args.seed,
+                           graph_file=args.graph_file, match_method=args.match_method, workers=args.workers,
+                           sampling_rate=args.hz, time_step_sec=60, num_top_paths=50, epochs=args.epochs,
+                           batch_size=args.batch_size, window_size=args.window_size, profile=args.profile)
+    if args.baseline:
+        regressions = find_regressions(report, pd.read_parquet(args.baseline), args.tolerance, args.min_wall_s)
+        if len(regressions):
+            print(f"\n❌ 发现 {len(regressions)} 处性能退化 (容差 {args.tolerance:.0%}):")
+            print(regressions.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+            sys.exit(1)
+        print(f"\n✅ 与基线 {args.baseline} 相比没有超过 {args.tolerance:.0%} 的退化")
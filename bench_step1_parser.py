@@ -0,0 +1,125 @@
+import pandas as pd
+import numpy as np
+import argparse
+import csv
+import glob
+import multiprocessing as mp
+import os
+import resource
+import tempfile
+import time
+from datetime import timedelta
+
+from step1_parse_pneuma import get_absolute_base_time, parse_pneuma_file
+
+# ==========================================
+# 对照组：旧版逐行 dict 解析（原 run_batch_parser 的循环体）
+# ==========================================
+def parse_file_rowloop(file_path, output_file, sampling_rate=25):
+    base_dt = get_absolute_base_time(os.path.basename(file_path))
+    vehicles_list = []
+    trajectories_list = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter=';')
+        next(reader)
+        for row in reader:
+            row = [x.strip() for x in row if x.strip()]
+            if len(row) < 10: continue
+            track_id = int(row[0])
+            vehicles_list.append({'track_id': track_id, 'type': row[1], 'avg_speed': float(row[3])})
+            dynamic_data = row[10:]
+            for i in range(0, len(dynamic_data), 6 * sampling_rate):
+                chunk = dynamic_data[i : i + 6]
+                if len(chunk) == 6:
+                    rel_time = float(chunk[5])
+                    abs_time = base_dt + timedelta(seconds=rel_time) if base_dt else rel_time
+                    trajectories_list.append({
+                        'track_id': track_id,
+                        'lat': float(chunk[0]),
+                        'lon': float(chunk[1]),
+                        'speed': float(chunk[2]),
+                        'timestamp': abs_time
+                    })
+    df_t = pd.DataFrame(trajectories_list)
+    df_t.to_parquet(output_file, engine='pyarrow')
+    pd.DataFrame(vehicles_list).to_parquet(output_file.replace('.parquet', '_info.parquet'), engine='pyarrow')
+    return len(df_t), len(vehicles_list)
+
+# ==========================================
+# 无原始数据时生成一个 pNEUMA 格式的随机文件
+# ==========================================
+def write_fake_pneuma_csv(path, num_vehicles=300, duration_sec=600, hz=25, seed=0):
+    rng = np.random.default_rng(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("track_id; type; traveled_d; avg_speed; lat; lon; speed; lon_acc; lat_acc; time\n")
+        for tid in range(1, num_vehicles + 1):
+            n = int(rng.integers(hz * 30, hz * duration_sec))
+            t0 = rng.uniform(0, duration_sec) // 0.04 * 0.04
+            lat = 37.98 + np.cumsum(rng.normal(0, 1e-6, n))
+            lon = 23.73 + np.cumsum(rng.normal(0, 1e-6, n))
+            speed = np.abs(rng.normal(20, 5, n))
+            acc = rng.normal(0, 0.5, (n, 2))
+            t = t0 + np.arange(n) * 0.04
+            dyn = np.column_stack([lat, lon, speed, acc, t])
+            body = "; ".join(f"{a:.6f}; {b:.6f}; {c:.4f}; {d:.4f}; {e:.4f}; {g:.2f}" for a, b, c, d, e, g in dyn)
+            f.write(f"{tid}; Car; {speed.sum() * 0.04 / 3.6:.2f}; {speed.mean():.6f}; {body}; \n")
+
+# ==========================================
+# 在独立子进程中运行，分别统计吞吐量与峰值 RSS
+# ==========================================
+def _worker(name, csv_path, out_dir, sampling_rate, queue):
+    out_file = os.path.join(out_dir, f"{name}_{os.path.basename(csv_path).replace('.csv', '.parquet')}")
+    start = time.perf_counter()
+    if name == 'rowloop':
+        rows, _ = parse_file_rowloop(csv_path, out_file, sampling_rate)
+    else:
+        rows, _ = parse_pneuma_file(csv_path, out_file, sampling_rate)
+    elapsed = time.perf_counter() - start
+    # Linux 下 ru_maxrss 单位为 KB
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put({'parser': name, 'rows': rows, 'seconds': elapsed,
+               'rows_per_sec': rows / elapsed if elapsed else 0.0, 'peak_rss_mb': peak_mb,
+               'output': out_file})
+
+def run_benchmark(csv_path, sampling_rate=25):
+    ctx = mp.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name in ['rowloop', 'vectorized']:
+            queue = ctx.Queue()
+            p = ctx.Process(target=_worker, args=(name, csv_path, out_dir, sampling_rate, queue))
+            p.start()
+            results.append(queue.get())
+            p.join()
+
+        # 输出一致性检查
+        old = pd.read_parquet(results[0]['output'])
+        new = pd.read_parquet(results[1]['output'])
+        same = old.shape == new.shape and all(np.array_equal(old[c].values, new[c].values) for c in old.columns)
+
+    print(f"\n{'解析器':<12} | {'点数':>10} | {'耗时(s)':>8} | {'rows/s':>12} | {'峰值RSS(MB)':>12}")
+    print("-" * 66)
+    for r in results:
+        print(f"{r['parser']:<12} | {r['rows']:>10} | {r['seconds']:>8.2f} | {r['rows_per_sec']:>12.0f} | {r['peak_rss_mb']:>12.1f}")
+    print(f"\n加速比: {results[0]['seconds'] / results[1]['seconds']:.1f}x | 输出一致: {'✅' if same else '❌'}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="step1 解析器基准测试：旧版逐行循环 vs 向量化分块解析")
+    parser.add_argument('--csv', default=None, help="pNEUMA 原始 csv，默认取 dataset/ 下第一个文件")
+    parser.add_argument('--fake-vehicles', type=int, default=300, help="没有原始数据时生成的随机车辆数")
+    parser.add_argument('--sampling-rate', type=int, default=25)
+    args = parser.parse_args()
+
+    csv_path = args.csv
+    if csv_path is None:
+        found = sorted(glob.glob(os.path.join('dataset', '*.csv')))
+        csv_path = found[0] if found else None
+
+    if csv_path is None:
+        tmp_dir = tempfile.mkdtemp()
+        csv_path = os.path.join(tmp_dir, '20181024_d1_0830_0900.csv')
+        print(f"⚠️ 未找到原始数据，生成随机 pNEUMA 文件 ({args.fake_vehicles} 辆车): {csv_path}")
+        write_fake_pneuma_csv(csv_path, num_vehicles=args.fake_vehicles)
+
+    run_benchmark(csv_path, args.sampling_rate)
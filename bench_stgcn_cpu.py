@@ -0,0 +1,77 @@
+import torch
+import argparse
+import time
+
+from bench_path_adjacency import make_synthetic_paths
+from path_adjacency import build_path_adjacency
+from step6_stgcn_trainer import build_model
+
+# ==========================================
+# ST-GCN 模型 CPU 吞吐基准：SimpleSTGCN vs 门控空洞时间卷积 GatedSTGCN
+# 对每个 batch size 报告 推理延迟 (ms/batch)、推理吞吐 与 训练吞吐 (样本/秒)
+# ==========================================
+def _time(fn, repeats):
+    fn()  # 预热
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+def bench_model(model, batch_sizes, window_size, num_nodes, in_channels, horizon, repeats):
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    loss_fn = torch.nn.MSELoss()
+    rows = []
+    for bs in batch_sizes:
+        x = torch.rand(bs, window_size, num_nodes, in_channels)
+        y = torch.rand(bs, horizon, num_nodes)
+
+        model.eval()
+        with torch.inference_mode():
+            t_inf = _time(lambda: model(x), repeats)
+
+        def train_step():
+            optimizer.zero_grad()
+            loss_fn(model(x).view(bs, horizon, num_nodes), y).backward()
+            optimizer.step()
+        model.train()
+        t_train = _time(train_step, repeats)
+        rows.append((bs, t_inf * 1000, bs / t_inf, bs / t_train))
+    return rows
+
+def run_benchmark(num_nodes=500, window_size=12, horizon=3, in_channels=1, hidden=64,
+                  batch_sizes=(1, 8, 32, 128), num_blocks=2, kernel_size=2, repeats=10):
+    adj = build_path_adjacency(make_synthetic_paths(num_nodes, num_corridors=max(num_nodes // 25, 2)))
+    configs = [
+        ('simple', {}),
+        ('tcn', {'num_blocks': num_blocks, 'kernel_size': kernel_size}),
+    ]
+    print(f"节点数: {num_nodes} | 窗口: {window_size} | 预测步数: {horizon} | 线程: {torch.get_num_threads()}")
+    print(f"{'模型':>8} | {'参数量':>8} | {'batch':>5} | {'推理延迟(ms)':>12} | {'推理(样本/s)':>12} | {'训练(样本/s)':>12}")
+    print("-" * 78)
+    for name, kwargs in configs:
+        torch.manual_seed(0)
+        model = build_model(name, adj, num_nodes, in_channels, window_size, horizon, hidden, **kwargs)
+        params = sum(p.numel() for p in model.parameters())
+        for bs, latency, inf_tp, train_tp in bench_model(model, batch_sizes, window_size, num_nodes,
+                                                         in_channels, horizon, repeats):
+            print(f"{name:>8} | {params:>8} | {bs:>5} | {latency:>12.2f} | {inf_tp:>12.1f} | {train_tp:>12.1f}")
+        if name == 'tcn':
+            print(f"{'':>8}   感受野: {model.receptive_field} 步")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ST-GCN 模型 CPU 吞吐 / 延迟基准")
+    parser.add_argument('--nodes', type=int, default=500)
+    parser.add_argument('--window-size', type=int, default=12)
+    parser.add_argument('--horizon', type=int, default=3)
+    parser.add_argument('--features', type=int, default=1)
+    parser.add_argument('--hidden', type=int, default=64)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--blocks', type=int, default=2)
+    parser.add_argument('--kernel-size', type=int, default=2)
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    run_benchmark(args.nodes, args.window_size, args.horizon, args.features, args.hidden,
+                  args.batch_sizes, args.blocks, args.kernel_size, args.repeats)
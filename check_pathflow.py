@@ -1,12 +1,13 @@
-import torch
 import numpy as np
 import pandas as pd
 
+from st_store import load_st_data
+
 def print_path_flow_details():
     # 1. 加载数据
-    data_path = "model_inputs/st_batch_data.pt"
+    data_path = "model_inputs/st_batch_data"
     try:
-        data = torch.load(data_path)
+        data = load_st_data(data_path)
     except FileNotFoundError:
         print("❌ 找不到数据文件，请先运行 step5_build_st_features_batch.py")
         return
@@ -21,7 +22,7 @@ def print_path_flow_details():
 
     # 2. 统计每条路径在所有片段中的表现
     # 将所有片段拼接成一个大矩阵 (Total_Time, 50)
-    all_data = np.concatenate(x_list, axis=0).squeeze(-1) 
+    all_data = data['x'][..., 0] if 'x' in data else np.concatenate(x_list, axis=0).squeeze(-1)
     
     # 计算统计指标
     mean_flow = all_data.mean(axis=0)
@@ -34,7 +35,7 @@ def print_path_flow_details():
     
     for i in range(len(path_labels)):
         # 路径构成描述
-        path_desc = " -> ".join(list(path_labels[i])[:3]) 
+        path_desc = " -> ".join(map(str, list(path_labels[i])[:3]))
         if len(path_labels[i]) > 3:
             path_desc += " ..."
             
@@ -0,0 +1,292 @@
+import numpy as np
+import os
+import json
+import time
+import hashlib
+
+# ==========================================
+# 路段空间索引：把路网所有边拆成投影后的线段，按规则网格建立 CSR 索引
+# 索引以 graphml 文件的哈希为键保存在磁盘上 (.npy，可 mmap)，同一路网只需构建一次
+# 索引中边的下标同时是全局路段字典：路段编码 (int32) <-> graphml 中的 (u, v, key)，
+# matched_data / path_data / 模型输入中的路段都以该编码存储，文件元数据记录所用路网的哈希
+# ==========================================
+EARTH_RADIUS = 6371008.8
+INDEX_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join("cache", "edge_index")
+EDGE_CODE_DTYPE = np.int32
+EDGE_DICT_META_KEY = b'edge_dict_sha1'
+
+def graph_file_hash(graph_file):
+    """路网文件内容的 SHA1，用作所有路网派生缓存的键"""
+    h = hashlib.sha1()
+    with open(graph_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def project_lonlat(lon, lat, lon0, lat0):
+    """等距圆柱投影到以 (lon0, lat0) 为原点的局部平面（单位：米），城市尺度下误差可忽略"""
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    x = EARTH_RADIUS * np.radians(lon - lon0) * np.cos(np.radians(lat0))
+    y = EARTH_RADIUS * np.radians(lat - lat0)
+    return x, y
+
+def unproject_lonlat(x, y, lon0, lat0):
+    """project_lonlat 的逆变换：局部平面坐标（米）-> (lon, lat)"""
+    lon = lon0 + np.degrees(np.asarray(x, dtype=np.float64) / (EARTH_RADIUS * np.cos(np.radians(lat0))))
+    lat = lat0 + np.degrees(np.asarray(y, dtype=np.float64) / EARTH_RADIUS)
+    return lon, lat
+
+def _edge_coords(G, u, v, data):
+    if 'geometry' in data:
+        return np.asarray(data['geometry'].coords, dtype=np.float64)
+    return np.array([[G.nodes[u]['x'], G.nodes[u]['y']],
+                     [G.nodes[v]['x'], G.nodes[v]['y']]], dtype=np.float64)
+
+def build_edge_index(graph_file, out_dir, cell_size=50.0):
+    """读取路网并构建索引，写入 out_dir（先写临时目录再重命名）"""
+    import osmnx as ox
+
+    G = ox.load_graphml(graph_file)
+    lon0 = float(np.mean([d['x'] for _, d in G.nodes(data=True)]))
+    lat0 = float(np.mean([d['y'] for _, d in G.nodes(data=True)]))
+
+    edge_u, edge_v, edge_key, edge_len = [], [], [], []
+    seg_parts, seg_edge, seg_offset = [], [], []
+    for i, (u, v, k, data) in enumerate(G.edges(keys=True, data=True)):
+        coords = _edge_coords(G, u, v, data)
+        x, y = project_lonlat(coords[:, 0], coords[:, 1], lon0, lat0)
+        seg_len = np.hypot(np.diff(x), np.diff(y))
+        edge_u.append(u)
+        edge_v.append(v)
+        edge_key.append(k)
+        edge_len.append(data.get('length', seg_len.sum()))
+        seg_parts.append(np.column_stack([x[:-1], y[:-1], x[1:], y[1:]]))
+        seg_edge.append(np.full(len(seg_len), i, dtype=np.int32))
+        # 线段起点在整条边上的累计里程，用于计算匹配点沿边的位置
+        seg_offset.append(np.concatenate([[0.0], np.cumsum(seg_len)[:-1]]))
+
+    segs = np.concatenate(seg_parts)
+    seg_edge = np.concatenate(seg_edge)
+    seg_offset = np.concatenate(seg_offset)
+
+    # 规则网格：每条线段登记到其包围盒覆盖的所有网格
+    x_min = min(segs[:, 0].min(), segs[:, 2].min()) - cell_size
+    y_min = min(segs[:, 1].min(), segs[:, 3].min()) - cell_size
+    x_max = max(segs[:, 0].max(), segs[:, 2].max()) + cell_size
+    y_max = max(segs[:, 1].max(), segs[:, 3].max()) + cell_size
+    nx = int(np.ceil((x_max - x_min) / cell_size))
+    ny = int(np.ceil((y_max - y_min) / cell_size))
+
+    cx0 = ((np.minimum(segs[:, 0], segs[:, 2]) - x_min) // cell_size).astype(np.int64)
+    cx1 = ((np.maximum(segs[:, 0], segs[:, 2]) - x_min) // cell_size).astype(np.int64)
+    cy0 = ((np.minimum(segs[:, 1], segs[:, 3]) - y_min) // cell_size).astype(np.int64)
+    cy1 = ((np.maximum(segs[:, 1], segs[:, 3]) - y_min) // cell_size).astype(np.int64)
+    cell_ids, cell_segs = [], []
+    for s in range(len(segs)):
+        gx, gy = np.meshgrid(np.arange(cx0[s], cx1[s] + 1), np.arange(cy0[s], cy1[s] + 1))
+        cell_ids.append((gy * nx + gx).ravel())
+        cell_segs.append(np.full(gx.size, s, dtype=np.int32))
+    cell_ids = np.concatenate(cell_ids)
+    cell_segs = np.concatenate(cell_segs)
+    order = np.argsort(cell_ids, kind='stable')
+    cell_offsets = np.zeros(nx * ny + 1, dtype=np.int64)
+    np.add.at(cell_offsets, cell_ids + 1, 1)
+    cell_offsets = np.cumsum(cell_offsets)
+
+    arrays = {
+        'edge_u': np.asarray(edge_u, dtype=np.int64),
+        'edge_v': np.asarray(edge_v, dtype=np.int64),
+        'edge_key': np.asarray(edge_key, dtype=np.int32),
+        'edge_length': np.asarray(edge_len, dtype=np.float64),
+        'segments': segs,
+        'seg_edge': seg_edge,
+        'seg_offset': seg_offset,
+        'cell_offsets': cell_offsets,
+        'cell_segs': cell_segs[order],
+    }
+    meta = {
+        'version': INDEX_VERSION,
+        'graph_file': graph_file,
+        'lon0': lon0, 'lat0': lat0,
+        'x_min': float(x_min), 'y_min': float(y_min),
+        'cell_size': cell_size, 'nx': nx, 'ny': ny,
+        'num_edges': len(edge_u), 'num_segments': len(segs),
+    }
+
+    tmp_dir = out_dir + '.tmp'
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), arr)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_dir, out_dir)
+
+def _group_argmin(group, values):
+    """group 已按升序排列：返回 (各组编号, 组内最小值所在位置)"""
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    mins = np.minimum.reduceat(values, starts)
+    sizes = np.diff(np.r_[starts, len(group)])
+    hit = np.flatnonzero(values == np.repeat(mins, sizes))
+    hit_group = np.searchsorted(starts, hit, side='right') - 1
+    first = np.r_[True, hit_group[1:] != hit_group[:-1]]
+    return group[starts], hit[first]
+
+class EdgeIndex:
+    """基于磁盘网格索引的批量最近路段查询"""
+
+    def __init__(self, index_dir, mmap=True):
+        with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        mode = 'r' if mmap else None
+        for name in ['edge_u', 'edge_v', 'edge_key', 'edge_length', 'segments',
+                     'seg_edge', 'seg_offset', 'cell_offsets', 'cell_segs']:
+            # np.asarray 去掉 memmap 子类包装（仍然零拷贝），避免花式索引时的额外开销
+            setattr(self, name, np.asarray(np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode=mode)))
+        self.cell_size = self.meta['cell_size']
+        self.nx, self.ny = self.meta['nx'], self.meta['ny']
+        # 缓存目录以路网文件哈希命名，即路段字典的版本
+        self.graph_sha1 = os.path.basename(os.path.normpath(index_dir))
+
+    @property
+    def num_edges(self):
+        return len(self.edge_u)
+
+    def edge_labels(self, codes):
+        """路段编码 -> 'u_v_key' 字符串（仅用于展示）"""
+        codes = np.asarray(codes, dtype=np.int64)
+        return [f"{u}_{v}_{k}" for u, v, k in zip(self.edge_u[codes], self.edge_v[codes], self.edge_key[codes])]
+
+    def project(self, lon, lat):
+        return project_lonlat(lon, lat, self.meta['lon0'], self.meta['lat0'])
+
+    def unproject(self, x, y):
+        return unproject_lonlat(x, y, self.meta['lon0'], self.meta['lat0'])
+
+    def _cells(self, x, y):
+        cx = np.clip(((x - self.meta['x_min']) // self.cell_size).astype(np.int64), 0, self.nx - 1)
+        cy = np.clip(((y - self.meta['y_min']) // self.cell_size).astype(np.int64), 0, self.ny - 1)
+        return cx, cy
+
+    def _edge_margin(self, x, y, cx, cy):
+        """点到所在网格边界的最短距离（网格外的点记为 0，保守处理）"""
+        fx = x - self.meta['x_min'] - cx * self.cell_size
+        fy = y - self.meta['y_min'] - cy * self.cell_size
+        margin = np.minimum(np.minimum(fx, self.cell_size - fx), np.minimum(fy, self.cell_size - fy))
+        return np.maximum(margin, 0.0)
+
+    def _ring_pairs(self, cx, cy, r):
+        """返回 (点下标, 线段下标)：每个点在 Chebyshev 距离恰为 r 的网格环上的全部候选线段"""
+        if r == 0:
+            dx = np.array([0])
+            dy = np.array([0])
+        else:
+            side = np.arange(-r, r + 1)
+            dx = np.concatenate([side, side, np.full(2 * r - 1, -r), np.full(2 * r - 1, r)])
+            dy = np.concatenate([np.full(2 * r + 1, -r), np.full(2 * r + 1, r), side[1:-1], side[1:-1]])
+        gx = cx[:, None] + dx[None, :]
+        gy = cy[:, None] + dy[None, :]
+        valid = (gx >= 0) & (gx < self.nx) & (gy >= 0) & (gy < self.ny)
+        pt, _ = np.nonzero(valid)
+        cell = (gy * self.nx + gx)[valid]
+        starts = self.cell_offsets[cell]
+        counts = self.cell_offsets[cell + 1] - starts
+        pt = np.repeat(pt, counts)
+        # 展开每个网格的 [start, start+count) 区间
+        pos = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        return pt, np.asarray(self.cell_segs[pos], dtype=np.int64)
+
+    def _seg_distance(self, x, y, seg):
+        s = self.segments[seg]
+        ax, ay, bx, by = s[:, 0], s[:, 1], s[:, 2], s[:, 3]
+        dx, dy = bx - ax, by - ay
+        len2 = dx * dx + dy * dy
+        t = np.where(len2 > 0, ((x - ax) * dx + (y - ay) * dy) / np.where(len2 > 0, len2, 1), 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        dist = np.hypot(x - (ax + t * dx), y - (ay + t * dy))
+        along = self.seg_offset[seg] + t * np.sqrt(len2)
+        return dist, along
+
+    def nearest(self, lon, lat, batch_size=200_000):
+        """
+        批量最近路段查询
+        返回 (u, v, key, distance_m, edge_idx) 五个数组，与输入点一一对应
+        """
+        x_all, y_all = self.project(lon, lat)
+        n = len(x_all)
+        best_edge = np.full(n, -1, dtype=np.int64)
+        best_dist = np.full(n, np.inf)
+
+        for b0 in range(0, n, batch_size):
+            idx = np.arange(b0, min(b0 + batch_size, n))
+            x, y = x_all[idx], y_all[idx]
+            cx, cy = self._cells(x, y)
+            margin = self._edge_margin(x, y, cx, cy)
+            pending = np.arange(len(idx))
+            r = 0
+            while len(pending):
+                pt, seg = self._ring_pairs(cx[pending], cy[pending], r)
+                if len(pt):
+                    gpt = pending[pt]
+                    dist, _ = self._seg_distance(x[gpt], y[gpt], seg)
+                    cand_pt, win = _group_argmin(gpt, dist)
+                    better = dist[win] < best_dist[idx[cand_pt]]
+                    best_dist[idx[cand_pt[better]]] = dist[win][better]
+                    best_edge[idx[cand_pt[better]]] = self.seg_edge[seg[win][better]]
+                # 第 r 环之外的线段距离至少为 r * cell_size + 点到本网格边界的距离，已找到更近者即可停止
+                bound = r * self.cell_size + margin[pending]
+                done = best_dist[idx[pending]] <= bound
+                pending = pending[~done]
+                r += 1
+                if r > max(self.nx, self.ny):
+                    break
+
+        return (np.asarray(self.edge_u)[best_edge], np.asarray(self.edge_v)[best_edge],
+                np.asarray(self.edge_key)[best_edge], best_dist, best_edge)
+
+    def candidates(self, lon, lat, radius):
+        """
+        半径查询：返回每个点在 radius 米内的全部候选边（同一条边只保留最近的线段）
+        返回 (点下标, 边下标, 距离, 沿边里程)，按点下标排序
+        """
+        x, y = self.project(lon, lat)
+        cx, cy = self._cells(x, y)
+        rings = int(np.ceil(radius / self.cell_size))
+        pts, segs = [], []
+        for r in range(rings + 1):
+            pt, seg = self._ring_pairs(cx, cy, r)
+            pts.append(pt)
+            segs.append(seg)
+        pt = np.concatenate(pts)
+        seg = np.concatenate(segs)
+        dist, along = self._seg_distance(x[pt], y[pt], seg)
+        keep = dist <= radius
+        pt, seg, dist, along = pt[keep], seg[keep], dist[keep], along[keep]
+        edge = np.asarray(self.seg_edge[seg], dtype=np.int64)
+
+        order = np.lexsort((dist, edge, pt))
+        pt, edge, dist, along = pt[order], edge[order], dist[order], along[order]
+        first = np.ones(len(pt), dtype=bool)
+        first[1:] = (pt[1:] != pt[:-1]) | (edge[1:] != edge[:-1])
+        return pt[first], edge[first], dist[first], along[first]
+
+def load_edge_index(graph_file="athens_road_network.graphml", cache_dir=DEFAULT_CACHE_DIR, cell_size=50.0):
+    """按路网文件哈希加载索引，不存在时自动构建"""
+    key = graph_file_hash(graph_file)
+    index_dir = os.path.join(cache_dir, key)
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') == INDEX_VERSION and meta.get('cell_size') == cell_size:
+            return EdgeIndex(index_dir)
+        import shutil
+        shutil.rmtree(index_dir)
+
+    print(f"🧱 正在构建路段空间索引 (首次运行): {graph_file}")
+    start = time.time()
+    os.makedirs(cache_dir, exist_ok=True)
+    build_edge_index(graph_file, index_dir, cell_size)
+    print(f"✅ 索引已保存至 {index_dir}，耗时 {time.time() - start:.2f}s")
+    return EdgeIndex(index_dir)
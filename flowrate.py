@@ -1,35 +1,27 @@
 import pandas as pd
 import numpy as np
-import torch
 import os
 import glob
 import matplotlib.pyplot as plt
 
-def analyze_traffic_coverage():
-    # --- 配置 ---
-    input_dir = "path_data"
-    data_path = "model_inputs/st_batch_data.pt"
-    
-    # 1. 加载所有原始路径数据（用于计算总基数）
+from path_counter import load_global_counts, select_top_k
+
+def analyze_traffic_coverage(input_dir="path_data", target_coverage=0.9):
+    # 1. 合并每个路径文件缓存的计数（用于计算总基数），无需重新读取全部路径
     path_files = glob.glob(os.path.join(input_dir, "*_paths.parquet"))
     if not path_files:
         print("❌ 找不到原始路径文件，请确认 step4 已运行。")
         return
-    
-    df_list = [pd.read_parquet(f) for f in path_files]
-    df_all = pd.concat(df_list)
-    df_all['path_tuple'] = df_all['edge_id'].apply(tuple)
-    
-    total_trips = len(df_all)
-    unique_paths_count = df_all['path_tuple'].nunique()
+
+    path_counts, total_trips, _ = load_global_counts(path_files=path_files)
+    unique_paths_count = len(path_counts)
     
     print(f"📊 --- 原始数据统计 ---")
     print(f"总行程数 (Total Trips): {total_trips}")
     print(f"唯一路径总数 (Unique Paths): {unique_paths_count}")
 
     # 2. 计算覆盖率曲线 (Accumulated Coverage)
-    # 按频率排序所有路径
-    path_counts = df_all['path_tuple'].value_counts()
+    # 计数已按频率降序排列
     path_counts_norm = path_counts / total_trips
     cumulative_coverage = path_counts_norm.cumsum().values
 
@@ -40,6 +32,9 @@ def analyze_traffic_coverage():
     print(f"Top 10  路径覆盖率: {cumulative_coverage[9]*100:.2f}%")
     print(f"Top 50  路径覆盖率: {top_50_coverage*100:.2f}%")
     print(f"Top 100 路径覆盖率: {cumulative_coverage[99]*100:.2f}%" if len(cumulative_coverage) >= 100 else "")
+    if target_coverage is not None:
+        k = len(select_top_k(path_counts, total_trips, coverage=target_coverage))
+        print(f"达到 {target_coverage:.0%} 覆盖率所需路径数: {k} (可传给 step5 的 target_coverage)")
 
     # 4. 可视化：帕累托曲线 (Pareto Curve)
     plt.figure(figsize=(10, 6))
@@ -65,4 +60,9 @@ def analyze_traffic_coverage():
         print("\n💡 结论：Top 50 路径覆盖了大部分交通流，模型具有良好的代表性。")
 
 if __name__ == "__main__":
-    analyze_traffic_coverage()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="路径流量覆盖率分析")
+    parser.add_argument('--input', default='path_data')
+    parser.add_argument('--target-coverage', type=float, default=0.9)
+    args = parser.parse_args()
+    analyze_traffic_coverage(args.input, args.target_coverage)
\ No newline at end of file
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# HMM / Viterbi 地图匹配 (Newson & Krumm, 2009)
+# - 候选：每个点半径 radius 内的所有路段（无候选时退回最近路段）
+# - 发射概率：按点到路段距离的高斯分布
+# - 转移概率：路网距离与相邻两点直线距离之差的指数分布（路网距离来自 road_distance 缓存表）
+# Viterbi 按“轨迹内第 k 步”推进，每一步对所有车辆同时向量化计算
+# ==========================================
+DEFAULT_PARAMS = {
+    'radius': 30.0,       # 候选搜索半径 (m)
+    'sigma': 5.0,         # GPS 误差标准差 (m)，pNEUMA 无人机数据精度较高
+    'beta': 5.0,          # 转移概率尺度 (m)
+    'max_route': 500.0,   # 两点之间允许的最大路网距离 (m)
+}
+
+def _candidate_table(index, lon, lat, radius):
+    """每个点的候选边；没有候选的点补上最近路段，保证每个点至少一个候选"""
+    pt, edge, dist, along = index.candidates(lon, lat, radius)
+    missing = np.setdiff1d(np.arange(len(lon)), pt)
+    if len(missing):
+        _, _, _, d_m, e_m = index.nearest(lon[missing], lat[missing])
+        # 沿边位置未知时取边的中点
+        pt = np.concatenate([pt, missing])
+        edge = np.concatenate([edge, e_m])
+        dist = np.concatenate([dist, d_m])
+        along = np.concatenate([along, np.asarray(index.edge_length)[e_m] / 2])
+        order = np.argsort(pt, kind='stable')
+        pt, edge, dist, along = pt[order], edge[order], dist[order], along[order]
+    return pt, edge, dist, along
+
+def _group_max(group, values):
+    """group 已排好序且连续：返回 (组编号, 组内最大值, 最大值所在位置)"""
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    maxs = np.maximum.reduceat(values, starts)
+    sizes = np.diff(np.r_[starts, len(group)])
+    hit = np.flatnonzero(values == np.repeat(maxs, sizes))
+    hit_group = np.searchsorted(starts, hit, side='right') - 1
+    first = np.r_[True, hit_group[1:] != hit_group[:-1]]
+    return group[starts], maxs, hit[first]
+
+def viterbi_match(index, node_dist, track_id, lon, lat, params=None):
+    """
+    输入已按 (track_id, timestamp) 排序的点，返回每个点匹配到的边下标 (index 中的边编号)
+    node_dist: road_distance.RoadDistanceTable，其 max_dist 应不小于 params['max_route']
+    """
+    p = dict(DEFAULT_PARAMS, **(params or {}))
+    n = len(lon)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    track_id = np.asarray(track_id)
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    x, y = index.project(lon, lat)
+    edge_u = np.asarray(index.edge_u)
+    edge_v = np.asarray(index.edge_v)
+    edge_len = np.asarray(index.edge_length)
+
+    # 1. 候选与发射得分 (log)
+    cpt, cedge, cdist, calong = _candidate_table(index, lon, lat, p['radius'])
+    emit = -0.5 * (cdist / p['sigma']) ** 2
+    ccount = np.bincount(cpt, minlength=n)
+    cstart = np.concatenate([[0], np.cumsum(ccount)[:-1]])
+
+    # 2. 相邻点 (同一车辆) 的候选两两配对，按目标候选连续排列
+    new_track = np.r_[True, track_id[1:] != track_id[:-1]]
+    step = np.arange(n) - np.maximum.accumulate(np.where(new_track, np.arange(n), 0))
+    src_pt = np.flatnonzero(~new_track) - 1
+    k_src = ccount[src_pt]
+    k_dst = ccount[src_pt + 1]
+    sizes = k_src * k_dst
+    pair_pt = np.repeat(src_pt, sizes)
+    local = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    ci = cstart[pair_pt] + local % np.repeat(k_src, sizes)
+    cj = cstart[pair_pt + 1] + local // np.repeat(k_src, sizes)
+
+    # 3. 转移得分：|路网距离 - 直线距离| / beta
+    e1, e2 = cedge[ci], cedge[cj]
+    same = e1 == e2
+    route = np.where(same, np.abs(calong[cj] - calong[ci]), np.inf)
+    diff = ~same
+    route[diff] = (edge_len[e1[diff]] - calong[ci[diff]]
+                   + node_dist.lookup(edge_v[e1[diff]], edge_u[e2[diff]])
+                   + calong[cj[diff]])
+    gc = np.hypot(x[pair_pt + 1] - x[pair_pt], y[pair_pt + 1] - y[pair_pt])
+    trans = np.where(route <= p['max_route'], -np.abs(route - gc) / p['beta'], -np.inf)
+
+    # 4. Viterbi：第 k 步同时处理所有车辆的第 k 个点
+    cand_step = step[cpt]
+    score = np.where(cand_step == 0, emit, -np.inf)
+    back = np.full(len(cpt), -1, dtype=np.int64)
+    pair_step = step[pair_pt + 1]
+    pair_order = np.argsort(pair_step, kind='stable')
+    pair_bounds = np.searchsorted(pair_step[pair_order], np.arange(1, step.max() + 2))
+    cand_order = np.argsort(cand_step, kind='stable')
+    cand_bounds = np.searchsorted(cand_step[cand_order], np.arange(1, step.max() + 2))
+    for k in range(1, step.max() + 1):
+        sel = pair_order[pair_bounds[k - 1]:pair_bounds[k]]
+        if len(sel):
+            val = score[ci[sel]] + trans[sel]
+            dst, best, pos = _group_max(cj[sel], val)
+            ok = np.isfinite(best)
+            score[dst[ok]] = best[ok] + emit[dst[ok]]
+            back[dst[ok]] = ci[sel][pos[ok]]
+        # 所有转移都不可行的点视为断点，从该点重新开始
+        cands = cand_order[cand_bounds[k - 1]:cand_bounds[k]]
+        reached = np.unique(cpt[cands][back[cands] >= 0])
+        restart = cands[~np.isin(cpt[cands], reached)]
+        score[restart] = emit[restart]
+
+    # 5. 回溯：每段链路的末端（轨迹末尾或下一个点是断点）取得分最高的候选
+    has_back = np.zeros(n, dtype=bool)
+    has_back[cpt[back >= 0]] = True
+    chain_start = new_track | ~has_back
+    seg_end_pt = np.r_[chain_start[1:], True]
+    end_mask = seg_end_pt[cpt]
+    _, _, pos = _group_max(cpt[end_mask], score[end_mask])
+    cur = np.flatnonzero(end_mask)[pos]
+
+    matched = np.full(n, -1, dtype=np.int64)
+    while len(cur):
+        matched[cpt[cur]] = cedge[cur]
+        cur = back[cur]
+        cur = cur[cur >= 0]
+    return matched
+
+def match_dataframe(index, node_dist, df, params=None):
+    """对一个轨迹 DataFrame 做 HMM 匹配，返回按原行顺序排列的边下标"""
+    order = np.lexsort((df['timestamp'].values, df['track_id'].values))
+    matched_sorted = viterbi_match(index, node_dist,
+                                   df['track_id'].values[order],
+                                   df['lon'].values[order],
+                                   df['lat'].values[order], params)
+    matched = np.empty(len(df), dtype=np.int64)
+    matched[order] = matched_sorted
+    return matched
+
+# ==========================================
+# 进程池：按 track_id 把一个文件拆成若干组并行匹配
+# ==========================================
+_worker_state = {}
+
+def _init_worker(graph_file, max_route):
+    from edge_index import load_edge_index
+    from road_distance import load_distance_table
+    _worker_state['index'] = load_edge_index(graph_file)
+    _worker_state['node_dist'] = load_distance_table(graph_file, max_route)
+
+def _match_task(df_part, params):
+    return match_dataframe(_worker_state['index'], _worker_state['node_dist'], df_part, params)
+
+def match_dataframe_parallel(df, graph_file, workers=4, params=None):
+    """按车辆切分后在进程池中匹配，返回按原行顺序排列的边下标"""
+    from concurrent.futures import ProcessPoolExecutor
+
+    p = dict(DEFAULT_PARAMS, **(params or {}))
+    # 先在主进程中确保缓存已构建，避免多个子进程同时构建
+    from edge_index import load_edge_index
+    from road_distance import load_distance_table
+    load_edge_index(graph_file)
+    load_distance_table(graph_file, p['max_route'])
+
+    track_ids = df['track_id'].unique()
+    groups = np.array_split(track_ids, max(workers * 4, 1))
+    parts = [np.flatnonzero(df['track_id'].isin(g).values) for g in groups if len(g)]
+    matched = np.empty(len(df), dtype=np.int64)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(graph_file, p['max_route'])) as pool:
+        futures = [(rows, pool.submit(_match_task, df.iloc[rows][['track_id', 'timestamp', 'lon', 'lat']], p))
+                   for rows in parts]
+        for rows, fut in futures:
+            matched[rows] = fut.result()
+    return matched
@@ -0,0 +1,77 @@
+import torch
+import numpy as np
+import scipy.sparse as sp
+import os
+import random
+import hashlib
+
+# ==========================================
+# 模型检查点：模型 / 优化器 / epoch / 随机数状态 / 归一化统计量 / 训练所用的路径标签与邻接矩阵哈希
+# 先写临时文件再替换，训练中断时不会留下写了一半的检查点
+# ==========================================
+CHECKPOINT_VERSION = 1
+
+def adj_hash(adj):
+    """邻接矩阵内容哈希（按 float32 CSR 计算，稠密 / 稀疏输入结果一致）"""
+    m = sp.csr_matrix(adj, dtype=np.float32)
+    m.sum_duplicates()
+    m.sort_indices()
+    h = hashlib.sha1()
+    h.update(np.asarray(m.shape, dtype=np.int64).tobytes())
+    for arr in (m.indptr.astype(np.int64), m.indices.astype(np.int64), m.data):
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+def labels_hash(path_labels):
+    h = hashlib.sha1()
+    for p in path_labels:
+        h.update(("|".join(map(str, p)) + "\n").encode())
+    return h.hexdigest()
+
+def rng_state():
+    return {'torch': torch.get_rng_state(), 'numpy': np.random.get_state(), 'python': random.getstate(),
+            'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None}
+
+def set_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['python'])
+    if state.get('cuda') is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+def save_checkpoint(path, model, optimizer, epoch, model_config, path_labels, adj, norm_stats=None, train_state=None):
+    """
+    model_config: 重建模型所需的参数（模型名、窗口、预测步数、特征数等）
+    train_state: 早停状态、训练历史等，用于断点续训
+    """
+    ckpt = {
+        'version': CHECKPOINT_VERSION,
+        'epoch': epoch,
+        'model_state': model.state_dict(),
+        'optimizer_state': optimizer.state_dict() if optimizer is not None else None,
+        'model_config': model_config,
+        'norm_stats': norm_stats,
+        'path_labels': [list(p) for p in path_labels],
+        'labels_sha1': labels_hash(path_labels),
+        'adj_sha1': adj_hash(adj),
+        'rng_state': rng_state(),
+        'train_state': train_state or {},
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    torch.save(ckpt, tmp)
+    os.replace(tmp, path)
+    return path
+
+def load_checkpoint(path, map_location='cpu'):
+    ckpt = torch.load(path, map_location=map_location, weights_only=False)
+    if ckpt.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"检查点版本不一致: {path}")
+    return ckpt
+
+def check_compatible(ckpt, path_labels, adj):
+    """检查点必须与当前数据的路径标签、邻接矩阵一致，否则节点含义已变，不能续训 / 推理"""
+    if ckpt['labels_sha1'] != labels_hash(path_labels):
+        raise ValueError("检查点的 path_labels 与当前数据不一致（路径节点集合或顺序已变化）")
+    if ckpt['adj_sha1'] != adj_hash(adj):
+        raise ValueError("检查点的邻接矩阵与当前数据不一致")
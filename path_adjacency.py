@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# ==========================================
+# 路径邻接矩阵：基于稀疏的 路径 x 路段 关联矩阵 B 计算 A = B · Bᵀ
+# 支持的权重：
+#   'binary'  : 有共同路段即为 1（与旧版集合求交一致）
+#   'jaccard' : 共同路段数 / 路段并集大小
+#   'length'  : 共同路段总长度 / 较短路径的长度（需要 edge_lengths）
+# connect_end_start: 路径 i 的终点节点 = 路径 j 的起点节点时，额外连边（对称）
+# 路段为 int32 编码（edge_index 路段字典）时，长度 / 端点按编码直接索引数组；旧版 'u_v' 字符串同样支持
+# ==========================================
+WEIGHTINGS = ('binary', 'jaccard', 'length')
+
+def _edge_nodes(edge_ids):
+    """'u_v' 形式的路段 ID -> (u, v) 两个字符串数组"""
+    parts = pd.Series(edge_ids, dtype=object).str.split('_', n=1, expand=True)
+    return parts[0].to_numpy(), parts[1].to_numpy()
+
+def incidence_matrix(paths):
+    """返回 (B, 路段 ID 数组)：B[i, e] = 1 表示路径 i 经过路段 e（重复经过只记一次）"""
+    lengths = np.fromiter((len(p) for p in paths), dtype=np.int64, count=len(paths))
+    flat = np.asarray([e for p in paths for e in p])
+    if flat.dtype.kind in 'iu':
+        codes, edge_ids = pd.factorize(flat)
+    else:
+        codes, edge_ids = pd.factorize(pd.Series(flat, dtype=object))
+        edge_ids = np.asarray(edge_ids, dtype=object)
+    rows = np.repeat(np.arange(len(paths)), lengths)
+    B = sp.csr_matrix((np.ones(len(codes), dtype=np.float32), (rows, codes)),
+                      shape=(len(paths), len(edge_ids)))
+    B.sum_duplicates()
+    B.data[:] = 1.0
+    return B, edge_ids
+
+def edge_lengths_from_index(index):
+    """由 edge_index.EdgeIndex 生成按路段编码索引的长度数组 (m)"""
+    return np.asarray(index.edge_length, dtype=np.float64)
+
+def edge_nodes_from_index(index):
+    """由 edge_index.EdgeIndex 生成按路段编码索引的 (起点, 终点) 数组"""
+    return np.asarray(index.edge_u), np.asarray(index.edge_v)
+
+def build_path_adjacency(paths, weighting='binary', connect_end_start=False, edge_lengths=None,
+                         connect_weight=1.0, edge_nodes=None):
+    """
+    paths: 路径列表，每条路径为路段 ID 序列（int32 编码或 'u_v' 字符串）
+    edge_lengths: 按编码索引的长度数组，或 {'u_v': 长度} 字典
+    edge_nodes: 按编码索引的 (起点, 终点) 数组，connect_end_start 且路段为编码时需要
+    返回 scipy.sparse.csr_matrix (N, N)，float32
+    """
+    if weighting not in WEIGHTINGS:
+        raise ValueError(f"未知的邻接权重: {weighting}，可选 {WEIGHTINGS}")
+    n = len(paths)
+    if n == 0:
+        return sp.csr_matrix((0, 0), dtype=np.float32)
+    B, edge_ids = incidence_matrix(paths)
+
+    if weighting == 'length':
+        if edge_lengths is None:
+            raise ValueError("weighting='length' 需要提供 edge_lengths")
+        if isinstance(edge_lengths, dict):
+            w = pd.Series(edge_ids).map(edge_lengths).fillna(0.0).to_numpy(dtype=np.float32)
+        else:
+            w = np.asarray(edge_lengths, dtype=np.float32)[edge_ids.astype(np.int64)]
+        Bw = B @ sp.diags(w)
+        shared = (Bw @ B.T).tocoo()
+        path_len = np.asarray(Bw.sum(axis=1)).ravel()
+        denom = np.minimum(path_len[shared.row], path_len[shared.col])
+        vals = np.where(denom > 0, np.minimum(shared.data / np.where(denom > 0, denom, 1), 1.0), 0.0)
+        A = sp.csr_matrix((vals.astype(np.float32), (shared.row, shared.col)), shape=(n, n))
+    else:
+        inter = (B @ B.T).tocoo()
+        if weighting == 'binary':
+            vals = np.ones(len(inter.data), dtype=np.float32)
+        else:
+            size = np.asarray(B.sum(axis=1)).ravel()
+            vals = (inter.data / (size[inter.row] + size[inter.col] - inter.data)).astype(np.float32)
+        A = sp.csr_matrix((vals, (inter.row, inter.col)), shape=(n, n))
+
+    if connect_end_start:
+        first = [p[0] for p in paths]
+        last = [p[-1] for p in paths]
+        if edge_nodes is not None:
+            start_node = np.asarray(edge_nodes[0])[np.asarray(first, dtype=np.int64)]
+            end_node = np.asarray(edge_nodes[1])[np.asarray(last, dtype=np.int64)]
+        else:
+            _, end_node = _edge_nodes(last)
+            start_node, _ = _edge_nodes(first)
+        ends = pd.DataFrame({'i': np.arange(n), 'node': end_node})
+        starts = pd.DataFrame({'j': np.arange(n), 'node': start_node})
+        links = ends.merge(starts, on='node')
+        links = links[links['i'] != links['j']]
+        rows = np.concatenate([links['i'].to_numpy(), links['j'].to_numpy()])
+        cols = np.concatenate([links['j'].to_numpy(), links['i'].to_numpy()])
+        L = sp.csr_matrix((np.full(len(rows), connect_weight, dtype=np.float32), (rows, cols)), shape=(n, n))
+        L.sum_duplicates()
+        L.data[:] = connect_weight
+        A = A.maximum(L)
+
+    A = A.tocsr()
+    A.sort_indices()
+    return A
@@ -0,0 +1,126 @@
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import os
+import glob
+
+# ==========================================
+# 路径频次统计：每个 *_paths.parquet 生成一份精确计数 (*_pathcounts.parquet，与源文件同目录)
+# 全局统计时逐文件合并，不再 concat 全部路径；可选 capacity 限制常驻内存的路径数
+# 路径键：int32 路段编码序列的原始字节（小端），直接由 list<int32> 列的缓冲区生成；
+# 旧版 'u_v' 字符串路径仍使用 "e1|e2|e3" 字符串键
+# ==========================================
+PATH_KEY_SEP = "|"
+PATH_KEY_DTYPE = np.dtype('<i4')
+COUNTS_SUFFIX = "_pathcounts.parquet"
+
+def path_key(edges):
+    """路段编码序列 -> 路径键 (bytes)"""
+    return np.asarray(edges, dtype=PATH_KEY_DTYPE).tobytes()
+
+def _list_to_binary(paths):
+    """list<int32> 数组 -> 每条路径一个 binary 值，值为该路径编码的连续字节"""
+    offsets = paths.offsets.to_numpy()
+    values = paths.values.to_numpy().astype(PATH_KEY_DTYPE, copy=False)
+    byte_offsets = ((offsets - offsets[0]) * PATH_KEY_DTYPE.itemsize).astype(np.int32)
+    data = values[offsets[0]:offsets[-1]]
+    return pa.Array.from_buffers(pa.binary(), len(paths), [None, pa.py_buffer(byte_offsets), pa.py_buffer(data)])
+
+def read_path_keys(file_path):
+    """读取路径文件，返回 (每条路径的键 Series, 开始时间 datetime64 数组)"""
+    table = pq.read_table(file_path, columns=['edge_id', 'timestamp'])
+    paths = table['edge_id'].combine_chunks()
+    if pa.types.is_integer(paths.type.value_type):
+        keys = _list_to_binary(paths).to_pandas()
+    else:
+        keys = pc.binary_join(paths, PATH_KEY_SEP).to_pandas()
+    timestamps = table['timestamp'].to_numpy()
+    return keys, timestamps
+
+def key_to_path(key):
+    """路径键 -> 路段元组：bytes -> (int, int, ...)，'e1|e2|e3' -> ('e1', 'e2', 'e3')"""
+    if isinstance(key, bytes):
+        return tuple(np.frombuffer(key, dtype=PATH_KEY_DTYPE).tolist())
+    return tuple(key.split(PATH_KEY_SEP))
+
+def path_label(path):
+    """路径的可读字符串（打印 / 列名用），如 '12|57|301'"""
+    return PATH_KEY_SEP.join(map(str, path))
+
+def counts_path(path_file):
+    """路径文件 -> 计数缓存路径：x_paths.parquet -> x_pathcounts.parquet，其他文件名 -> <去扩展名>_pathcounts.parquet"""
+    base = os.path.splitext(path_file)[0]
+    if base.endswith("_paths"):
+        base = base[:-len("_paths")]
+    cache = base + COUNTS_SUFFIX
+    if os.path.abspath(cache) == os.path.abspath(path_file):
+        raise ValueError(f"计数缓存路径与路径文件相同，拒绝覆盖: {path_file}")
+    return cache
+
+def _source_stamp(path_file):
+    st = os.stat(path_file)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def file_path_counts(path_file):
+    """
+    返回单个路径文件的精确计数 Series (路径键 -> 次数，按首次出现顺序)
+    结果缓存在同目录的 *_pathcounts.parquet，源文件大小 / 修改时间变化后自动重算
+    """
+    cache = counts_path(path_file)
+    stamp = _source_stamp(path_file)
+    if os.path.exists(cache):
+        table = pq.read_table(cache)
+        meta = table.schema.metadata or {}
+        if meta.get(b'source_stamp', b'').decode() == stamp:
+            return pd.Series(table['count'].to_numpy(), index=table['path_key'].to_pandas().values, name='count')
+
+    keys, _ = read_path_keys(path_file)
+    counts = keys.value_counts(sort=False)
+    key_type = pa.binary() if len(counts) and isinstance(counts.index[0], bytes) else pa.string()
+    table = pa.table({'path_key': pa.array(counts.index.values, type=key_type),
+                      'count': pa.array(counts.values, type=pa.int64())})
+    table = table.replace_schema_metadata({'source_stamp': stamp})
+    tmp = cache + '.tmp'
+    pq.write_table(table, tmp)
+    os.replace(tmp, cache)
+    return pd.Series(counts.values, index=counts.index.values, name='count')
+
+def merge_path_counts(count_series, capacity=None):
+    """
+    逐个合并计数，返回 (合并后的计数 Series 按次数降序, 总行程数, 误差上界)
+    capacity: 合并过程中最多保留的路径数；被裁掉的路径使结果存在误差，
+              任一路径的真实次数 <= 返回次数 + 误差上界（不限制时误差为 0）
+    """
+    merged = pd.Series(dtype=np.int64, name='count')
+    total = 0
+    error = 0
+    for counts in count_series:
+        total += int(counts.sum())
+        # groupby(sort=False) 保留首次出现顺序，次数相同的路径排序与一次性 value_counts 一致
+        merged = pd.concat([merged, counts]).groupby(level=0, sort=False).sum()
+        if capacity is not None and len(merged) > capacity:
+            merged = merged.sort_values(ascending=False, kind='stable')
+            error += int(merged.iloc[capacity])
+            merged = merged.iloc[:capacity]
+    merged = merged.sort_values(ascending=False, kind='stable').astype(np.int64)
+    return merged, total, error
+
+def load_global_counts(input_dir="path_data", path_files=None, capacity=None):
+    """读取（必要时生成）每个文件的计数并合并，返回 (计数 Series, 总行程数, 误差上界)"""
+    if path_files is None:
+        path_files = glob.glob(os.path.join(input_dir, "*_paths.parquet"))
+    return merge_path_counts((file_path_counts(f) for f in sorted(path_files)), capacity)
+
+def select_top_k(counts, total, k=None, coverage=None):
+    """
+    从降序计数中选出 Top-K 路径键
+    coverage: 目标覆盖率 (如 0.9)，取累计覆盖率首次达到该值的最小 K；与 k 同时给出时以 coverage 为准
+    """
+    if coverage is not None:
+        cum = counts.cumsum().to_numpy() / max(total, 1)
+        k = int(np.searchsorted(cum, coverage - 1e-12) + 1)
+    if k is None:
+        k = len(counts)
+    return counts.index[:k]
@@ -0,0 +1,73 @@
+import torch
+import numpy as np
+import scipy.sparse as sp
+import argparse
+
+from model_checkpoint import load_checkpoint, check_compatible
+from step6_stgcn_trainer import build_model, NormalizedModel
+
+# ==========================================
+# 路径流量预测器：从 step6 检查点加载一次模型（标准化邻接矩阵以 buffer 常驻设备），
+# 输入最近 window_size 个时间步的路径数据，输出未来 horizon 步的逐路径预测
+# ==========================================
+class FlowPredictor:
+    def __init__(self, model, model_config, path_labels, device='cpu'):
+        self.model = model.to(device).eval()
+        self.device = torch.device(device)
+        self.config = model_config
+        self.path_labels = [tuple(p) for p in path_labels]
+        self.window_size = model_config['window_size']
+        self.horizon = model_config['horizon']
+        self.num_nodes = model_config['num_nodes']
+        self.num_features = model_config['in_channels']
+
+    @classmethod
+    def from_checkpoint(cls, path, device='cpu', data=None):
+        """data: 可选的 load_st_data 结果，给出时校验检查点与当前路径标签 / 邻接矩阵一致"""
+        ckpt = load_checkpoint(path, map_location=device)
+        cfg = ckpt['model_config']
+        if data is not None:
+            check_compatible(ckpt, data['path_labels'], data['adj'])
+        # 标准化邻接矩阵等 buffer 随 state_dict 一起恢复（assign=True 直接替换），这里只用单位阵占位构建结构
+        net = build_model(cfg['model_name'], sp.identity(cfg['num_nodes'], format='csr'), cfg['num_nodes'],
+                          cfg['in_channels'], cfg['window_size'], cfg['horizon'], **cfg['model_kwargs'])
+        model = NormalizedModel(net, [0.0] * cfg['in_channels'], [1.0] * cfg['in_channels'])
+        model.load_state_dict(ckpt['model_state'], assign=True)
+        return cls(model, cfg, ckpt['path_labels'], device)
+
+    def to_batch(self, windows):
+        """接受 (T, N) / (T, N, F) / (B, T, N, F)，返回 float32 (B, T, N, F)"""
+        x = torch.as_tensor(np.asarray(windows, dtype=np.float32))
+        if x.dim() == 2:
+            x = x.unsqueeze(-1)
+        if x.dim() == 3:
+            x = x.unsqueeze(0)
+        expected = (self.window_size, self.num_nodes, self.num_features)
+        if x.dim() != 4 or tuple(x.shape[1:]) != expected:
+            raise ValueError(f"输入形状应为 (T, N[, F]) = {expected}，实际为 {tuple(x.shape)}")
+        return x
+
+    def predict(self, windows):
+        """返回 (B, horizon, N) 的 numpy 预测值（单个窗口输入时 B = 1）"""
+        x = self.to_batch(windows).to(self.device)
+        with torch.inference_mode():
+            out = self.model(x)
+        return out.reshape(x.shape[0], self.horizon, self.num_nodes).cpu().numpy()
+
+if __name__ == "__main__":
+    from st_store import load_st_data
+    parser = argparse.ArgumentParser(description="用最新的时间窗口预测路径流量")
+    parser.add_argument('--checkpoint', default="checkpoints/best.pt")
+    parser.add_argument('--data', default="model_inputs/st_batch_data", help="step5 张量存储目录或旧版 .pt")
+    parser.add_argument('--top', type=int, default=10, help="打印预测流量最大的前 N 条路径")
+    args = parser.parse_args()
+
+    data = load_st_data(args.data)
+    predictor = FlowPredictor.from_checkpoint(args.checkpoint, data=data)
+    x_last = data['x_list'][-1]
+    pred = predictor.predict(x_last[-predictor.window_size:])[0]  # (horizon, N)
+    print(f"📈 使用最后一个片段的最近 {predictor.window_size} 步预测未来 {predictor.horizon} 步")
+    order = np.argsort(-pred[0])[:args.top]
+    for i in order:
+        steps = " ".join(f"{v:6.2f}" for v in pred[:, i])
+        print(f"P{i:<4} | {steps} | {' -> '.join(map(str, predictor.path_labels[i][:3]))}")
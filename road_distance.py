@@ -0,0 +1,137 @@
+import numpy as np
+import os
+import json
+import time
+import shutil
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from edge_index import load_edge_index, graph_file_hash
+
+# ==========================================
+# 有界全节点对最短路表：只保存路网距离 <= max_dist 的节点对
+# 以 CSR 稀疏矩阵 (indptr / indices / data .npy) 存在 cache/road_distance/<graph sha1>_<max_dist>/（如 _500.0）
+# 供匹配转移代价、step4 路径补全、step5 路径邻接等共用，路网文件变化后自动失效
+# ==========================================
+TABLE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join("cache", "road_distance")
+
+class RoadDistanceTable:
+    """节点间路网距离查询（单位：米），超出 max_dist 的节点对视为不可达 (inf)"""
+
+    def __init__(self, table_dir, mmap=True):
+        with open(os.path.join(table_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        mode = 'r' if mmap else None
+        load = lambda name: np.asarray(np.load(os.path.join(table_dir, f"{name}.npy"), mmap_mode=mode))
+        self.nodes = load('nodes')
+        self.indptr = load('indptr')
+        self.indices = load('indices')
+        self.data = load('data')
+        self.max_dist = self.meta['max_dist']
+
+    @property
+    def matrix(self):
+        """以 scipy.sparse.csr_matrix 形式返回（按节点下标，对角线隐含为 0）"""
+        n = len(self.nodes)
+        return csr_matrix((self.data, self.indices, self.indptr), shape=(n, n))
+
+    def node_positions(self, osm_ids):
+        """OSM 节点 ID -> 表内下标，不在路网中的节点返回 -1"""
+        osm_ids = np.asarray(osm_ids)
+        pos = np.clip(np.searchsorted(self.nodes, osm_ids), 0, len(self.nodes) - 1)
+        return np.where(self.nodes[pos] == osm_ids, pos, -1)
+
+    def lookup(self, src_nodes, dst_nodes):
+        """批量查询 OSM 节点对之间的路网距离，超出范围或节点不存在返回 inf"""
+        a = self.node_positions(src_nodes)
+        b = self.node_positions(dst_nodes)
+        dist = np.full(len(a), np.inf)
+        valid = (a >= 0) & (b >= 0)
+        pos, hit = self._find(np.where(valid, a, 0), b)
+        hit &= valid
+        dist[hit] = self.data[pos[hit]]
+        dist[valid & (a == b)] = 0.0
+        return dist
+
+    def _find(self, rows, cols):
+        """
+        在各行 indices[indptr[r]:indptr[r+1]]（行内列号有序）中逐元素向量化二分查找 cols
+        只读 mmap 的 indptr / indices，不在内存中生成全表大小的辅助数组，返回 (位置, 是否命中)
+        """
+        lo = self.indptr[rows].astype(np.int64)
+        hi = self.indptr[rows + 1].astype(np.int64)
+        end = hi.copy()
+        while True:
+            active = lo < hi
+            if not active.any():
+                break
+            mid = (lo + hi) // 2
+            go_right = active & (self.indices[np.minimum(mid, len(self.indices) - 1)] < cols)
+            lo = np.where(go_right, mid + 1, lo)
+            hi = np.where(active & ~go_right, mid, hi)
+        found = lo < end
+        hit = found.copy()
+        hit[found] = self.indices[lo[found]] == cols[found]
+        return lo, hit
+
+    def edge_gap(self, index, e1, e2):
+        """边 e1 的终点到边 e2 的起点的路网距离（边下标为 edge_index 中的编号）"""
+        return self.lookup(np.asarray(index.edge_v)[e1], np.asarray(index.edge_u)[e2])
+
+def build_distance_table(edge_u, edge_v, edge_length, max_dist, out_dir, source_block=512):
+    """按源节点分块运行有界 Dijkstra，结果写成 CSR（先写临时目录再重命名）"""
+    nodes = np.unique(np.concatenate([edge_u, edge_v]))
+    n = len(nodes)
+    a = np.searchsorted(nodes, edge_u)
+    b = np.searchsorted(nodes, edge_v)
+    # 多重边取最短的一条
+    order = np.lexsort((edge_length, b, a))
+    a, b, w = a[order], b[order], np.asarray(edge_length, dtype=np.float64)[order]
+    first = np.r_[True, (a[1:] != a[:-1]) | (b[1:] != b[:-1])]
+    graph = csr_matrix((w[first], (a[first], b[first])), shape=(n, n))
+
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indices, data = [], []
+    for s0 in range(0, n, source_block):
+        src = np.arange(s0, min(s0 + source_block, n))
+        d = dijkstra(graph, directed=True, indices=src, limit=max_dist)
+        d[np.arange(len(src)), src] = np.inf  # 对角线不存，查询时按 0 处理
+        r, c = np.nonzero(np.isfinite(d))
+        indptr[src + 1] = np.bincount(r, minlength=len(src))
+        indices.append(c.astype(np.int32))
+        data.append(d[r, c].astype(np.float32))
+    indptr = np.cumsum(indptr)
+
+    tmp_dir = out_dir + '.tmp'
+    os.makedirs(tmp_dir, exist_ok=True)
+    arrays = {'nodes': nodes, 'indptr': indptr,
+              'indices': np.concatenate(indices), 'data': np.concatenate(data)}
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), arr)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': TABLE_VERSION, 'max_dist': max_dist,
+                   'num_nodes': int(n), 'nnz': int(indptr[-1])}, f, indent=2)
+    os.replace(tmp_dir, out_dir)
+
+def load_distance_table(graph_file="athens_road_network.graphml", max_dist=500.0, cache_dir=DEFAULT_CACHE_DIR):
+    """按 (路网文件哈希, max_dist 精确值) 加载距离表，不存在或 meta 中的版本 / max_dist 不符时重新构建"""
+    max_dist = float(max_dist)
+    key = f"{graph_file_hash(graph_file)}_{max_dist!r}"
+    table_dir = os.path.join(cache_dir, key)
+    meta_path = os.path.join(table_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') == TABLE_VERSION and meta.get('max_dist') == max_dist:
+            return RoadDistanceTable(table_dir)
+        shutil.rmtree(table_dir)
+
+    print(f"🧭 正在构建路网距离表 (max_dist={max_dist}m): {graph_file}")
+    start = time.time()
+    index = load_edge_index(graph_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    build_distance_table(index.edge_u, index.edge_v, index.edge_length, max_dist, table_dir)
+    table = RoadDistanceTable(table_dir)
+    print(f"✅ 距离表已保存至 {table_dir} ({table.meta['nnz']} 个节点对)，耗时 {time.time() - start:.2f}s")
+    return table
@@ -0,0 +1,272 @@
+import os
+import glob
+import json
+import time
+import hashlib
+import argparse
+
+import run_profile
+from step1_parse_pneuma import run_batch_parser, parsed_output_path, parsed_info_path
+from step3_map_matching import map_matching, matched_output_path, MATCHED_SCHEMA_VERSION
+from step4_extract_path import extract_path_sequences, path_output_path, PATH_SCHEMA_VERSION
+from step5_build_st_features_batch import build_st_features_batch, FEATURES, TIME_AXES
+from traj_dataset import partition_files, partition_path, partitionable, DEFAULT_ROW_GROUP
+
+# ==========================================
+# 增量流水线：step1 -> step3 -> step4 -> step5
+# 每个阶段在 manifest 中记录 输入哈希 / 参数 / 输出，重跑时只重算发生变化的文件及其下游
+# hive_dir 给出时（默认关闭），step1 / step3 的结果另外写入 date/drone/slot 分区数据集（traj_dataset），供按车辆 / 时间段查询
+# ==========================================
+MANIFEST_VERSION = 1
+
+DEFAULT_CONFIG = {
+    'dataset_dir': 'dataset',
+    'processed_dir': 'processed_data',
+    'matched_dir': 'matched_data',
+    'path_dir': 'path_data',
+    'model_dir': 'model_inputs',
+    'graph_file': 'athens_road_network.graphml',
+    'match_method': 'nearest',
+    'sampling_rate': 25,
+    'time_step_sec': 60,
+    'num_top_paths': 50,
+    'target_coverage': None,
+    'adj_weighting': 'binary',
+    'connect_end_start': False,
+    'features': ['count'],
+    'time_axis': 'continuous',
+    'hive_dir': None,   # 分区数据集目录（如 trajectory_dataset），None 表示不生成
+    'workers': 1,
+    'manifest': 'pipeline_manifest.json',
+    'report': None,     # 运行报告前缀 (run_profile)，None 表示不记录
+    'profile': None,    # 用 cProfile 采集的热点名，逗号分隔
+}
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+        print(f"⚠️ manifest 版本不一致，将全部重新计算: {path}")
+    return {'version': MANIFEST_VERSION, 'files': {}, 'stages': {}}
+
+def save_manifest(manifest, path):
+    """先写临时文件再替换，避免中断时留下损坏的 manifest"""
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp, path)
+
+def file_sha1(path, manifest):
+    """
+    计算文件内容哈希；(size, mtime) 未变化时直接复用 manifest 中缓存的结果，避免反复读大文件
+    目录（如 step5 的张量存储）按其中各文件的哈希组合计算
+    """
+    if os.path.isdir(path):
+        h = hashlib.sha1()
+        for name in sorted(os.listdir(path)):
+            h.update(f"{name}:{file_sha1(os.path.join(path, name), manifest)}".encode())
+        return h.hexdigest()
+    st = os.stat(path)
+    cached = manifest['files'].get(path)
+    if cached and cached['size'] == st.st_size and cached['mtime_ns'] == st.st_mtime_ns:
+        return cached['sha1']
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    manifest['files'][path] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': h.hexdigest()}
+    return h.hexdigest()
+
+def _is_fresh(record, input_hashes, params):
+    return (record is not None
+            and record['inputs'] == input_hashes
+            and record['params'] == params
+            and all(os.path.exists(p) for p in record['outputs']))
+
+def _record(manifest, stage, key, input_hashes, params, outputs):
+    manifest['stages'].setdefault(stage, {})[key] = {
+        'inputs': input_hashes,
+        'params': params,
+        'outputs': {p: file_sha1(p, manifest) for p in outputs},
+        'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+def _prune(manifest, stage, inputs):
+    """输入文件已被删除的记录移出 manifest，并删除其记录的输出（下游阶段按目录 glob，残留的输出会继续被读取）"""
+    records = manifest['stages'].setdefault(stage, {})
+    for key in [k for k in records if k != '__all__' and k not in inputs]:
+        print(f"🗑️  [{stage}] 输入已不存在，移除记录及其输出: {key}")
+        for output in records.pop(key)['outputs']:
+            if os.path.isfile(output):
+                os.remove(output)
+
+def run_per_file_stage(manifest, stage, inputs, params, outputs_of, run_fn, force=False, dry_run=False,
+                       manifest_path=None):
+    """
+    逐文件阶段的通用增量逻辑（阶段完成后立即保存 manifest，后续阶段失败不会丢失已完成的进度）
+    outputs_of: 输入路径 -> 该输入对应的输出路径列表
+    run_fn: 接收需要重算的输入列表并执行该阶段
+    重算前先删除这些输入的旧输出：run_fn 内部吞掉的失败不会留下上次的结果被当成本次的输出记录
+    """
+    _prune(manifest, stage, inputs)
+    records = manifest['stages'][stage]
+    hashes = {p: file_sha1(p, manifest) for p in inputs}
+    dirty = [p for p in inputs
+             if force or not _is_fresh(records.get(p), {p: hashes[p]}, params)]
+
+    print(f"📋 [{stage}] 共 {len(inputs)} 个输入，需要重算 {len(dirty)} 个")
+    if not dirty or dry_run:
+        return dirty
+
+    for p in dirty:
+        for o in outputs_of(p):
+            if os.path.isfile(o):
+                os.remove(o)
+    run_fn(dirty)
+    for p in dirty:
+        outputs = outputs_of(p)
+        if all(os.path.exists(o) for o in outputs):
+            _record(manifest, stage, p, {p: hashes[p]}, params, outputs)
+        else:
+            print(f"⚠️ [{stage}] {os.path.basename(p)} 未生成完整输出，下次运行将重试")
+    if manifest_path:
+        save_manifest(manifest, manifest_path)
+    return dirty
+
+def _run_partition_stage(cfg, manifest, stage, inputs, name, force, dry_run):
+    """把扁平结果文件同步到分区数据集 <hive_dir>/<name>（按文件增量；文件名无法解析分区键的跳过）"""
+    if not cfg['hive_dir']:
+        return
+    root = os.path.join(cfg['hive_dir'], name)
+    inputs, _ = partitionable(inputs)
+    run_per_file_stage(
+        manifest, stage, inputs, {'row_group_size': DEFAULT_ROW_GROUP},
+        lambda p: [partition_path(p, root)],
+        lambda files: partition_files(files, root),
+        force, dry_run, cfg['manifest'])
+
+def run_pipeline(config=None, force=False, dry_run=False):
+    cfg = dict(DEFAULT_CONFIG, **(config or {}))
+    manifest = load_manifest(cfg['manifest'])
+    total_start = time.time()
+    if cfg['report'] and not dry_run:
+        run_profile.enable(cfg['report'], cfg['profile'], meta={'config': cfg, 'force': force})
+    with run_profile.stage('pipeline'):
+        _run_stages(cfg, manifest, force, dry_run)
+
+    if not dry_run:
+        save_manifest(manifest, cfg['manifest'])
+    print(f"\n✨ 流水线完成，总耗时: {time.time() - total_start:.2f} 秒 | manifest: {cfg['manifest']}")
+    if cfg['report'] and not dry_run:
+        run_profile.write_report()
+    return manifest
+
+def _run_stages(cfg, manifest, force, dry_run):
+
+    # --- Step 1: 原始 csv -> processed_data ---
+    csv_files = sorted(glob.glob(os.path.join(cfg['dataset_dir'], "*.csv")))
+    run_per_file_stage(
+        manifest, 'step1_parse', csv_files,
+        {'sampling_rate': cfg['sampling_rate']},
+        lambda p: [parsed_output_path(p, cfg['processed_dir']),
+                   parsed_info_path(parsed_output_path(p, cfg['processed_dir']))],
+        lambda files: run_batch_parser(cfg['dataset_dir'], cfg['processed_dir'], cfg['sampling_rate'],
+                                       workers=cfg['workers'], files=files),
+        force, dry_run, cfg['manifest'])
+
+    traj_files = sorted(p for p in glob.glob(os.path.join(cfg['processed_dir'], "*.parquet"))
+                        if "_info" not in os.path.basename(p))
+    _run_partition_stage(cfg, manifest, 'partition_processed', traj_files, 'processed', force, dry_run)
+
+    # --- Step 3: processed_data -> matched_data ---
+    graph_params = {'graph_file': cfg['graph_file'], 'match_method': cfg['match_method'],
+                    'schema': MATCHED_SCHEMA_VERSION,
+                    'graph_sha1': file_sha1(cfg['graph_file'], manifest) if os.path.exists(cfg['graph_file']) else None}
+    run_per_file_stage(
+        manifest, 'step3_match', traj_files, graph_params,
+        lambda p: [matched_output_path(p, cfg['matched_dir'])],
+        lambda files: map_matching(cfg['graph_file'], cfg['processed_dir'], cfg['matched_dir'], files=files,
+                                   method=cfg['match_method'], workers=cfg['workers']),
+        force, dry_run, cfg['manifest'])
+
+    # --- Step 4: matched_data -> path_data ---
+    matched_files = sorted(glob.glob(os.path.join(cfg['matched_dir'], "*_matched.parquet")))
+    _run_partition_stage(cfg, manifest, 'partition_matched', matched_files, 'matched', force, dry_run)
+    run_per_file_stage(
+        manifest, 'step4_extract', matched_files, {'schema': PATH_SCHEMA_VERSION},
+        lambda p: [path_output_path(p, cfg['path_dir'])],
+        lambda files: extract_path_sequences(cfg['matched_dir'], cfg['path_dir'], files=files),
+        force, dry_run, cfg['manifest'])
+
+    # --- Step 5: 全部 path_data -> model_inputs（全局阶段，任一输入或参数变化即重建）---
+    path_files = sorted(glob.glob(os.path.join(cfg['path_dir'], "*_paths.parquet")))
+    step5_params = {'time_step_sec': cfg['time_step_sec'], 'num_top_paths': cfg['num_top_paths'],
+                    'target_coverage': cfg['target_coverage'], 'features': list(cfg['features']),
+                    'adj_weighting': cfg['adj_weighting'], 'connect_end_start': cfg['connect_end_start'],
+                    'time_axis': cfg['time_axis']}
+    step5_hashes = {p: file_sha1(p, manifest) for p in path_files}
+    record = manifest['stages'].setdefault('step5_build', {}).get('__all__')
+    if path_files and (force or not _is_fresh(record, step5_hashes, step5_params)):
+        print(f"📋 [step5_build] 输入或参数发生变化，重建模型输入")
+        if not dry_run:
+            output_path = build_st_features_batch(cfg['path_dir'], cfg['model_dir'],
+                                                  cfg['num_top_paths'], cfg['time_step_sec'],
+                                                  path_files=path_files,
+                                                  adj_weighting=cfg['adj_weighting'],
+                                                  connect_end_start=cfg['connect_end_start'],
+                                                  graph_file=cfg['graph_file'],
+                                                  target_coverage=cfg['target_coverage'],
+                                                  features=cfg['features'],
+                                                  time_axis=cfg['time_axis'])
+            if output_path:
+                _record(manifest, 'step5_build', '__all__', step5_hashes, step5_params, [output_path])
+    else:
+        print(f"📋 [step5_build] 无变化，跳过")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="增量运行 step1-step5，只重算输入或参数发生变化的文件")
+    parser.add_argument('--sampling-rate', type=int, default=DEFAULT_CONFIG['sampling_rate'])
+    parser.add_argument('--graph-file', default=DEFAULT_CONFIG['graph_file'])
+    parser.add_argument('--time-step-sec', type=int, default=DEFAULT_CONFIG['time_step_sec'])
+    parser.add_argument('--num-top-paths', type=int, default=DEFAULT_CONFIG['num_top_paths'])
+    parser.add_argument('--target-coverage', type=float, default=None,
+                        help="按目标覆盖率选择路径数量 (如 0.9)，给出时忽略 --num-top-paths")
+    parser.add_argument('--adj-weighting', choices=['binary', 'jaccard', 'length'],
+                        default=DEFAULT_CONFIG['adj_weighting'])
+    parser.add_argument('--connect-end-start', action='store_true', help="首尾相接的路径之间额外连边")
+    parser.add_argument('--features', nargs='+', choices=FEATURES, default=DEFAULT_CONFIG['features'],
+                        help="step5 节点特征通道，第一个为默认预测目标")
+    parser.add_argument('--time-axis', choices=TIME_AXES, default=DEFAULT_CONFIG['time_axis'],
+                        help="continuous: 所有文件共享连续时间轴；per_file: 每个文件独立 15 步片段（旧版）")
+    parser.add_argument('--match-method', choices=['nearest', 'hmm'], default=DEFAULT_CONFIG['match_method'])
+    parser.add_argument('--hive-dir', default=DEFAULT_CONFIG['hive_dir'],
+                        help="给出时把 step1 / step3 结果另外写入该目录下的 date/drone/slot 分区数据集（如 trajectory_dataset）")
+    parser.add_argument('--workers', type=int, default=DEFAULT_CONFIG['workers'], help="step1 / HMM 匹配的并行进程数")
+    parser.add_argument('--manifest', default=DEFAULT_CONFIG['manifest'])
+    parser.add_argument('--force', action='store_true', help="忽略 manifest，全部重算")
+    parser.add_argument('--dry-run', action='store_true', help="只打印需要重算的内容")
+    parser.add_argument('--report', default=None,
+                        help="写出运行报告 <prefix>.json / .parquet：各阶段 / 文件的耗时、CPU、峰值内存、行数、字节数")
+    parser.add_argument('--profile', default=None,
+                        help="用 cProfile 采集的热点，逗号分隔（如 step3.match,step4.compress；* 表示全部）")
+    args = parser.parse_args()
+
+    run_pipeline({
+        'sampling_rate': args.sampling_rate,
+        'graph_file': args.graph_file,
+        'match_method': args.match_method,
+        'time_step_sec': args.time_step_sec,
+        'num_top_paths': args.num_top_paths,
+        'target_coverage': args.target_coverage,
+        'adj_weighting': args.adj_weighting,
+        'connect_end_start': args.connect_end_start,
+        'features': args.features,
+        'time_axis': args.time_axis,
+        'hive_dir': args.hive_dir,
+        'workers': args.workers,
+        'manifest': args.manifest,
+        'report': args.report,
+        'profile': args.profile,
+    }, force=args.force, dry_run=args.dry_run)
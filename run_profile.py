@@ -0,0 +1,335 @@
+import os
+import sys
+import json
+import time
+import atexit
+import platform
+import subprocess
+import argparse
+import cProfile
+from contextlib import contextmanager, nullcontext
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ==========================================
+# 运行剖析：各步骤按 阶段 / 文件 记录 墙钟时间、CPU 时间（含已回收的子进程）、峰值 RSS、
+# 输入 / 输出行数与字节数，写出可跨运行对比的报告 (<prefix>.json + <prefix>.parquet)
+# 默认关闭：stage() / hot() 返回空上下文，几乎没有开销；以下任一方式开启：
+#   - run_pipeline.py / step6 的 --report 参数
+#   - 环境变量 PNEUMA_REPORT=<prefix>（任意脚本，退出时自动写报告）
+# 热点代码块用 hot(name) 包裹，开启后累计调用次数与耗时；
+# profile（或环境变量 PNEUMA_PROFILE="step3.match,step6.forward_backward"，"*" 表示全部；现有热点: step3.match / step4.compress / step6.forward_backward）
+# 指定的热点额外用 cProfile 采集，每个热点一个 <prefix>_<name>.prof（pstats / snakeviz 查看）。
+# 热点都是独立的函数调用，py-spy record 采样时在火焰图中同样可以按这些函数名定位
+# ==========================================
+REPORT_VERSION = 1
+_MB = 1024 ** 2
+
+def _path_bytes(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def _cpu_seconds():
+    """本进程 + 已回收子进程的 用户态 + 内核态 CPU 时间"""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def _peak_rss():
+    """当前峰值 RSS（字节）：Linux 读 VmHWM（可被 _reset_peak 清零），其他平台用 ru_maxrss"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def _reset_peak():
+    """把 VmHWM 重置为当前 RSS，使峰值按阶段统计；不支持时退化为进程级峰值"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+class Measurement:
+    """一次测量：退出 measure() 后 wall_s / cpu_s / peak_rss_mb 可用（也用于子进程内自行测量）"""
+
+    def __init__(self):
+        self.wall_s = self.cpu_s = self.peak_rss_mb = None
+        self.peak = 0
+
+@contextmanager
+def measure(parent=None, m=None):
+    """测量一个代码块；parent 为外层测量时把本块的峰值并入外层（峰值计数在块开始时被重置）"""
+    m = m if m is not None else Measurement()
+    if parent is not None:
+        parent.peak = max(parent.peak, _peak_rss())
+    _reset_peak()
+    wall0, cpu0 = time.perf_counter(), _cpu_seconds()
+    try:
+        yield m
+    finally:
+        m.wall_s = time.perf_counter() - wall0
+        m.cpu_s = _cpu_seconds() - cpu0
+        m.peak = max(m.peak, _peak_rss())
+        m.peak_rss_mb = m.peak / _MB
+        if parent is not None:
+            parent.peak = max(parent.peak, m.peak)
+
+class StageRecord(Measurement):
+    """阶段记录：阶段内可设置 rows_in / rows_out，add_input / add_output 登记文件以统计字节数"""
+
+    def __init__(self, name, item=None, parent=None):
+        super().__init__()
+        self.name, self.item, self.parent = name, item, parent
+        self.rows_in = self.rows_out = None
+        self.inputs, self.outputs = [], []
+        self.extra = {}
+
+    def add_input(self, *paths):
+        self.inputs.extend(paths)
+
+    def add_output(self, *paths):
+        self.outputs.extend(paths)
+
+    def to_dict(self):
+        return {
+            'stage': self.name, 'item': self.item, 'parent': self.parent,
+            'wall_s': self.wall_s, 'cpu_s': self.cpu_s, 'peak_rss_mb': self.peak_rss_mb,
+            'rows_in': self.rows_in, 'rows_out': self.rows_out,
+            'bytes_read': sum(_path_bytes(p) for p in self.inputs) if self.inputs else None,
+            'bytes_written': sum(_path_bytes(p) for p in self.outputs) if self.outputs else None,
+            **self.extra,
+        }
+
+class _NullStage(StageRecord):
+    """未开启剖析时 stage() 产出的占位记录，接受同样的调用但不保存"""
+
+    def __init__(self):
+        super().__init__(None)
+
+class Recorder:
+    def __init__(self, prefix=None, profile=None, meta=None):
+        self.prefix = prefix
+        self.profile = set(profile or ())
+        self.meta = dict(meta or {})
+        self.started = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.records = []
+        self.hot_stats = {}
+        self.profilers = {}
+        self._stack = []
+        self._profiling = False
+
+    def stage(self, name, item=None, inputs=(), rows_in=None):
+        parent = self._stack[-1] if self._stack else None
+        rec = StageRecord(name, item, parent.name if parent else None)
+        rec.rows_in = rows_in
+        rec.add_input(*inputs)
+        return self._run_stage(rec, parent)
+
+    @contextmanager
+    def _run_stage(self, rec, parent):
+        self._stack.append(rec)
+        try:
+            with measure(parent, rec):
+                yield rec
+        finally:
+            self._stack.pop()
+            self.records.append(rec.to_dict())
+
+    def add_record(self, name, item=None, **metrics):
+        parent = self._stack[-1].name if self._stack else None
+        self.records.append({'stage': name, 'item': item, 'parent': parent, **metrics})
+
+    @contextmanager
+    def hot(self, name):
+        prof = None
+        if not self._profiling and ('*' in self.profile or name in self.profile):
+            prof = self.profilers.get(name) or self.profilers.setdefault(name, cProfile.Profile())
+        start = time.perf_counter()
+        if prof is not None:
+            self._profiling = True
+            prof.enable()
+        try:
+            yield
+        finally:
+            if prof is not None:
+                prof.disable()
+                self._profiling = False
+            st = self.hot_stats.setdefault(name, {'calls': 0, 'total_s': 0.0, 'max_s': 0.0})
+            dt = time.perf_counter() - start
+            st['calls'] += 1
+            st['total_s'] += dt
+            st['max_s'] = max(st['max_s'], dt)
+
+    def report(self):
+        return {
+            'version': REPORT_VERSION,
+            'started': self.started,
+            'finished': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'host': {'python': platform.python_version(), 'platform': platform.platform(),
+                     'cpu_count': os.cpu_count()},
+            'git_commit': _git_commit(),
+            'argv': sys.argv,
+            'meta': self.meta,
+            'records': self.records,
+            'hot': self.hot_stats,
+        }
+
+    def write(self, prefix=None):
+        """写出 <prefix>.json（完整报告）与 <prefix>.parquet（阶段记录表），返回 json 路径"""
+        import pandas as pd
+        prefix = _strip_ext(prefix or self.prefix or f"reports/run_{time.strftime('%Y%m%d_%H%M%S')}")
+        os.makedirs(os.path.dirname(prefix) or '.', exist_ok=True)
+        report = self.report()
+        tmp = prefix + '.json.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp, prefix + '.json')
+        if self.records:
+            df = pd.DataFrame(self.records)
+            # item 可能是文件名或 epoch 编号，统一为字符串列
+            df['item'] = df['item'].map(lambda v: None if v is None else str(v))
+            df.to_parquet(prefix + '.parquet', index=False)
+        for name, prof in self.profilers.items():
+            prof.dump_stats(f"{prefix}_{name.replace('.', '_')}.prof")
+        print(f"📊 运行报告已保存: {prefix}.json ({len(self.records)} 条阶段记录)")
+        return prefix + '.json'
+
+_RECORDER = None
+
+def _strip_ext(prefix):
+    for ext in ('.json', '.parquet'):
+        if prefix.endswith(ext):
+            return prefix[:-len(ext)]
+    return prefix
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def enable(prefix=None, profile=None, meta=None):
+    """开启全局记录（重复调用时合并 profile / meta），返回 Recorder"""
+    global _RECORDER
+    if isinstance(profile, str):
+        profile = [p.strip() for p in profile.split(',') if p.strip()]
+    if _RECORDER is None:
+        _RECORDER = Recorder(prefix, profile, meta)
+    else:
+        _RECORDER.prefix = prefix or _RECORDER.prefix
+        _RECORDER.profile.update(profile or ())
+        _RECORDER.meta.update(meta or {})
+    return _RECORDER
+
+def is_enabled():
+    return _RECORDER is not None
+
+def stage(name, item=None, inputs=(), rows_in=None):
+    """阶段 / 文件级记录的上下文管理器，产出可设置 rows_out、登记输出文件的记录对象"""
+    if _RECORDER is None:
+        return nullcontext(_NullStage())
+    return _RECORDER.stage(name, item, inputs, rows_in)
+
+def current():
+    """当前所在的阶段记录（未开启或不在任何阶段内时为 None），用作 measure() 的 parent"""
+    return _RECORDER._stack[-1] if _RECORDER is not None and _RECORDER._stack else None
+
+def add_record(name, item=None, **metrics):
+    """记录在别处（如子进程内）测得的指标"""
+    if _RECORDER is not None:
+        _RECORDER.add_record(name, item, **metrics)
+
+_NULL = nullcontext()
+
+def hot(name):
+    """热点代码块：开启后累计调用次数 / 耗时，被 profile 选中时用 cProfile 采集"""
+    if _RECORDER is None:
+        return _NULL
+    return _RECORDER.hot(name)
+
+def write_report(prefix=None):
+    return _RECORDER.write(prefix) if _RECORDER is not None else None
+
+# ==========================================
+# 报告读取与对比
+# ==========================================
+def load_report(path):
+    with open(_strip_ext(path) + '.json', 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _sum(s):
+    return s.sum(min_count=1)
+
+_SUMMARY_AGG = {'wall_s': _sum, 'cpu_s': _sum, 'peak_rss_mb': 'max', 'rows_in': _sum, 'rows_out': _sum,
+                'bytes_read': _sum, 'bytes_written': _sum}
+
+def stage_summary(report):
+    """按阶段汇总：有阶段级记录 (item 为空) 时优先用它，否则累加逐文件记录"""
+    import pandas as pd
+    df = pd.DataFrame(report['records'])
+    if df.empty:
+        return df
+    for col in _SUMMARY_AGG:
+        df[col] = pd.to_numeric(df[col], errors='coerce') if col in df else float('nan')
+    per_item = df[df['item'].notna()]
+    totals = df[df['item'].isna()].groupby('stage', sort=False).agg(_SUMMARY_AGG)
+    items = per_item.groupby('stage', sort=False).agg(_SUMMARY_AGG)
+    summary = totals.combine_first(items)
+    summary['items'] = per_item.groupby('stage').size()
+    summary['items'] = summary['items'].fillna(0).astype(int)
+    return summary.reindex(list(dict.fromkeys(df['stage'])))
+
+def compare_reports(base, new):
+    """返回两次运行的按阶段对比表（new / base 比值 < 1 表示变快 / 变省）"""
+    import pandas as pd
+    a, b = stage_summary(base), stage_summary(new)
+    out = pd.DataFrame({
+        'base_wall_s': a['wall_s'], 'new_wall_s': b['wall_s'],
+        'base_cpu_s': a['cpu_s'], 'new_cpu_s': b['cpu_s'],
+        'base_peak_mb': a['peak_rss_mb'], 'new_peak_mb': b['peak_rss_mb'],
+    })
+    out['wall_ratio'] = out['new_wall_s'] / out['base_wall_s']
+    out['peak_ratio'] = out['new_peak_mb'] / out['base_peak_mb']
+    return out.reindex(list(dict.fromkeys(list(a.index) + list(b.index))))
+
+def _print_report(report):
+    import pandas as pd
+    print(f"🧾 运行 {report['started']} -> {report['finished']} | commit: {(report.get('git_commit') or '-')[:10]}")
+    with pd.option_context('display.width', 160, 'display.max_columns', 20):
+        print(stage_summary(report).round(3).to_string())
+    if report.get('hot'):
+        print("\n🔥 热点:")
+        for name, st in sorted(report['hot'].items(), key=lambda kv: -kv[1]['total_s']):
+            print(f"   {name:<28} 调用 {st['calls']:>8} 次 | 总计 {st['total_s']:>9.3f}s | 最长 {st['max_s']:.4f}s")
+
+if os.environ.get('PNEUMA_REPORT'):
+    enable(os.environ['PNEUMA_REPORT'], os.environ.get('PNEUMA_PROFILE'))
+    atexit.register(write_report)
+
+if __name__ == "__main__":
+    import pandas as pd
+    parser = argparse.ArgumentParser(description="查看 / 对比运行报告")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_show = sub.add_parser('show', help="打印一次运行的阶段汇总与热点")
+    p_show.add_argument('report')
+    p_cmp = sub.add_parser('compare', help="对比两次运行（new 相对 base）")
+    p_cmp.add_argument('base')
+    p_cmp.add_argument('new')
+    args = parser.parse_args()
+
+    if args.cmd == 'show':
+        _print_report(load_report(args.report))
+    else:
+        with pd.option_context('display.width', 160, 'display.max_columns', 20):
+            print(compare_reports(load_report(args.base), load_report(args.new)).round(3).to_string())
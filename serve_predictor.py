@@ -0,0 +1,177 @@
+import asyncio
+import json
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from predictor import FlowPredictor
+
+# ==========================================
+# 本地 HTTP 推理服务（仅依赖 asyncio 标准库）
+#   POST /predict  {"window": (T, N) 或 (T, N, F) 嵌套列表} -> {"forecast": (horizon, N)}
+#   GET  /health   模型信息与累计批处理统计
+# 并发请求先进入队列，由 MicroBatcher 合并为一次前向计算：
+# 上一批在单独的线程里推理时，事件循环继续接收请求，新请求在队列中自然积累成下一批；
+# max_wait_ms > 0 时收到第一个请求后最多再等这么久或凑满 max_batch 个
+# ==========================================
+# 请求体上限：一个 (T, N, F) 窗口的 JSON 通常只有几十 KB，超过上限的请求不读取请求体，直接回复 413
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+class MicroBatcher:
+    def __init__(self, predictor, max_batch=64, max_wait_ms=0.0):
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stats = {'requests': 0, 'batches': 0}
+
+    async def submit(self, window):
+        """window: 已校验形状的 (T, N, F) float32 数组，返回 (horizon, N)"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((window, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(items) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # 等待期间已在队列里的请求一并带上
+            while len(items) < self.max_batch and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+
+            batch = np.stack([w for w, _ in items])
+            try:
+                preds = await loop.run_in_executor(self.executor, self.predictor.predict, batch)
+            except Exception as e:
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.stats['requests'] += len(items)
+            self.stats['batches'] += 1
+            for (_, fut), pred in zip(items, preds):
+                if not fut.done():
+                    fut.set_result(pred)
+
+def _response(status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+              500: 'Internal Server Error'}[status]
+    head = (f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+class BadRequest(ValueError):
+    """请求行 / 请求头无法解析（400）或请求体超过 MAX_BODY_BYTES（413），回复 status 后关闭连接"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+async def _read_request(reader):
+    """读取一个 HTTP/1.1 请求，返回 (method, path, headers, body)，连接关闭时返回 None；格式错误时抛出 BadRequest"""
+    line = await reader.readline()
+    if not line:
+        return None
+    parts = line.decode('latin-1').split(' ', 2)
+    if len(parts) != 3:
+        raise BadRequest(f"malformed request line: {line[:80]!r}")
+    method, path, _ = parts
+    headers = {}
+    while True:
+        h = await reader.readline()
+        if h in (b'\r\n', b'\n', b''):
+            break
+        k, _, v = h.decode('latin-1').partition(':')
+        headers[k.strip().lower()] = v.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise BadRequest(f"invalid Content-Length: {headers['content-length']!r}") from None
+    if length < 0:
+        raise BadRequest(f"invalid Content-Length: {length}")
+    if length > MAX_BODY_BYTES:
+        raise BadRequest(f"request body of {length} bytes exceeds the {MAX_BODY_BYTES}-byte limit", status=413)
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+def make_handler(predictor, batcher):
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    req = await _read_request(reader)
+                except BadRequest as e:
+                    writer.write(_response(e.status, {'error': str(e)}, keep_alive=False))
+                    await writer.drain()
+                    break
+                if req is None:
+                    break
+                method, path, headers, body = req
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if method == 'POST' and path == '/predict':
+                    try:
+                        window = predictor.to_batch(json.loads(body)['window'])[0].numpy()
+                    except (ValueError, KeyError, TypeError) as e:
+                        writer.write(_response(400, {'error': str(e)}, keep_alive))
+                    else:
+                        try:
+                            pred = await batcher.submit(window)
+                            writer.write(_response(200, {'horizon': predictor.horizon,
+                                                         'forecast': np.round(pred, 4).tolist()}, keep_alive))
+                        except Exception as e:
+                            writer.write(_response(500, {'error': str(e)}, keep_alive))
+                elif method == 'GET' and path == '/health':
+                    writer.write(_response(200, {
+                        'status': 'ok', 'num_nodes': predictor.num_nodes, 'window_size': predictor.window_size,
+                        'horizon': predictor.horizon, 'num_features': predictor.num_features,
+                        'requests': batcher.stats['requests'], 'batches': batcher.stats['batches']}, keep_alive))
+                else:
+                    writer.write(_response(404, {'error': f"unknown endpoint {method} {path}"}, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+async def serve(checkpoint, host="127.0.0.1", port=8765, max_batch=64, max_wait_ms=0.0, threads=None):
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+    predictor = FlowPredictor.from_checkpoint(checkpoint)
+    # 预热一次，避免首个请求承担初始化开销
+    predictor.predict(np.zeros((1, predictor.window_size, predictor.num_nodes, predictor.num_features), np.float32))
+    batcher = MicroBatcher(predictor, max_batch, max_wait_ms)
+    server = await asyncio.start_server(make_handler(predictor, batcher), host, port)
+    print(f"🚀 推理服务已启动: http://{host}:{port} | 节点数: {predictor.num_nodes} | "
+          f"max_batch: {max_batch} | max_wait: {max_wait_ms}ms", flush=True)
+    async with server:
+        await asyncio.gather(server.serve_forever(), batcher.run())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="路径流量预测 HTTP 服务（微批合并）")
+    parser.add_argument('--checkpoint', default="checkpoints/best.pt")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch', type=int, default=64, help="单次前向合并的最大请求数（1 = 不合并）")
+    parser.add_argument('--max-wait-ms', type=float, default=0.0,
+                        help="凑批的最长等待时间（0 = 不等待，只合并上一批推理期间排队的请求）")
+    parser.add_argument('--threads', type=int, default=None, help="torch 推理线程数")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.checkpoint, args.host, args.port, args.max_batch, args.max_wait_ms, args.threads))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,94 @@
+import numpy as np
+import scipy.sparse as sp
+import os
+import json
+import shutil
+
+# ==========================================
+# 时空张量存储：替代 torch.save 的 pickle 字典
+# 目录结构:
+#   x.npy       所有片段沿时间轴拼接的 (T_total, N, F) float32 数组，可 mmap
+#   adj.npz     路径邻接矩阵 (scipy.sparse CSR)
+#   mask.npy    可选，(T_total,) bool，False 表示该时间步没有录制数据（连续时间轴中的空档）
+#   index.json  片段偏移 / 形状 / 路径标签等元数据
+# 读取时 x_list 中每个片段都是 x.npy 的零拷贝视图，多个进程共享同一份页缓存
+# ==========================================
+STORE_VERSION = 1
+
+def save_st_store(out_dir, x_list, adj, path_labels, meta=None, dtype=np.float32, mask=None):
+    """写入张量存储（先写临时目录再替换，避免读到写了一半的数据）"""
+    lengths = [len(x) for x in x_list]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(int)
+    node_shape = tuple(x_list[0].shape[1:]) if x_list else (len(path_labels), 1)
+
+    tmp_dir = out_dir.rstrip(os.sep) + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    x_all = np.lib.format.open_memmap(os.path.join(tmp_dir, 'x.npy'), mode='w+', dtype=dtype,
+                                      shape=(int(offsets[-1]),) + node_shape)
+    for x, start, end in zip(x_list, offsets[:-1], offsets[1:]):
+        x_all[start:end] = x
+    x_all.flush()
+    del x_all
+
+    sp.save_npz(os.path.join(tmp_dir, 'adj.npz'), sp.csr_matrix(adj), compressed=False)
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (int(offsets[-1]),):
+            raise ValueError(f"mask 形状 {mask.shape} 与时间步数 {int(offsets[-1])} 不一致")
+        np.save(os.path.join(tmp_dir, 'mask.npy'), mask)
+    index = {
+        'version': STORE_VERSION,
+        'shape': [int(offsets[-1])] + list(node_shape),
+        'dtype': np.dtype(dtype).name,
+        'chunks': [{'offset': int(s), 'length': int(e - s)} for s, e in zip(offsets[:-1], offsets[1:])],
+        'path_labels': [list(p) for p in path_labels],
+        'meta': meta or {},
+    }
+    with open(os.path.join(tmp_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.replace(tmp_dir, out_dir)
+    return out_dir
+
+def load_st_store(store_dir, mmap=True):
+    """
+    读取张量存储，返回与旧版 .pt 相同的字典结构:
+    {'x_list': [片段视图...], 'adj': csr_matrix, 'path_labels': [tuple...], 'x': 整体数组, 'chunks': [...], 'meta': {...},
+     'mask': (T_total,) bool 或 None}
+    """
+    with open(os.path.join(store_dir, 'index.json'), 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    # 'c' (copy-on-write) 映射：未写入的页仍与其他进程共享，且可直接 torch.from_numpy 零拷贝
+    x = np.load(os.path.join(store_dir, 'x.npy'), mmap_mode='c' if mmap else None)
+    x_list = [x[c['offset']:c['offset'] + c['length']] for c in index['chunks']]
+    mask_path = os.path.join(store_dir, 'mask.npy')
+    return {
+        'x': x,
+        'x_list': x_list,
+        'adj': sp.load_npz(os.path.join(store_dir, 'adj.npz')).tocsr(),
+        'path_labels': [tuple(p) for p in index['path_labels']],
+        'chunks': index['chunks'],
+        'meta': index.get('meta', {}),
+        'mask': np.load(mask_path) if os.path.exists(mask_path) else None,
+    }
+
+def load_st_data(path="model_inputs/st_batch_data", mmap=True):
+    """
+    统一的模型输入读取入口：
+    - 张量存储目录 -> load_st_store
+    - 显式给出的旧版 .pt 文件 -> torch.load（打印警告：字符串路径标签 / 稠密邻接 / 逐文件片段，与当前路段字典不一致）
+    目录不存在时不会退回同名 .pt，请重新运行 step5
+    """
+    if os.path.isdir(path):
+        return load_st_store(path, mmap)
+    if path.endswith('.pt') and os.path.isfile(path):
+        import torch
+        print(f"⚠️ 正在读取旧版 pickle 模型输入 {path}：其路径标签 / 邻接矩阵可能与当前 step3-5 的结果不一致")
+        return torch.load(path, weights_only=False)
+    hint = "（同名的旧版 .pt 需显式传入 .pt 路径）" if os.path.isfile(path + '.pt') else ""
+    raise FileNotFoundError(f"找不到模型输入: {path}，请先运行 step5 生成张量存储{hint}")
@@ -1,9 +1,20 @@
 import pandas as pd
-import csv
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import time
 import os
 import glob
-from datetime import datetime, timedelta
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import run_profile
+
+# pNEUMA 每条记录: 静态字段 + 每 6 个一组的动态字段 (lat, lon, speed, lon_acc, lat_acc, time)
+# 与旧版逐行解析保持一致：动态块从第 10 个字段开始读取
+NUM_STATIC_FIELDS = 10
+DYNAMIC_WIDTH = 6
 
 def get_absolute_base_time(file_name):
     """
@@ -20,88 +31,208 @@ def get_absolute_base_time(file_name):
         print(f" 文件名 {file_name} 格式解析失败，将使用默认偏移: {e}")
         return None
 
-def run_batch_parser():
-    # --- 配置参数 ---
-    input_folder = 'dataset'  # 数据文件夹
-    output_folder = 'processed_data' # 处理后保存的文件夹
-    sampling_rate = 25 # 25Hz -> 1Hz
-    
+def _parse_record(line, sampling_rate):
+    """
+    按步长直接切出降采样 (25Hz -> 1Hz) 后需要的字段，只对保留下来的值做浮点转换
+    返回 (静态字段列表, (n, 4) 数组: lat, lon, speed, time)；字段不足时返回 (None, None)
+    """
+    fields = line.rstrip().rstrip(';').split(';')
+    if len(fields) < NUM_STATIC_FIELDS:
+        return None, None
+    static = [x.strip() for x in fields[:NUM_STATIC_FIELDS]]
+    dynamic = fields[NUM_STATIC_FIELDS:]
+    end = len(dynamic) // DYNAMIC_WIDTH * DYNAMIC_WIDTH
+    step = DYNAMIC_WIDTH * sampling_rate
+    block = np.empty((len(range(0, end, step)), 4))
+    for col, offset in enumerate((0, 1, 2, 5)):
+        block[:, col] = np.array(dynamic[offset:end:step], dtype=np.float64)
+    return static, block
+
+def _to_timestamps(rel_time, base_dt):
+    """相对秒数 -> 绝对时间 (微秒精度，与 timedelta 一致)；没有基准时间则保留相对时间"""
+    if base_dt is None:
+        return rel_time
+    offsets = np.round(rel_time * 1e6).astype('int64').astype('timedelta64[us]')
+    return (np.datetime64(base_dt, 'us') + offsets).astype('datetime64[ns]')
+
+def _build_table(ids, blocks, base_dt):
+    pts = np.concatenate(blocks)
+    return pa.table({
+        'track_id': np.concatenate(ids),
+        'lat': pts[:, 0],
+        'lon': pts[:, 1],
+        'speed': pts[:, 2],
+        'timestamp': _to_timestamps(pts[:, 3], base_dt),
+    })
+
+def iter_trajectory_blocks(file_path, base_dt, vehicles, sampling_rate=25, block_rows=500_000):
+    """
+    流式读取一个 pNEUMA 文件，每累计约 block_rows 个降采样后的点产出一个 pyarrow.Table
+    vehicles: 列表，解析过程中追加每辆车的元数据（每车一行，体量很小）
+    """
+    ids, blocks, buffered = [], [], 0
+    with open(file_path, 'r', encoding='utf-8') as f:
+        if not f.readline():  # 空文件 / 只有表头
+            return
+        for line in f:
+            static, block = _parse_record(line, sampling_rate)
+            if static is None:
+                continue
+            track_id = int(static[0])
+            vehicles.append({
+                'track_id': track_id,
+                'type': static[1],
+                'avg_speed': float(static[3])
+            })
+            if len(block) == 0:
+                continue
+            ids.append(np.full(len(block), track_id, dtype='int64'))
+            blocks.append(block)
+            buffered += len(block)
+            if buffered >= block_rows:
+                yield _build_table(ids, blocks, base_dt)
+                ids, blocks, buffered = [], [], 0
+    if blocks:
+        yield _build_table(ids, blocks, base_dt)
+
+def parse_pneuma_file(file_path, output_file, sampling_rate=25, row_group_size=500_000):
+    """
+    解析单个 pNEUMA 文件并写出 Parquet（按 row_group_size 分块写入，内存占用有上限）
+    同时写出 *_info.parquet 车辆元数据，返回 (轨迹点数, 车辆数)
+    输出先写临时文件再重命名，进程中途崩溃也不会留下写了一半的 parquet
+    """
+    base_dt = get_absolute_base_time(os.path.basename(file_path))
+    info_file = parsed_info_path(output_file)
+    tmp_file = output_file + '.tmp'
+    tmp_info = info_file + '.tmp'
+    vehicles = []
+    num_points = 0
+    writer = None
+    try:
+        for table in iter_trajectory_blocks(file_path, base_dt, vehicles, sampling_rate, row_group_size):
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_file, table.schema)
+            writer.write_table(table, row_group_size=row_group_size)
+            num_points += table.num_rows
+        if writer is not None:
+            writer.close()
+            writer = None
+
+        if num_points:
+            # 同时保存车辆元数据（可选）；先落盘 info，轨迹文件最后出现
+            df_v = pd.DataFrame(vehicles)
+            df_v.to_parquet(tmp_info, engine='pyarrow')
+            os.replace(tmp_info, info_file)
+            os.replace(tmp_file, output_file)
+    finally:
+        if writer is not None:
+            writer.close()
+        for tmp in (tmp_file, tmp_info):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return num_points, len(vehicles)
+
+def parsed_output_path(file_path, output_folder):
+    """dataset/x.csv -> processed_data/x.parquet"""
+    return os.path.join(output_folder, os.path.basename(file_path).replace('.csv', '.parquet'))
+
+def parsed_info_path(output_file):
+    """processed_data/x.parquet -> processed_data/x_info.parquet（车辆元数据）"""
+    return output_file.replace('.parquet', '_info.parquet')
+
+def _parse_task(file_path, output_folder, sampling_rate, row_group_size):
+    """进程池任务：解析一个文件并返回耗时统计"""
+    file_name = os.path.basename(file_path)
+    output_file = parsed_output_path(file_path, output_folder)
+    # 在执行解析的进程内测量（子进程的记录由主进程通过 run_profile.add_record 汇总）
+    with run_profile.measure(run_profile.current()) as m:
+        num_points, num_vehicles = parse_pneuma_file(file_path, output_file, sampling_rate, row_group_size)
+    return {
+        'file': file_name,
+        'points': num_points,
+        'vehicles': num_vehicles,
+        'seconds': m.wall_s,
+        'cpu_s': m.cpu_s,
+        'peak_rss_mb': m.peak_rss_mb,
+        'input_mb': os.path.getsize(file_path) / 1024 ** 2,
+        'output_bytes': sum(os.path.getsize(f) for f in (output_file, parsed_info_path(output_file))
+                            if os.path.exists(f)),
+    }
+
+def print_parse_summary(stats, total_seconds):
+    """打印每个文件的耗时 / 吞吐量汇总"""
+    print(f"\n{'文件':<32} | {'车辆':>6} | {'轨迹点':>10} | {'耗时(s)':>8} | {'点/秒':>10} | {'MB/s':>7}")
+    print("-" * 88)
+    for st in sorted(stats, key=lambda x: x['file']):
+        sec = max(st['seconds'], 1e-9)
+        print(f"{st['file']:<32} | {st['vehicles']:>6} | {st['points']:>10} | {st['seconds']:>8.2f} | "
+              f"{st['points'] / sec:>10.0f} | {st['input_mb'] / sec:>7.1f}")
+    total_points = sum(st['points'] for st in stats)
+    busy = sum(st['seconds'] for st in stats)
+    print("-" * 88)
+    print(f"合计 {total_points} 个轨迹点 | 墙钟 {total_seconds:.2f}s | "
+          f"吞吐 {total_points / max(total_seconds, 1e-9):.0f} 点/秒 | 并行效率 {busy / max(total_seconds, 1e-9):.2f}x")
+
+def run_batch_parser(input_folder='dataset', output_folder='processed_data', sampling_rate=25,
+                     row_group_size=500_000, workers=1, files=None):
+    """files: 只解析指定的 csv（增量运行时由 run_pipeline 传入），默认解析 input_folder 下全部文件"""
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
     # 获取文件夹下所有 csv 文件
-    all_files = sorted(glob.glob(os.path.join(input_folder, "*.csv")))
-    
+    all_files = sorted(files if files is not None else glob.glob(os.path.join(input_folder, "*.csv")))
+
     if not all_files:
         print(f"❌ 在 {input_folder} 文件夹下找不到任何 .csv 文件。")
         return
 
-    print(f"🚀 发现 {len(all_files)} 个文件，准备开始批处理...")
+    print(f"🚀 发现 {len(all_files)} 个文件，准备开始批处理 (workers={workers})...")
     total_start_time = time.time()
+    stats = []
 
-    for file_path in all_files:
-        file_name = os.path.basename(file_path)
-        base_dt = get_absolute_base_time(file_name)
-        
-        vehicles_list = []
-        trajectories_list = []
-        
-        print(f"\n📄 正在解析: {file_name}")
-        file_start_time = time.time()
-
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f, delimiter=';')
-            try:
-                header = next(reader)
-            except StopIteration:
-                continue
-            
-            for row_idx, row in enumerate(reader):
-                row = [x.strip() for x in row if x.strip()]
-                if len(row) < 10: continue
-                
-                track_id = int(row[0])
-                vehicles_list.append({
-                    'track_id': track_id,
-                    'type': row[1],
-                    'avg_speed': float(row[3])
-                })
-                
-                dynamic_data = row[10:]
-                for i in range(0, len(dynamic_data), 6 * sampling_rate):
-                    chunk = dynamic_data[i : i + 6]
-                    if len(chunk) == 6:
-                        rel_time = float(chunk[5])
-                        
-                        # 核心改进：转换为绝对时间
-                        # 如果没有基准时间，则保留相对时间
-                        abs_time = base_dt + timedelta(seconds=rel_time) if base_dt else rel_time
-                        
-                        trajectories_list.append({
-                            'track_id': track_id,
-                            'lat': float(chunk[0]),
-                            'lon': float(chunk[1]),
-                            'speed': float(chunk[2]),
-                            'timestamp': abs_time # 使用绝对时间戳
-                        })
-
-        # 转换为 DataFrame 并保存
-        if trajectories_list:
-            df_t = pd.DataFrame(trajectories_list)
-            output_file = os.path.join(output_folder, file_name.replace('.csv', '.parquet'))
-            df_t.to_parquet(output_file, engine='pyarrow')
-            
-            # 同时保存车辆元数据（可选）
-            df_v = pd.DataFrame(vehicles_list)
-            df_v.to_parquet(output_file.replace('.parquet', '_info.parquet'), engine='pyarrow')
-            
-            print(f"✅ {file_name} 解析完成，耗时: {time.time() - file_start_time:.2f}s")
-            print(f"📊 轨迹点数: {len(df_t)}")
+    def report(st):
+        stats.append(st)
+        run_profile.add_record('step1_parse', st['file'], wall_s=st['seconds'], cpu_s=st['cpu_s'],
+                               peak_rss_mb=st['peak_rss_mb'], rows_out=st['points'],
+                               bytes_read=int(st['input_mb'] * 1024 ** 2), bytes_written=st['output_bytes'])
+        if st['points']:
+            print(f"✅ {st['file']} 解析完成，耗时: {st['seconds']:.2f}s，轨迹点数: {st['points']}")
+        else:
+            print(f"⚠️ {st['file']} 未提取到有效轨迹数据。")
+
+    with run_profile.stage('step1_parse', inputs=all_files) as rec:
+        if workers <= 1:
+            for file_path in all_files:
+                print(f"\n📄 正在解析: {os.path.basename(file_path)}")
+                try:
+                    report(_parse_task(file_path, output_folder, sampling_rate, row_group_size))
+                except Exception as e:
+                    print(f"❌ 处理文件 {os.path.basename(file_path)} 时出错: {e}")
         else:
-            print(f"⚠️ {file_name} 未提取到有效轨迹数据。")
+            # 每个文件相互独立（各自的基准时间和输出文件），直接按文件并行
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(_parse_task, fp, output_folder, sampling_rate, row_group_size): fp
+                           for fp in all_files}
+                for fut in as_completed(futures):
+                    try:
+                        report(fut.result())
+                    except Exception as e:
+                        print(f"❌ 处理文件 {os.path.basename(futures[fut])} 时出错: {e}")
+        rec.rows_out = sum(st['points'] for st in stats)
+        outputs = [parsed_output_path(fp, output_folder) for fp in all_files]
+        rec.add_output(*outputs, *(parsed_info_path(o) for o in outputs))
 
-    print(f"\n✨ 所有文件处理完毕！总耗时: {time.time() - total_start_time:.2f} 秒")
+    total_seconds = time.time() - total_start_time
+    print_parse_summary(stats, total_seconds)
+    print(f"\n✨ 所有文件处理完毕！总耗时: {total_seconds:.2f} 秒")
     print(f"📂 处理后的数据保存在: {output_folder}")
+    return stats
 
 if __name__ == "__main__":
-    run_batch_parser()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="pNEUMA 原始 csv 批量解析")
+    parser.add_argument('--input', default='dataset', help="原始 csv 所在文件夹")
+    parser.add_argument('--output', default='processed_data', help="输出 parquet 文件夹")
+    parser.add_argument('--sampling-rate', type=int, default=25, help="降采样步长 (25Hz -> 1Hz)")
+    parser.add_argument('--workers', type=int, default=1, help="并行解析的进程数")
+    args = parser.parse_args()
+    run_batch_parser(args.input, args.output, args.sampling_rate, workers=args.workers)
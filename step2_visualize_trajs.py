@@ -4,6 +4,8 @@ import matplotlib.pyplot as plt
 import os
 import glob
 
+from traj_dataset import list_tracks, query_trajectories
+
 def visualize():
     # --- 配置 ---
     graph_file = "athens_road_network.graphml" 
@@ -13,7 +15,7 @@ def visualize():
 
     # 1. 查找处理后的文件
     # 自动获取 processed_data 下的第一个 parquet 文件进行可视化预览
-    parquet_files = glob.glob(os.path.join(processed_dir, "*.parquet"))
+    parquet_files = [p for p in glob.glob(os.path.join(processed_dir, "*.parquet")) if "_info" not in p]
     
     if not parquet_files:
         print(f" 找不到处理后的数据文件。请先运行 step1_parse_pneuma.py")
@@ -21,7 +23,10 @@ def visualize():
     
     target_file = parquet_files[0] # 取第一个文件作为示例
     print(f" 正在加载数据进行可视化: {target_file}")
-    df_t = pd.read_parquet(target_file)
+    # 只读取前 10 辆车的坐标列（track_id 列抽样 + 过滤下推），不加载整个文件
+    sample_tracks = list_tracks(target_file)[:10]
+    df_sample = query_trajectories(target_file, columns=['track_id', 'lon', 'lat', 'timestamp'],
+                                   track_ids=sample_tracks)
 
     # 2. 获取路网（优先从本地读取）
     if os.path.exists(graph_file):
@@ -30,16 +35,13 @@ def visualize():
     else:
         print(" 第一次运行，正在从网络下载雅典路网...")
         # 以轨迹的中心点为基准下载路网
-        avg_lat, avg_lon = df_t['lat'].mean(), df_t['lon'].mean()
+        avg_lat, avg_lon = df_sample['lat'].mean(), df_sample['lon'].mean()
         # 增加 dist 参数确保覆盖范围（例如 2000米）
         G = ox.graph_from_point((avg_lat, avg_lon), dist=2000, network_type='drive')
         ox.save_graphml(G, graph_file)
         print(f" 路网已保存至本地: {graph_file}")
 
     # 3. 绘图（只画前10辆车，避免渲染卡顿）
-    sample_tracks = df_t['track_id'].unique()[:10]
-    df_sample = df_t[df_t['track_id'].isin(sample_tracks)]
-    
     print(f" 正在生成地图并叠加 {len(sample_tracks)} 条随机轨迹...")
     fig, ax = ox.plot_graph(G, show=False, close=False, edge_color='#555555', 
                             edge_linewidth=0.8, node_size=0, bgcolor='white')
@@ -47,8 +49,8 @@ def visualize():
     # 为不同车辆设置不同颜色
     colors = plt.cm.rainbow(np.linspace(0, 1, len(sample_tracks)))
 
-    for tid, color in zip(sample_tracks, colors):
-        track_data = df_sample[df_sample['track_id'] == tid].sort_values('timestamp')
+    # 查询结果已按 (track_id, timestamp) 排序
+    for (tid, track_data), color in zip(df_sample.groupby('track_id'), colors):
         ax.scatter(track_data['lon'], track_data['lat'], s=5, color=color, zorder=3, alpha=0.7)
 
     plt.title(f"Athens Traffic Visualization (Sample Tracks)")
@@ -1,14 +1,83 @@
 import pandas as pd
-import osmnx as ox
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
 import glob
+import run_profile
+from edge_index import load_edge_index, EDGE_CODE_DTYPE, EDGE_DICT_META_KEY
 
-def map_matching():
-    # --- 配置 ---
-    graph_file = "athens_road_network.graphml"
-    processed_dir = "processed_data"  # step1 输出的文件夹
-    output_dir = "matched_data"       # 存放匹配结果
-    
+# 匹配结果结构版本：2 起 edge_id 为 int32 路段编码（路段字典见 edge_index，包含多重边 key）
+MATCHED_SCHEMA_VERSION = 2
+
+def matched_output_path(file_path, output_dir):
+    """processed_data/x.parquet -> matched_data/x_matched.parquet"""
+    return os.path.join(output_dir, os.path.basename(file_path).replace('.parquet', '_matched.parquet'))
+
+def make_matcher(index, method="nearest", graph_file="athens_road_network.graphml", workers=1):
+    """
+    返回匹配函数 df -> 边下标数组（index 中的边编号）
+    method: 'nearest' 逐点最近路段；'hmm' 轨迹级 HMM / Viterbi 匹配，workers > 1 时按车辆并行
+    """
+    if method == "nearest":
+        return lambda df: index.nearest(df['lon'].values, df['lat'].values)[4]
+    if method == "hmm":
+        from hmm_matcher import DEFAULT_PARAMS, match_dataframe, match_dataframe_parallel
+        from road_distance import load_distance_table
+        if workers > 1:
+            return lambda df: match_dataframe_parallel(df, graph_file, workers)
+        node_dist = load_distance_table(graph_file, DEFAULT_PARAMS['max_route'])
+        return lambda df: match_dataframe(index, node_dist, df)
+    raise ValueError(f"未知的匹配方法: {method}")
+
+def match_file(index, file_path, output_dir, matcher=None):
+    """
+    对单个轨迹文件做路段匹配（index 为 edge_index.EdgeIndex，matcher 由 make_matcher 生成，默认最近路段）
+    成功返回输出路径，失败 / 跳过返回 None
+    """
+    if matcher is None:
+        matcher = make_matcher(index)
+    file_name = os.path.basename(file_path)
+    print(f"--- 正在匹配轨迹文件: {file_name} ---")
+    df = pd.read_parquet(file_path)
+
+    # 【修改点 2】健壮性检查：确保列名存在
+    if 'lon' not in df.columns or 'lat' not in df.columns:
+        print(f"⚠️  警告：文件 {file_name} 缺少 'lon' 或 'lat' 列，跳过。")
+        return None
+
+    # 3. 核心：向量化匹配最近的路段
+    print(f"   正在计算 {len(df)} 个点的最近路段...")
+
+    # 基于预构建的网格索引批量查询，得到每个点的边下标
+    try:
+        with run_profile.hot('step3.match'):
+            edge_idx = matcher(df)
+
+        # 将匹配结果存回 DataFrame
+        # edge_id 直接使用路段字典中的 int32 编码，后续的比较 / 分组 / 哈希都基于整数
+        df['u'] = index.edge_u[edge_idx]
+        df['v'] = index.edge_v[edge_idx]
+        df['edge_id'] = edge_idx.astype(EDGE_CODE_DTYPE)
+
+        # 4. 保存匹配后的结果（元数据记录路段字典对应的路网哈希）
+        output_path = matched_output_path(file_path, output_dir)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               EDGE_DICT_META_KEY: index.graph_sha1.encode()})
+        pq.write_table(table, output_path)
+        print(f"✅ 成功保存至: {output_path}")
+        return output_path
+
+    except Exception as e:
+        print(f"❌ 处理文件 {file_name} 时出错: {e}")
+        return None
+
+def map_matching(graph_file="athens_road_network.graphml", processed_dir="processed_data",
+                 output_dir="matched_data", files=None, method="nearest", workers=1):
+    """
+    files: 只处理指定的轨迹文件（增量运行时由 run_pipeline 传入），默认处理 processed_dir 下全部文件
+    method: 'nearest' 最近路段 / 'hmm' 轨迹级 HMM 匹配；workers: HMM 匹配的并行进程数
+    """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
@@ -16,54 +85,41 @@ def map_matching():
     if not os.path.exists(graph_file):
         print(f"❌ 找不到路网文件: {graph_file}，请先运行可视化脚本下载。")
         return
-    
-    print(f"📍 正在加载路网...")
-    G = ox.load_graphml(graph_file)
 
     # 2. 获取所有待处理的 Parquet 文件
-    parquet_files = glob.glob(os.path.join(processed_dir, "*.parquet"))
+    parquet_files = files if files is not None else glob.glob(os.path.join(processed_dir, "*.parquet"))
     if not parquet_files:
         print(f"❌ 在 {processed_dir} 中没找到数据。")
         return
 
-    print(f"🚀 开始处理文件匹配（已自动过滤 info 文件）...")
+    # 路段空间索引按路网文件哈希缓存在 cache/edge_index 下，首次运行自动构建
+    print(f"📍 正在加载路段空间索引...")
+    with run_profile.stage('step3_load_index', inputs=[graph_file]):
+        index = load_edge_index(graph_file)
+    matcher = make_matcher(index, method, graph_file, workers)
+
+    print(f"🚀 开始处理文件匹配 (method={method}，已自动过滤 info 文件)...")
 
     for file_path in parquet_files:
         file_name = os.path.basename(file_path)
-        
+
         # 【修改点 1】过滤掉不含轨迹点的静态信息文件
         if "_info" in file_name:
             print(f"⏭️  跳过信息文件: {file_name}")
             continue
-            
-        print(f"--- 正在匹配轨迹文件: {file_name} ---")
-        df = pd.read_parquet(file_path)
-        
-        # 【修改点 2】健壮性检查：确保列名存在
-        if 'lon' not in df.columns or 'lat' not in df.columns:
-            print(f"⚠️  警告：文件 {file_name} 缺少 'lon' 或 'lat' 列，跳过。")
-            continue
 
-        # 3. 核心：向量化匹配最近的路段
-        print(f"   正在计算 {len(df)} 个点的最近路段...")
-        
-        # nearest_edges 返回 (u, v, key) 元组列表
-        try:
-            edges = ox.nearest_edges(G, X=df['lon'], Y=df['lat'])
-            
-            # 将匹配结果存回 DataFrame
-            # 格式化为 "起点_终点" 的字符串，方便后续 GCN 构建邻接矩阵
-            df['u'] = [e[0] for e in edges]
-            df['v'] = [e[1] for e in edges]
-            df['edge_id'] = df['u'].astype(str) + "_" + df['v'].astype(str)
-            
-            # 4. 保存匹配后的结果
-            output_path = os.path.join(output_dir, file_name.replace('.parquet', '_matched.parquet'))
-            df.to_parquet(output_path, index=False)
-            print(f"✅ 成功保存至: {output_path}")
-            
-        except Exception as e:
-            print(f"❌ 处理文件 {file_name} 时出错: {e}")
+        # 逐点匹配，输出行数与输入相同；行数取自 parquet 元数据，不额外读数据
+        with run_profile.stage('step3_match', item=file_name, inputs=[file_path],
+                               rows_in=pq.read_metadata(file_path).num_rows) as rec:
+            output_path = match_file(index, file_path, output_dir, matcher)
+            if output_path:
+                rec.rows_out = rec.rows_in
+                rec.add_output(output_path)
 
 if __name__ == "__main__":
-    map_matching()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="轨迹点 -> 路段匹配")
+    parser.add_argument('--method', choices=['nearest', 'hmm'], default='nearest')
+    parser.add_argument('--workers', type=int, default=1, help="HMM 匹配的并行进程数")
+    args = parser.parse_args()
+    map_matching(method=args.method, workers=args.workers)
@@ -1,49 +1,165 @@
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import os
 import glob
 from tqdm import tqdm
 
-def extract_path_sequences():
-    input_dir = "matched_data"
-    output_dir = "path_data"
-    
+import run_profile
+
+from edge_index import EDGE_CODE_DTYPE, EDGE_DICT_META_KEY
+
+# 路径文件结构版本：
+#   2 起增加 end_time / avg_speed 列（供 step5 的速度、占有率特征使用）
+#   3 起增加逐路段的 edge_entry / edge_exit / edge_dwell 列表列（进入 / 离开时间与停留秒数）
+#   4 起 edge_id 为 list<int32> 路段编码（与 matched_data 一致）
+#   5 起 edge_dwell 为路段通行时间（下一路段进入时间 - 本路段进入时间），不再是同一路段首末匹配点的时间差
+PATH_SCHEMA_VERSION = 5
+MATCHED_COLUMNS = ['track_id', 'timestamp', 'edge_id', 'speed']
+
+def path_output_path(file_path, output_dir):
+    """matched_data/x_matched.parquet -> path_data/x_paths.parquet"""
+    return os.path.join(output_dir, os.path.basename(file_path).replace("_matched", "_paths"))
+
+def _matched_arrays(data):
+    """
+    pyarrow Table / DataFrame -> (track_id, 时间 ns, 路段编码, 路段名 Arrow 数组, 速度或 None)
+    edge_id 为整数路段编码时直接使用，路段名为 None；旧版 'u_v' 字符串先做字典编码
+    timestamp 必须是时间类型：step1 无法从文件名解析基准时间时只输出相对秒数，这类文件无法放到统一时间轴上
+    """
+    ts_type = data.schema.field('timestamp').type if isinstance(data, pa.Table) else data['timestamp'].dtype
+    if not (pa.types.is_timestamp(ts_type) if isinstance(data, pa.Table)
+            else pd.api.types.is_datetime64_any_dtype(ts_type)):
+        raise ValueError(f"timestamp 列不是时间类型 ({ts_type})，请确认原始文件名为 日期_无人机_开始_结束 格式")
+    if isinstance(data, pa.Table):
+        if pa.types.is_integer(data.schema.field('edge_id').type):
+            codes, names = data['edge_id'].to_numpy().astype(EDGE_CODE_DTYPE), None
+        else:
+            edge = data['edge_id'].combine_chunks().dictionary_encode()
+            codes, names = edge.indices.to_numpy(zero_copy_only=False), edge.dictionary
+        track = data['track_id'].to_numpy()
+        ts = data['timestamp'].cast(pa.timestamp('ns')).to_numpy().astype(np.int64)
+        speed = data['speed'].to_numpy() if 'speed' in data.column_names else None
+    else:
+        if pd.api.types.is_integer_dtype(data['edge_id']):
+            codes, names = data['edge_id'].to_numpy().astype(EDGE_CODE_DTYPE), None
+        else:
+            codes, names = pd.factorize(data['edge_id'])
+            names = pa.array(np.asarray(names, dtype=object), type=pa.string())
+        track = data['track_id'].to_numpy()
+        ts = data['timestamp'].values.astype('datetime64[ns]').astype(np.int64)
+        speed = data['speed'].to_numpy() if 'speed' in data.columns else None
+    if speed is not None:
+        speed = np.asarray(speed, dtype=np.float64)
+    return track, ts, codes, names, speed
+
+def compress_paths(data, min_path_len=2):
+    """
+    将逐点匹配结果压缩为每辆车的路径序列（按车辆、时间排序后对路段做游程编码，全程向量化）
+    data: 含 track_id / timestamp / edge_id（可选 speed）的 pyarrow Table 或 DataFrame
+    返回 pyarrow Table，每行一趟行程：
+      edge_id     list<int32> 路段编码（旧版字符串输入为 list<string>），
+                  连续重复路段只保留一次，如 [A, A, B, B, C] -> [A, B, C]
+      timestamp   行程开始时间；end_time 最后一个点的时间；avg_speed 全部点的平均速度
+      edge_entry / edge_exit  list<timestamp>  每个路段第一个 / 最后一个匹配点的时间
+      edge_dwell  list<float32>  路段通行秒数：下一路段的 entry - 本路段的 entry，最后一个路段为 end_time - entry
+                  （只有一个匹配点的路段也计入到下一路段为止的时间，不会是 0）
+      path_len    路段数，过滤掉少于 min_path_len 的行程（只在 1 个路段上晃悠的不算“路径”）
+    """
+    track, ts, codes, names, speed = _matched_arrays(data)
+    n = len(track)
+
+    # 1. 按车辆、时间排序（稳定排序）
+    order = np.lexsort((ts, track))
+    track, ts, codes = track[order], ts[order], codes[order]
+
+    # 2. 游程边界：换车或路段发生变化的位置
+    track_start = np.ones(n, dtype=bool)
+    track_start[1:] = track[1:] != track[:-1]
+    run_mask = track_start.copy()
+    run_mask[1:] |= codes[1:] != codes[:-1]
+    run_start = np.flatnonzero(run_mask)
+    # 末尾补 n 后按起点个数截断：n == 0 时起点、终点都为空（输出带完整 schema 的空表）
+    run_end = np.r_[run_start[1:], n][:len(run_start)] - 1
+    entry, exit_ = ts[run_start], ts[run_end]
+
+    # 3. 每辆车的游程数即路径长度；过滤短路径后由长度得到列表列的 offsets
+    point_start = np.flatnonzero(track_start)
+    num_tracks = len(point_start)
+    point_track = np.cumsum(track_start) - 1
+    run_track = point_track[run_start]
+    path_len = np.bincount(run_track, minlength=num_tracks)
+    keep = path_len >= min_path_len
+    run_keep = keep[run_track]
+    offsets = pa.array(np.r_[0, np.cumsum(path_len[keep])].astype(np.int32))
+
+    def list_col(values):
+        return pa.ListArray.from_arrays(offsets, values)
+
+    track_end = np.r_[point_start[1:], n][:num_tracks] - 1
+    path_codes = pa.array(codes[run_start][run_keep])
+    columns = {
+        'track_id': pa.array(track[point_start][keep]),
+        'edge_id': list_col(path_codes if names is None else pc.take(names, path_codes)),
+        'timestamp': pa.array(ts[point_start][keep], type=pa.timestamp('ns')),
+        'end_time': pa.array(ts[track_end][keep], type=pa.timestamp('ns')),
+    }
+    if speed is not None:
+        # 与 pandas mean 一致：忽略缺失值
+        speed = speed[order]
+        valid = ~np.isnan(speed)
+        total = np.bincount(point_track, np.where(valid, speed, 0.0), minlength=num_tracks)
+        cnt = np.bincount(point_track, valid, minlength=num_tracks)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columns['avg_speed'] = pa.array((total / cnt)[keep])
+    columns['path_len'] = pa.array(path_len[keep].astype(np.int64))
+    columns['edge_entry'] = list_col(pa.array(entry[run_keep], type=pa.timestamp('ns')))
+    columns['edge_exit'] = list_col(pa.array(exit_[run_keep], type=pa.timestamp('ns')))
+    # 每个游程的结束时刻：同一辆车的下一个游程的进入时间，车辆的最后一个游程取该车最后一个点的时间
+    last_run = np.r_[run_track[1:] != run_track[:-1], True][:len(run_track)]
+    run_until = np.where(last_run, ts[track_end][run_track], np.r_[entry[1:], 0][:len(entry)])
+    columns['edge_dwell'] = list_col(pa.array(((run_until - entry)[run_keep] / 1e9).astype(np.float32)))
+    return pa.table(columns)
+
+def extract_path_file(file_path, output_dir):
+    """将单个匹配结果文件压缩为路径序列，返回输出路径"""
+    schema = pq.read_schema(file_path)
+    columns = [c for c in MATCHED_COLUMNS if c in schema.names]
+    matched = pq.read_table(columns=columns, source=file_path)
+    with run_profile.hot('step4.compress'):
+        path_results = compress_paths(matched)
+    # 路段编码沿用匹配结果的路段字典
+    edge_dict = (schema.metadata or {}).get(EDGE_DICT_META_KEY)
+    if edge_dict is not None:
+        path_results = path_results.replace_schema_metadata({EDGE_DICT_META_KEY: edge_dict})
+
+    # 5. 保存结果
+    output_file = path_output_path(file_path, output_dir)
+    pq.write_table(path_results, output_file)
+    print(f"✅ 已保存: {os.path.basename(output_file)} (包含 {path_results.num_rows} 条有效路径)")
+    return output_file
+
+def extract_path_sequences(input_dir="matched_data", output_dir="path_data", files=None):
+    """files: 只处理指定的匹配结果文件（增量运行时由 run_pipeline 传入）"""
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    matched_files = glob.glob(os.path.join(input_dir, "*_matched.parquet"))
-    
+    matched_files = files if files is not None else glob.glob(os.path.join(input_dir, "*_matched.parquet"))
+
     print(f"🚀 开始提取路径序列，共 {len(matched_files)} 个文件...")
 
     for file_path in matched_files:
-        file_name = os.path.basename(file_path)
-        df = pd.read_parquet(file_path)
-
-        # 1. 确保按时间和车辆排序
-        df = df.sort_values(by=['track_id', 'timestamp'])
-
-        # 2. 核心逻辑：去除连续重复的路段
-        # 比如：[A, A, A, B, B, C, C, C] -> [A, B, C]
-        # shift() 函数可以对比当前行与上一行是否一致
-        df['edge_changed'] = df['edge_id'] != df.groupby('track_id')['edge_id'].shift()
-        
-        # 只保留 edge_id 发生变化的行
-        paths_df = df[df['edge_changed']].copy()
-
-        # 3. 按车辆分组，将路段 ID 聚合成一个列表（即路径）
-        # 同时保留进入该路段的最早时间（用于后续时间窗口聚合）
-        path_results = paths_df.groupby('track_id').agg({
-            'edge_id': lambda x: list(x),
-            'timestamp': 'first'  # 记录这趟行程的开始时间
-        }).reset_index()
-
-        # 4. 过滤掉过短的路径（比如只在 1 个路段上晃悠的，不算“路径”）
-        path_results['path_len'] = path_results['edge_id'].apply(len)
-        path_results = path_results[path_results['path_len'] >= 2]
-
-        # 5. 保存结果
-        output_file = os.path.join(output_dir, file_name.replace("_matched", "_paths"))
-        path_results.to_parquet(output_file)
-        print(f"✅ 已保存: {os.path.basename(output_file)} (包含 {len(path_results)} 条有效路径)")
+        with run_profile.stage('step4_extract', item=os.path.basename(file_path), inputs=[file_path],
+                               rows_in=pq.read_metadata(file_path).num_rows) as rec:
+            try:
+                output_file = extract_path_file(file_path, output_dir)
+            except Exception as e:
+                print(f"❌ 处理文件 {os.path.basename(file_path)} 时出错: {e}")
+                continue
+            rec.rows_out = pq.read_metadata(output_file).num_rows
+            rec.add_output(output_file)
 
 if __name__ == "__main__":
-    extract_path_sequences()
\ No newline at end of file
+    extract_path_sequences()
@@ -1,87 +1,208 @@
 import pandas as pd
 import numpy as np
-import torch
+import pyarrow.parquet as pq
 import os
 import glob
 
-def build_st_features_batch():
-    # --- 配置 ---
-    input_dir = "path_data"
-    output_dir = "model_inputs"
-    num_top_paths = 50  # 选取的路径节点数量
-    time_step_sec = 60  # 时间步长，60秒（可改为10秒以增加样本量）
-    
+from edge_index import EDGE_DICT_META_KEY
+from path_adjacency import build_path_adjacency, edge_lengths_from_index, edge_nodes_from_index
+from path_counter import read_path_keys, key_to_path, load_global_counts, select_top_k
+from st_store import save_st_store
+import run_profile
+
+# 可选的节点特征（每个时间步、每条路径一个值）：
+#   'count'     : 该时间步内开始该路径的行程数（流量）
+#   'speed'     : 这些行程的平均速度，无行程时为 0
+#   'occupancy' : 该时间步内正在该路径上行驶的车辆数（行程时间区间与时间步有重叠）
+FEATURES = ('count', 'speed', 'occupancy')
+TIME_AXES = ('continuous', 'per_file')
+
+def _chunk_features(p_idx, t_start, t_end, speed, features, num_steps, num_nodes):
+    """
+    p_idx: 行程所属路径节点编号（-1 表示不在 Top-P 中）
+    t_start / t_end: 行程开始 / 结束所在的时间步
+    返回 (num_steps, num_nodes, len(features))
+    """
+    X = np.zeros((num_steps, num_nodes, len(features)))
+    size = num_steps * num_nodes
+    valid = (p_idx >= 0) & (t_start >= 0) & (t_start < num_steps)
+    cell = t_start[valid] * num_nodes + p_idx[valid]
+    count = np.bincount(cell, minlength=size)
+    for f, name in enumerate(features):
+        if name == 'count':
+            X[:, :, f] = count.reshape(num_steps, num_nodes)
+        elif name == 'speed':
+            total = np.bincount(cell, weights=speed[valid], minlength=size)
+            X[:, :, f] = np.divide(total, count, out=np.zeros(size), where=count > 0).reshape(num_steps, num_nodes)
+        elif name == 'occupancy':
+            # 区间 [t_start, t_end] 与片段求交后，差分 +1 / -1 再沿时间累加
+            a = np.clip(t_start, 0, num_steps)
+            b = np.clip(t_end + 1, 0, num_steps)
+            keep = (p_idx >= 0) & (a < b)
+            diff = (np.bincount(a[keep] * num_nodes + p_idx[keep], minlength=size + num_nodes)
+                    - np.bincount(b[keep] * num_nodes + p_idx[keep], minlength=size + num_nodes))
+            X[:, :, f] = np.cumsum(diff.reshape(num_steps + 1, num_nodes), axis=0)[:num_steps]
+    return X
+
+def _read_trips(file_path, features):
+    """读取单个路径文件的行程：(路径键, 开始时间, 结束时间 或 None, 平均速度 或 None)"""
+    keys, start_ts = read_path_keys(file_path)
+    names = pq.read_schema(file_path).names
+    missing = [c for c, name in (('end_time', 'occupancy'), ('avg_speed', 'speed'))
+               if name in features and c not in names]
+    if missing:
+        raise ValueError(f"{os.path.basename(file_path)} 缺少列 {missing}，请用新版 step4 重新提取路径")
+    cols = [c for c in ('end_time', 'avg_speed') if c in names]
+    table = pq.read_table(file_path, columns=cols) if cols else None
+    end_ts = table['end_time'].to_numpy() if 'end_time' in cols else None
+    speed = table['avg_speed'].to_numpy().astype(np.float64) if 'speed' in features else None
+    return keys, start_ts, end_ts, speed
+
+def _continuous_features(trips, top_index, features, time_step_sec, num_nodes):
+    """
+    全部文件的行程放到同一个绝对时间轴上（起点对齐到 time_step_sec 的整数倍）
+    返回 (X (T_total, N, F), mask (T_total,) bool, 起点 datetime64)
+    mask[t] 为 True 表示第 t 步在某个文件的录制范围 [最早开始, 最晚结束] 之内
+    """
+    step = np.timedelta64(int(time_step_sec * 1e9), 'ns')
+    t0 = min(start_ts.min() for _, start_ts, _, _ in trips if len(start_ts)).astype('datetime64[ns]')
+    origin = np.datetime64(0, 'ns') + (t0 - np.datetime64(0, 'ns')) // step * step
+    to_step = lambda ts: ((ts.astype('datetime64[ns]') - origin) // step).astype(np.int64)
+
+    p_idx, t_start, t_end, speed, spans = [], [], [], [], []
+    for keys, start_ts, end_ts, sp in trips:
+        a = to_step(start_ts)
+        b = to_step(end_ts) if end_ts is not None else a
+        p_idx.append(top_index.get_indexer(keys).astype(np.int64))
+        t_start.append(a)
+        t_end.append(b)
+        speed.append(sp)
+        if len(a):
+            spans.append((a.min(), b.max()))
+    num_steps = int(max(e for _, e in spans)) + 1
+    mask = np.zeros(num_steps, dtype=bool)
+    for a, b in spans:
+        mask[a:b + 1] = True
+    X = _chunk_features(np.concatenate(p_idx), np.concatenate(t_start), np.concatenate(t_end),
+                        np.concatenate(speed) if 'speed' in features else None, features, num_steps, num_nodes)
+    return X, mask, origin
+
+def build_st_features_batch(input_dir="path_data", output_dir="model_inputs",
+                            num_top_paths=50, time_step_sec=60, path_files=None,
+                            adj_weighting='binary', connect_end_start=False,
+                            graph_file="athens_road_network.graphml", target_coverage=None,
+                            features=('count',), time_axis='continuous'):
+    """
+    num_top_paths: 选取的路径节点数量
+    target_coverage: 按目标覆盖率 (如 0.9) 自动确定路径数量，给出时忽略 num_top_paths
+    time_step_sec: 时间步长，60秒（可改为10秒以增加样本量）
+    path_files: 指定参与构建的路径文件（增量运行时由 run_pipeline 传入），默认扫描 input_dir
+    adj_weighting: 邻接权重 'binary' / 'jaccard' / 'length'（length 需要路网文件）
+    connect_end_start: 首尾相接的路径之间是否额外连边
+    features: 节点特征通道，取自 FEATURES；第 0 个通道为训练时的默认预测目标
+    time_axis: 'continuous' 所有文件共享一个绝对时间轴，首尾相接的录制连成一个 (T_total, N, F) 序列，
+               没有任何文件覆盖的时间步在 mask 中标记为 False；
+               'per_file' 旧版行为，每个文件从自身最早行程开始取 15 步作为独立片段
+    """
+    if time_axis not in TIME_AXES:
+        raise ValueError(f"未知的时间轴模式: {time_axis}，可选 {TIME_AXES}")
+    features = tuple(features)
+    unknown = set(features) - set(FEATURES)
+    if unknown or not features:
+        raise ValueError(f"未知的特征: {sorted(unknown)}，可选 {FEATURES}")
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     # 1. 扫描所有路径文件
-    path_files = sorted(glob.glob(os.path.join(input_dir, "*_paths.parquet")))
+    if path_files is None:
+        path_files = glob.glob(os.path.join(input_dir, "*_paths.parquet"))
+    path_files = sorted(path_files)
     if not path_files:
         print("❌ 找不到路径数据，请确认 step4 已运行。")
         return
     
     print(f"🚀 开始多文件批处理，共检测到 {len(path_files)} 个片段...")
 
-    # 2. 全局路径库构建：从所有片段中找出最频繁的 P 条路径
+    # 路段编码只在同一份路段字典（同一路网）内可比
+    edge_dicts = {(pq.read_schema(f).metadata or {}).get(EDGE_DICT_META_KEY) for f in path_files}
+    if len(edge_dicts) > 1:
+        raise ValueError(f"路径文件来自不同的路段字典（路网）: {sorted(str(d) for d in edge_dicts)}，请重新运行 step3/step4")
+    edge_dict = edge_dicts.pop()
+    edge_dict = edge_dict.decode() if edge_dict is not None else None
+
+    # 2. 全局路径库构建：合并每个文件缓存的路径计数 (path_counter)，找出最频繁的 P 条路径
     print("🔍 正在扫描全局高频路径...")
-    all_path_series = []
-    for f in path_files:
-        temp_df = pd.read_parquet(f)
-        temp_df['path_tuple'] = temp_df['edge_id'].apply(tuple)
-        all_path_series.append(temp_df['path_tuple'])
-    
-    global_paths = pd.concat(all_path_series).value_counts().head(num_top_paths).index.tolist()
-    path_to_idx = {path: i for i, path in enumerate(global_paths)}
-    print(f"✅ 全局路径库构建完成，节点数: {len(global_paths)}")
+    with run_profile.stage('step5_top_paths', inputs=path_files) as rec:
+        counts, total_trips, _ = load_global_counts(path_files=path_files)
+        top_keys = select_top_k(counts, total_trips, k=num_top_paths, coverage=target_coverage)
+        rec.rows_in, rec.rows_out = total_trips, len(top_keys)
 
-    # 3. 逐个文件处理，生成时空张量块
-    st_chunks = []
-    
-    for file_path in path_files:
-        file_name = os.path.basename(file_path)
-        df = pd.read_parquet(file_path)
-        df['path_tuple'] = df['edge_id'].apply(tuple)
-        
-        # 确定该片段的时间范围
-        start_t = df['timestamp'].min()
-        # 强制设为 15 分钟（针对 pNEUMA 无人机续航特性）
-        num_steps = 15 
-        
-        # 初始化当前片段的张量: (Time, Nodes, Feature)
-        X_chunk = np.zeros((num_steps, num_top_paths, 1))
-        
-        for _, row in df.iterrows():
-            if row['path_tuple'] in path_to_idx:
-                # 计算分钟偏移
-                t_idx = int((row['timestamp'] - start_t).total_seconds() // time_step_sec)
-                p_idx = path_to_idx[row['path_tuple']]
-                if 0 <= t_idx < num_steps:
-                    X_chunk[t_idx, p_idx, 0] += 1
-        
-        st_chunks.append(X_chunk)
-        print(f"📦 已处理片段: {file_name} -> Tensor {X_chunk.shape}")
-
-    # 4. 构建路径邻接矩阵 A_path (全局唯一)
+    global_paths = [key_to_path(k) for k in top_keys]
+    top_index = pd.Index(top_keys)
+    # 路径总数不足 P 条时以实际数量为准
+    num_nodes = len(global_paths)
+    print(f"✅ 全局路径库构建完成，节点数: {num_nodes}，覆盖率: {counts.iloc[:num_nodes].sum() / max(total_trips, 1):.2%}")
+
+    # 3. 逐个文件读取行程，生成时空张量
+    with run_profile.stage('step5_features', inputs=path_files) as rec:
+        trips = [_read_trips(f, features) for f in path_files]
+        if time_axis == 'continuous':
+            X, mask, origin = _continuous_features(trips, top_index, features, time_step_sec, num_nodes)
+            st_chunks = [X]
+            gaps = int((~mask).sum())
+            print(f"📦 连续时间轴: {pd.Timestamp(origin)} 起共 {len(X)} 步 -> Tensor {X.shape} | 无数据时间步: {gaps}")
+        else:
+            st_chunks, mask, origin = [], None, None
+            for file_path, (keys, start_ts, end_ts, speed) in zip(path_files, trips):
+                # 确定该片段的时间范围
+                start_t = start_ts.min()
+                # 强制设为 15 分钟（针对 pNEUMA 无人机续航特性）
+                num_steps = 15
+
+                # 路径 -> 节点编号（不在 Top-P 中的为 -1），时间 -> 步长偏移
+                p_idx = top_index.get_indexer(keys).astype(np.int64)
+                to_step = lambda ts: np.floor((ts - start_t) / np.timedelta64(1, 's') / time_step_sec).astype(np.int64)
+                t_start = to_step(start_ts)
+                t_end = to_step(end_ts) if end_ts is not None else t_start
+
+                # 当前片段的张量: (Time, Nodes, Feature)，按 (t_idx, p_idx) 一次性累加
+                X_chunk = _chunk_features(p_idx, t_start, t_end, speed, features, num_steps, num_nodes)
+                st_chunks.append(X_chunk)
+                print(f"📦 已处理片段: {os.path.basename(file_path)} -> Tensor {X_chunk.shape}")
+        rec.rows_in = sum(len(keys) for keys, _, _, _ in trips)
+        rec.rows_out = sum(len(X_chunk) for X_chunk in st_chunks)
+
+    # 4. 构建路径邻接矩阵 A_path (全局唯一)：稀疏关联矩阵 A = B · Bᵀ
     print("🕸️  正在构建路径邻接矩阵...")
-    A_path = np.zeros((num_top_paths, num_top_paths))
-    for i in range(num_top_paths):
-        for j in range(num_top_paths):
-            # 基于路径间路段重叠定义相关性
-            if set(global_paths[i]) & set(global_paths[j]):
-                A_path[i, j] = 1
-    
+    with run_profile.stage('step5_adjacency', rows_in=num_nodes):
+        edge_lengths = edge_nodes = None
+        coded = num_nodes > 0 and isinstance(global_paths[0][0], int)
+        if adj_weighting == 'length' and num_nodes and not coded:
+            raise ValueError("weighting='length' 需要 int32 路段编码的路径文件，请用新版 step3/step4 重新生成")
+        if adj_weighting == 'length' or (coded and connect_end_start):
+            from edge_index import load_edge_index
+            index = load_edge_index(graph_file)
+            if edge_dict is not None and index.graph_sha1 != edge_dict:
+                raise ValueError(f"路网 {graph_file} 与路径文件的路段字典不一致，请重新运行 step3/step4")
+            edge_lengths = edge_lengths_from_index(index)
+            edge_nodes = edge_nodes_from_index(index)
+        A_path = build_path_adjacency(global_paths, adj_weighting, connect_end_start, edge_lengths,
+                                      edge_nodes=edge_nodes)
+
     # 5. 保存结果
-    # 最终保存为一个包含多个张量的列表，训练时每个张量是一个独立的序列
-    final_data = {
-        'x_list': st_chunks,       # List of [15, 50, 1] tensors
-        'adj': A_path,             # [50, 50] matrix
-        'path_labels': global_paths
-    }
-    
-    output_path = os.path.join(output_dir, "st_batch_data.pt")
-    torch.save(final_data, output_path)
+    # 连续时间轴只有一个片段，附带逐时间步的有效掩码；per_file 模式下每个片段是一个独立的序列
+    output_path = os.path.join(output_dir, "st_batch_data")
+    with run_profile.stage('step5_save') as rec:
+        save_st_store(output_path, st_chunks, A_path, global_paths,
+                      meta={'time_step_sec': time_step_sec, 'features': list(features), 'adj_weighting': adj_weighting,
+                            'connect_end_start': connect_end_start, 'edge_dict_sha1': edge_dict,
+                            'time_axis': time_axis, 'origin': str(pd.Timestamp(origin)) if origin is not None else None},
+                      mask=mask)
+        rec.add_output(output_path)
+
     print(f"\n✨ 全部完成！结果已保存至: {output_path}")
     print(f"📊 总样本片段数: {len(st_chunks)}")
+    return output_path
 
 if __name__ == "__main__":
     build_st_features_batch()
\ No newline at end of file
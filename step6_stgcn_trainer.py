@@ -1,147 +1,651 @@
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import DataLoader, Dataset, default_collate
 import numpy as np
+import scipy.sparse as sp
+import time
+import os
 import matplotlib.pyplot as plt
 
+import run_profile
+from st_store import load_st_data
+from model_checkpoint import save_checkpoint, load_checkpoint, check_compatible, set_rng_state
+
 # ==========================================
 # 1. 数据集定义：处理多个 15 分钟片段
+# 所有片段连续存放在一个 (T_total, N, F) 张量中，只预先计算 (片段, 偏移) 索引，
+# 取样本时返回窗口视图，不再逐个拷贝窗口
 # ==========================================
 class TrafficDataset(Dataset):
-    def __init__(self, pt_path, window_size=5, horizon=1):
-        data = torch.load(pt_path)
-        self.x_list = data['x_list']  # List of (15, 50, 1)
+    def __init__(self, data, window_size=5, horizon=1, target_feature=0):
+        # data: 已加载的数据字典，或张量存储目录 / 旧版 .pt 路径
+        # x 使用全部特征通道，y 取 target_feature 通道（默认 0 = 流量）的未来 horizon 步
+        if isinstance(data, str):
+            data = load_st_data(data)
+        if 'x' in data:
+            # 张量存储：已是连续的 mmap 数组，零拷贝转为 Tensor
+            series = np.asarray(data['x'], dtype=np.float32)
+            lengths = [c['length'] for c in data['chunks']]
+        else:
+            # 旧版 .pt：x_list 为独立数组，拼接一次
+            series = np.concatenate(data['x_list'], axis=0).astype(np.float32)
+            lengths = [len(x) for x in data['x_list']]
+        self.series = torch.from_numpy(series)  # (T_total, N, F)
         self.window_size = window_size
         self.horizon = horizon
-        
-        self.samples = []
-        for chunk in self.x_list:
-            # chunk shape: (15, 50, 1) -> (Time, Nodes, Features)
-            # 在每个 15 分钟片段内进行滑动窗口采样
-            for t in range(len(chunk) - window_size - horizon + 1):
-                x = chunk[t : t + window_size, :, :]
-                y = chunk[t + window_size : t + window_size + horizon, :, 0] # 预测流量值
-                self.samples.append((x, y))
+        self.target_feature = target_feature
+        self.num_features = self.series.shape[-1]
+
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        self.chunks = [self.series[o:o + n] for o, n in zip(offsets, lengths)]
+
+        # 在每个片段内进行滑动窗口采样：index[i] = (片段编号, 片段内起点)
+        span = window_size + horizon
+        counts = np.maximum(np.asarray(lengths, dtype=np.int64) - span + 1, 0)
+        chunk_ids = np.repeat(np.arange(len(lengths)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        starts = offsets[chunk_ids] + local  # 在 series 中的全局起点
+        mask = data.get('mask')
+        if mask is not None:
+            # 连续时间轴：窗口（含预测目标）覆盖的时间步必须全部有数据，跨越录制空档的窗口丢弃
+            gaps = np.concatenate([[0], np.cumsum(~np.asarray(mask, dtype=bool))])
+            valid = gaps[starts + span] == gaps[starts]
+            chunk_ids, local, starts = chunk_ids[valid], local[valid], starts[valid]
+        self.index = np.stack([chunk_ids, local], axis=1)
+        self.starts = torch.from_numpy(starts)
+        self._x_steps = torch.arange(window_size)
+        self._y_steps = torch.arange(window_size, span)
 
     def __len__(self):
-        return len(self.samples)
+        return len(self.index)
 
     def __getitem__(self, idx):
-        x, y = self.samples[idx]
-        return torch.FloatTensor(x), torch.FloatTensor(y)
+        c, t = self.index[idx]
+        chunk = self.chunks[c]
+        x = chunk[t : t + self.window_size]                                        # (T, N, F) 视图
+        y = chunk[t + self.window_size : t + self.window_size + self.horizon, :, self.target_feature]  # (horizon, N)
+        return x, y
+
+    def __getitems__(self, indices):
+        """DataLoader 按批取样：一次花式索引拼出整个 batch，需配合 collate_windows 使用"""
+        starts = self.starts[torch.as_tensor(indices, dtype=torch.long)].unsqueeze(1)
+        x = self.series[starts + self._x_steps]          # (B, T, N, F)
+        y = self.series[starts + self._y_steps][..., self.target_feature]  # (B, horizon, N)
+        return x, y
+
+def collate_windows(batch):
+    """__getitems__ 已返回整批 (x, y) 时原样透传，否则按默认方式堆叠"""
+    if isinstance(batch, tuple):
+        return batch
+    return default_collate(batch)
+
+def chronological_split(dataset, val_ratio=0.1, test_ratio=0.2):
+    """
+    按时间顺序划分 训练 / 验证 / 测试 (torch Subset)，代替 random_split
+    窗口按全局起点排序后依次切分；后一段开头预测目标与前一段最后一个预测目标重叠的窗口被丢弃（间隔 horizon）
+    """
+    order = np.argsort(dataset.starts.numpy(), kind='stable')
+    starts = dataset.starts.numpy()[order]
+    n = len(order)
+    n_test = int(round(n * test_ratio))
+    n_val = int(round(n * val_ratio))
+    bounds = [0, n - n_val - n_test, n - n_test, n]
+    parts = []
+    prev_last = None
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        idx, st = order[a:b], starts[a:b]
+        if prev_last is not None:
+            idx = idx[st >= prev_last + dataset.horizon]
+        if b > a:
+            prev_last = starts[b - 1]
+        parts.append(torch.utils.data.Subset(dataset, idx.tolist()))
+    return tuple(parts)
+
+def feature_stats(dataset, subset):
+    """在训练窗口覆盖的时间步上按特征通道计算均值 / 标准差（标准差为 0 的通道按 1 处理）"""
+    starts = dataset.starts[subset.indices]
+    if len(starts) == 0:
+        F = dataset.num_features
+        return {'mean': [0.0] * F, 'std': [1.0] * F}
+    rows = (starts.unsqueeze(1) + dataset._x_steps).unique()
+    x = dataset.series[rows].double().reshape(-1, dataset.num_features)
+    std = x.std(dim=0, unbiased=False)
+    std[std < 1e-6] = 1.0
+    return {'mean': x.mean(dim=0).tolist(), 'std': std.tolist()}
 
 # ==========================================
 # 2. ST-GCN 模型定义
 # ==========================================
+def normalized_adjacency(adj, sparse=True):
+    """
+    标准化邻接矩阵 A = D^-0.5 * A * D^-0.5（在 scipy 稀疏矩阵上计算，不生成 N² 的稠密中间结果）
+    sparse=True 返回 torch 稀疏 CSR 张量，否则返回稠密张量
+    """
+    adj = sp.csr_matrix(adj, dtype=np.float32)
+    deg = np.asarray(adj.sum(axis=1)).ravel()
+    d_inv_sqrt = np.zeros_like(deg)
+    np.power(deg, -0.5, out=d_inv_sqrt, where=deg > 0)
+    norm = (sp.diags(d_inv_sqrt) @ adj @ sp.diags(d_inv_sqrt)).tocsr().astype(np.float32)
+    norm.sort_indices()
+    if not sparse:
+        return torch.from_numpy(norm.toarray())
+    return torch.sparse_csr_tensor(torch.from_numpy(norm.indptr.astype(np.int64)),
+                                   torch.from_numpy(norm.indices.astype(np.int64)),
+                                   torch.from_numpy(norm.data), size=norm.shape, check_invariants=True)
+
+def graph_propagate(adj, x):
+    """
+    聚合邻居信息 A * X
+    adj: (N, N) 稀疏 CSR 或稠密张量; x: (M, N, F)，M 为并入的 Batch*Time
+    稀疏时把 (M, F) 并到列上，一次稀疏-稠密矩阵乘完成整个 batch
+    """
+    if x.dtype != adj.dtype:  # autocast 下的低精度激活，稀疏乘法按邻接矩阵精度计算
+        x = x.to(adj.dtype)
+    if adj.layout != torch.sparse_csr:
+        return torch.matmul(adj, x)
+    M, N, F = x.shape
+    # CPU 稀疏 CSR 乘法不支持 bfloat16，不让 autocast 改写这一步
+    with torch.autocast(device_type=x.device.type, enabled=False):
+        out = torch.sparse.mm(adj, x.transpose(0, 1).reshape(N, M * F))  # (N, M*F)
+    return out.reshape(N, M, F).transpose(0, 1)
+
 class SimpleSTGCN(nn.Module):
-    def __init__(self, adj, num_nodes, in_channels, hidden_channels, out_channels):
+    def __init__(self, adj, num_nodes, in_channels, hidden_channels, out_channels, window_size=5, horizon=1,
+                 sparse_adj=True):
         super(SimpleSTGCN, self).__init__()
-        # 标准化邻接矩阵 A = D^-0.5 * A * D^-0.5
-        adj = torch.FloatTensor(adj)
-        d = torch.diag(torch.pow(adj.sum(1), -0.5))
-        self.adj = d @ adj @ d 
+        # 标准化邻接矩阵注册为 buffer，随 model.to(device) 一次性搬到设备上；默认以稀疏 CSR 存储
+        self.register_buffer('adj', normalized_adjacency(adj, sparse=sparse_adj))
         
         # 空间卷积层 (Graph Convolution)
         self.gcn = nn.Linear(in_channels, hidden_channels)
         
-        # 时间处理层 (Temporal - 这里用简单的全连接压缩时间维度)
-        self.temporal_fc = nn.Linear(5, 1) # 假设 window_size=5
+        # 时间处理层 (Temporal - 这里用简单的全连接把 window_size 步映射为 horizon 步，一次前向输出全部预测步)
+        self.temporal_fc = nn.Linear(window_size, horizon)
         
         # 输出层
         self.out_fc = nn.Linear(hidden_channels, out_channels)
 
     def forward(self, x):
-        # x shape: (Batch, Time, Nodes, Features) -> (B, 5, 50, 1)
+        # x shape: (Batch, Time, Nodes, Features) -> (B, window_size, 50, F)
         batch_size, T, N, F = x.shape
         
         # 1. 空间维度卷积 (GCN)
         # 将时间维度并入 Batch 方便矩阵运算
-        x = x.view(-1, N, F) # (B*T, 50, 1)
+        x = x.reshape(-1, N, F) # (B*T, 50, F)
         # 聚合邻居信息: A * X
-        x = torch.matmul(self.adj.to(x.device), x) 
+        x = graph_propagate(self.adj, x)
         x = torch.relu(self.gcn(x)) # (B*T, 50, Hidden)
         
         # 2. 时间维度聚合
-        x = x.view(batch_size, T, N, -1) # (B, 5, 50, Hidden)
-        x = x.transpose(1, 2).transpose(2, 3) # (B, 50, Hidden, 5)
-        x = self.temporal_fc(x) # (B, 50, Hidden, 1)
+        x = x.view(batch_size, T, N, -1) # (B, T, 50, Hidden)
+        x = x.permute(0, 2, 3, 1) # (B, 50, Hidden, T)
+        x = self.temporal_fc(x) # (B, 50, Hidden, horizon)
         
         # 3. 输出
-        x = x.squeeze(-1) # (B, 50, Hidden)
-        x = self.out_fc(x) # (B, 50, 1)
-        return x.squeeze(-1) # (B, 50)
+        x = x.permute(0, 3, 1, 2) # (B, horizon, 50, Hidden)
+        x = self.out_fc(x) # (B, horizon, 50, out_channels)
+        return x.squeeze(-1) # out_channels=1 时为 (B, horizon, 50)
+
+# ==========================================
+# 2b. 门控空洞时间卷积 ST-GCN（STGCN / Graph WaveNet 式的 时间卷积 - 图卷积 - 时间卷积 块）
+# 内部布局为 (T, B, N, C)：通道在最后，且任意时间切片都是连续内存，
+# 时间卷积的每个空洞抽头直接作为一次 GEMM 累加 (addmm)，不做拼接拷贝；
+# 残差并入最后一个抽头的权重，门控用融合的 F.glu；图卷积直接并为 (T*B, N, C)
+# ==========================================
+class TemporalGatedConv(nn.Module):
+    """因果空洞时间卷积 + GLU 门控: (T, B, N, C_in) -> (T - (k-1)*d, B, N, C_out)"""
+    def __init__(self, in_channels, out_channels, kernel_size=2, dilation=1):
+        super(TemporalGatedConv, self).__init__()
+        self.kernel_size = kernel_size
+        self.dilation = dilation
+        self.out_channels = out_channels
+        # weight[j]: 第 j 个抽头 (C_in, 2*C_out)，前一半为输出 P，后一半为门控 Q
+        self.weight = nn.Parameter(torch.empty(kernel_size, in_channels, 2 * out_channels))
+        self.bias = nn.Parameter(torch.zeros(2 * out_channels))
+        nn.init.xavier_uniform_(self.weight.view(-1, 2 * out_channels))
+        # 残差：通道数相同为恒等映射，否则为 1x1 线性变换
+        self.res = nn.Linear(in_channels, out_channels) if in_channels != out_channels else None
+
+    @property
+    def shrink(self):
+        return (self.kernel_size - 1) * self.dilation
+
+    def _last_tap(self):
+        """最后一个抽头（对齐输出时刻）的权重与偏置，并入残差: (P + res) * sigmoid(Q)"""
+        w, b = self.weight[-1], self.bias
+        pad = torch.zeros_like(w[:, self.out_channels:])
+        if self.res is None:
+            eye = torch.eye(w.shape[0], self.out_channels, dtype=w.dtype, device=w.device)
+            return w + torch.cat([eye, pad], dim=1), b
+        return (w + torch.cat([self.res.weight.t(), pad], dim=1),
+                b + torch.cat([self.res.bias, torch.zeros_like(self.res.bias)]))
+
+    def forward(self, x):
+        T_out = x.shape[0] - self.shrink
+        rest, C = x.shape[1:-1], x.shape[-1]
+        w_last, b = self._last_tap()
+        h = torch.addmm(b, x[self.shrink:].reshape(-1, C), w_last)
+        for j in range(self.kernel_size - 1):
+            t0 = j * self.dilation
+            # 原地 addmm_ 不经过 autocast，按 h 的精度（bf16 autocast 时为 bfloat16）显式转换
+            h.addmm_(x[t0 : t0 + T_out].reshape(-1, C).to(h.dtype), self.weight[j].to(h.dtype))
+        return nn.functional.glu(h.view(T_out, *rest, -1), dim=-1)
+
+class STConvBlock(nn.Module):
+    """时间门控卷积 -> 图卷积 -> 时间门控卷积 -> LayerNorm"""
+    def __init__(self, in_channels, hidden_channels, out_channels, kernel_size=2, dilation=1):
+        super(STConvBlock, self).__init__()
+        self.temporal1 = TemporalGatedConv(in_channels, hidden_channels, kernel_size, dilation)
+        self.spatial = nn.Linear(hidden_channels, hidden_channels)
+        self.temporal2 = TemporalGatedConv(hidden_channels, out_channels, kernel_size, dilation)
+        self.norm = nn.LayerNorm(out_channels)
+
+    @property
+    def shrink(self):
+        return self.temporal1.shrink + self.temporal2.shrink
+
+    def forward(self, x, adj):
+        # x: (T, B, N, C)
+        x = self.temporal1(x)
+        T, B, N, C = x.shape
+        x = torch.relu(self.spatial(graph_propagate(adj, x.reshape(T * B, N, C)))).view(T, B, N, C)
+        return self.norm(self.temporal2(x))
+
+def default_dilations(num_blocks, kernel_size, window_size):
+    """
+    默认空洞率：按 1, 2, 4, ... 增长，但保证感受野不超过 window_size（放不下时空洞率减半，最小为 1）
+    即使全部为 1 也放不下时减少块数（至少保留 1 块，由模型构造时报错）
+    """
+    cost = 2 * (kernel_size - 1)
+    budget = window_size - 1
+    if cost > 0:
+        num_blocks = max(min(num_blocks, budget // cost), 1)
+    dilations, used = [], 0
+    for i in range(num_blocks):
+        d = 2 ** i
+        # 后面每块至少还要占用 dilation=1 的代价
+        while d > 1 and used + cost * (d + num_blocks - i - 1) > budget:
+            d //= 2
+        dilations.append(d)
+        used += cost * d
+    return dilations
+
+class GatedSTGCN(nn.Module):
+    """
+    堆叠的门控空洞时间卷积 ST 块，输出 (B, horizon, N)
+    dilations: 每个块的空洞率，默认见 default_dilations；感受野 = 1 + Σ 2·(kernel_size-1)·dilation，需 <= window_size
+    感受野小于 window_size 时，剩余的时间步由输出层一起映射到 horizon
+    """
+    def __init__(self, adj, num_nodes, in_channels, hidden_channels, out_channels, window_size=12, horizon=1,
+                 num_blocks=2, kernel_size=2, dilations=None, sparse_adj=True):
+        super(GatedSTGCN, self).__init__()
+        if dilations is None:
+            dilations = default_dilations(num_blocks, kernel_size, window_size)
+            num_blocks = len(dilations)
+        dilations = list(dilations)
+        if len(dilations) != num_blocks:
+            raise ValueError(f"dilations 长度 ({len(dilations)}) 与 num_blocks ({num_blocks}) 不一致")
+        self.receptive_field = 1 + sum(2 * (kernel_size - 1) * d for d in dilations)
+        if self.receptive_field > window_size:
+            raise ValueError(f"感受野 {self.receptive_field} 超过 window_size={window_size}，"
+                             f"请减少 num_blocks / kernel_size / dilations")
+        self.register_buffer('adj', normalized_adjacency(adj, sparse=sparse_adj))
+        self.horizon = horizon
+        self.out_channels = out_channels
+
+        self.blocks = nn.ModuleList()
+        channels = in_channels
+        for d in dilations:
+            self.blocks.append(STConvBlock(channels, hidden_channels, hidden_channels, kernel_size, d))
+            channels = hidden_channels
+        self.t_out = window_size - self.receptive_field + 1
+
+        # 输出层：剩余时间步 x 通道 -> horizon x out_channels（逐节点共享参数）
+        self.head = nn.Sequential(
+            nn.Linear(self.t_out * hidden_channels, hidden_channels),
+            nn.ReLU(),
+            nn.Linear(hidden_channels, horizon * out_channels),
+        )
+
+    def forward(self, x):
+        # x shape: (Batch, window_size, Nodes, Features)，内部转为 (T, B, N, C)
+        x = x.transpose(0, 1).contiguous()
+        for block in self.blocks:
+            x = block(x, self.adj)
+        T, B, N, C = x.shape
+        x = self.head(x.permute(1, 2, 0, 3).reshape(B, N, T * C))  # (B, N, horizon*out)
+        x = x.view(B, N, self.horizon, self.out_channels).permute(0, 2, 1, 3)
+        return x.squeeze(-1) # out_channels=1 时为 (B, horizon, N)
+
+def build_model(name, adj, num_nodes, in_channels, window_size, horizon, hidden_channels=64, **kwargs):
+    """name: 'simple' (SimpleSTGCN) 或 'tcn' (GatedSTGCN)"""
+    if name == 'simple':
+        return SimpleSTGCN(adj, num_nodes, in_channels, hidden_channels, 1,
+                           window_size=window_size, horizon=horizon, **kwargs)
+    if name == 'tcn':
+        return GatedSTGCN(adj, num_nodes, in_channels, hidden_channels, 1,
+                          window_size=window_size, horizon=horizon, **kwargs)
+    raise ValueError(f"未知的模型: {name}，可选 'simple' / 'tcn'")
+
+class NormalizedModel(nn.Module):
+    """输入按特征通道 z-score 归一化后再送入模型；统计量以 buffer 保存，随检查点一起保存 / 加载"""
+    def __init__(self, model, mean, std):
+        super(NormalizedModel, self).__init__()
+        self.model = model
+        self.register_buffer('mean', torch.as_tensor(mean, dtype=torch.float32))
+        self.register_buffer('std', torch.as_tensor(std, dtype=torch.float32))
+
+    def forward(self, x):
+        return self.model((x - self.mean) / self.std)
 
 # ==========================================
 # 3. 训练主程序
 # ==========================================
-def main():
-    # 参数设置
-    WINDOW_SIZE = 5   # 用过去 5 分钟预测
-    BATCH_SIZE = 8
-    EPOCHS = 50
-    LEARNING_RATE = 0.001
-    
-    # 加载原始数据获取邻接矩阵
-    raw_data = torch.load("model_inputs/st_batch_data.pt")
+# 训练选项（--perf 以 PERF_PRESET 为基础，单独给出的参数优先）
+TRAIN_DEFAULTS = {
+    'num_workers': 0,           # DataLoader 工作进程数
+    'persistent_workers': False,
+    'bf16': False,              # bfloat16 autocast（CPU / CUDA 均可）
+    'compile': False,           # torch.compile
+    'accum_steps': 1,           # 梯度累积步数，等效 batch = batch_size * accum_steps
+    'log_every': 0,             # 每 N 个优化步打印一次损失（0 = 只在每 10 个 epoch 打印）
+    'eval_every': 1,            # 每 N 个 epoch 在验证集上评估一次（早停 / 保存最优模型 / time-to-accuracy）
+    'target_mse': None,         # time-to-accuracy 的目标验证 MSE
+    'val_ratio': 0.1,           # 按时间顺序划分的验证集比例
+    'test_ratio': 0.2,          # 按时间顺序划分的测试集比例（位于最后）
+    'patience': 10,             # 验证 MSE 连续多少次评估没有改善就早停（0 = 不早停）
+    'min_delta': 0.0,           # 视为改善的最小下降量
+    'checkpoint_dir': 'checkpoints',  # 检查点目录：last.pt (定期) / best.pt (验证最优)，None = 不保存
+    'checkpoint_every': 5,      # 每 N 个 epoch 保存一次 last.pt
+    'resume': None,             # 从该检查点继续训练
+}
+PERF_PRESET = dict(TRAIN_DEFAULTS, num_workers=2, persistent_workers=True, bf16=True, log_every=50)
+
+def _autocast(device, enabled):
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=enabled)
+
+def train_epoch(model, loader, optimizer, criterion, device, accum_steps=1, bf16=False, log_every=0):
+    """
+    训练一个 epoch，返回 (平均损失, 样本数)
+    损失在设备上累加，只在 log_every 打印时和 epoch 结束时同步一次
+    """
+    model.train()
+    loss_sum = torch.zeros((), device=device)
+    window_sum = torch.zeros((), device=device)
+    window_batches = 0
+    num_samples = 0
+    step = 0
+    num_batches = len(loader)
+    optimizer.zero_grad(set_to_none=True)
+    for i, (x, y) in enumerate(loader):
+        # 末尾不足 accum_steps 的一组按实际批数缩放，梯度仍为组内平均
+        group_size = min(accum_steps, num_batches - i // accum_steps * accum_steps)
+        # 未同步设备，GPU 上该热点计时只反映提交开销；cProfile 采集时配合 CUDA_LAUNCH_BLOCKING=1
+        with run_profile.hot('step6.forward_backward'):
+            x = x.to(device, non_blocking=True)
+            y = y.to(device, non_blocking=True) # y: (B, horizon, N)
+            with _autocast(device, bf16):
+                output = model(x)
+            loss = criterion(output.float(), y)
+            (loss / group_size).backward()
+        loss_sum += loss.detach() * len(x)
+        window_sum += loss.detach()
+        window_batches += 1
+        num_samples += len(x)
+
+        if (i + 1) % accum_steps == 0 or i + 1 == num_batches:
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+            step += 1
+            if log_every and step % log_every == 0:
+                print(f"    step {step}: loss {window_sum.item() / window_batches:.4f}")
+                window_sum.zero_()
+                window_batches = 0
+    return loss_sum.item() / max(num_samples, 1), num_samples
+
+@torch.no_grad()
+def evaluate(model, loader, device, horizon, bf16=False):
+    """返回各预测步的测试 MSE (horizon,)，测试集为空时返回 None"""
+    model.eval()
+    step_se = torch.zeros(horizon, device=device)
+    n = 0
+    for x, y in loader:
+        with _autocast(device, bf16):
+            pred = model(x.to(device, non_blocking=True))
+        step_se += ((pred.float() - y.to(device)) ** 2).sum(dim=(0, 2))
+        n += y.shape[0] * y.shape[2]
+    return (step_se / n).cpu() if n else None
+
+def main(data_path="model_inputs/st_batch_data", window_size=5, horizon=1, target_feature=0,
+         batch_size=8, epochs=50, learning_rate=0.001, plot=True, model_name='simple', model_kwargs=None,
+         train_options=None):
+    """
+    model_name: 'simple' (SimpleSTGCN) 或 'tcn' (GatedSTGCN)，model_kwargs 透传给模型（如 num_blocks / dilations）
+    window_size: 用过去多少个时间步预测（60 秒步长时即分钟数）
+    horizon: 一次前向同时预测未来多少个时间步（如 15 = 未来 1~15 分钟）
+    target_feature: 预测的特征通道（step5 features 中的下标，0 = 流量）
+    epochs: 训练的总 epoch 数上限（续训时包含已完成的 epoch）
+    train_options: 训练选项，见 TRAIN_DEFAULTS / PERF_PRESET
+    """
+    opts = dict(TRAIN_DEFAULTS, **(train_options or {}))
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    # 加载数据（邻接矩阵与样本共用同一份 mmap 数据，不再重复加载）
+    raw_data = load_st_data(data_path)
     adj = raw_data['adj']
     num_nodes = adj.shape[0]
 
-    # 准备 DataLoader
-    dataset = TrafficDataset("model_inputs/st_batch_data.pt", window_size=WINDOW_SIZE)
-    train_size = int(0.8 * len(dataset))
-    test_size = len(dataset) - train_size
-    train_db, test_db = torch.utils.data.random_split(dataset, [train_size, test_size])
-    
-    train_loader = DataLoader(train_db, batch_size=BATCH_SIZE, shuffle=True)
-    test_loader = DataLoader(test_db, batch_size=BATCH_SIZE)
+    ckpt = None
+    if opts['resume']:
+        ckpt = load_checkpoint(opts['resume'])
+        check_compatible(ckpt, raw_data['path_labels'], adj)
+        cfg = ckpt['model_config']
+        model_name, model_kwargs = cfg['model_name'], cfg['model_kwargs']
+        window_size, horizon, target_feature = cfg['window_size'], cfg['horizon'], cfg['target_feature']
+        print(f"♻️  从检查点继续训练: {opts['resume']} (已完成 {ckpt['epoch']} 个 epoch)")
+
+    # 准备 DataLoader：按时间顺序划分 训练 / 验证 / 测试
+    # 数据集为 mmap 视图，fork 出的工作进程共享同一份页缓存
+    dataset = TrafficDataset(raw_data, window_size=window_size, horizon=horizon, target_feature=target_feature)
+    train_db, val_db, test_db = chronological_split(dataset, opts['val_ratio'], opts['test_ratio'])
+    norm_stats = ckpt['norm_stats'] if ckpt else feature_stats(dataset, train_db)
+
+    loader_kwargs = {'collate_fn': collate_windows, 'pin_memory': device.type == 'cuda',
+                     'num_workers': opts['num_workers']}
+    if opts['num_workers'] > 0:
+        loader_kwargs['persistent_workers'] = opts['persistent_workers']
+    train_loader = DataLoader(train_db, batch_size=batch_size, shuffle=True, **loader_kwargs)
+    val_loader = DataLoader(val_db, batch_size=batch_size, **loader_kwargs)
+    test_loader = DataLoader(test_db, batch_size=batch_size, **loader_kwargs)
 
     # 模型初始化
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = SimpleSTGCN(adj, num_nodes, 1, 64, 1).to(device)
-    optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE)
+    model_config = {'model_name': model_name, 'model_kwargs': model_kwargs or {}, 'num_nodes': num_nodes,
+                    'in_channels': dataset.num_features, 'window_size': window_size, 'horizon': horizon,
+                    'target_feature': target_feature}
+    net = build_model(model_name, adj, num_nodes, dataset.num_features, window_size, horizon,
+                      **(model_kwargs or {}))
+    model = NormalizedModel(net, norm_stats['mean'], norm_stats['std']).to(device)
+    optimizer = optim.Adam(model.parameters(), lr=learning_rate)
     criterion = nn.MSELoss()
 
+    state = {'best_val': None, 'best_epoch': 0, 'bad_evals': 0, 'history': [], 'elapsed': 0.0, 'reached_at': None}
+    start_epoch = 0
+    if ckpt:
+        model.load_state_dict(ckpt['model_state'])
+        optimizer.load_state_dict(ckpt['optimizer_state'])
+        set_rng_state(ckpt['rng_state'])
+        state.update(ckpt['train_state'])
+        start_epoch = ckpt['epoch']
+    best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+    best_path = os.path.join(os.path.dirname(opts['resume']), 'best.pt') if ckpt else None
+    if best_path and os.path.exists(best_path) and state['best_val'] is not None:
+        best_state = load_checkpoint(best_path, map_location=device)['model_state']
+    run_model = torch.compile(model) if opts['compile'] else model
+
+    ckpt_dir = opts['checkpoint_dir']
+    def save(name, epoch):
+        if ckpt_dir:
+            save_checkpoint(os.path.join(ckpt_dir, name), model, optimizer, epoch, model_config,
+                            raw_data['path_labels'], adj, norm_stats, state)
+
     # 训练循环
-    print(f"开始训练... 总样本数: {len(dataset)}, 训练集: {train_size}")
+    print(f"开始训练... 总样本数: {len(dataset)}, 训练集: {len(train_db)}, 验证集: {len(val_db)}, "
+          f"测试集: {len(test_db)}, 特征数: {dataset.num_features}, 窗口: {window_size}, 预测步数: {horizon}")
+    print(f"⚙️  batch: {batch_size} x 累积 {opts['accum_steps']} | workers: {opts['num_workers']} | "
+          f"bf16: {opts['bf16']} | compile: {opts['compile']} | device: {device}")
     train_losses = []
-    
-    for epoch in range(EPOCHS):
-        model.train()
-        epoch_loss = 0
-        for x, y in train_loader:
-            x, y = x.to(device), y.to(device).squeeze(1) # y: (B, 50)
-            
-            optimizer.zero_grad()
-            output = model(x)
-            loss = criterion(output, y)
-            loss.backward()
-            optimizer.step()
-            epoch_loss += loss.item()
-        
-        avg_loss = epoch_loss / len(train_loader)
+    train_start = time.perf_counter() - state['elapsed']
+    stopped_early = False
+
+    for epoch in range(start_epoch, epochs):
+        epoch_start = time.perf_counter()
+        with run_profile.stage('step6_epoch', item=epoch + 1) as rec:
+            avg_loss, num_samples = train_epoch(run_model, train_loader, optimizer, criterion, device,
+                                                opts['accum_steps'], opts['bf16'], opts['log_every'])
+            rec.rows_in = num_samples
+        epoch_time = time.perf_counter() - epoch_start
         train_losses.append(avg_loss)
-        if (epoch+1) % 10 == 0:
-            print(f"Epoch [{epoch+1}/{EPOCHS}], Loss: {avg_loss:.4f}")
+        record = {'epoch': epoch + 1, 'loss': avg_loss, 'time': epoch_time,
+                  'samples_per_sec': num_samples / max(epoch_time, 1e-9)}
+
+        # 验证：早停 / 最优模型 / time-to-accuracy
+        if opts['eval_every'] and (epoch + 1) % opts['eval_every'] == 0:
+            step_mse = evaluate(run_model, val_loader, device, horizon, opts['bf16'])
+            if step_mse is not None:
+                val_mse = step_mse.mean().item()
+                record['val_mse'] = val_mse
+                if state['best_val'] is None or val_mse < state['best_val'] - opts['min_delta']:
+                    state.update(best_val=val_mse, best_epoch=epoch + 1, bad_evals=0)
+                    best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+                    save('best.pt', epoch + 1)
+                else:
+                    state['bad_evals'] += 1
+                if (state['reached_at'] is None and opts['target_mse'] is not None
+                        and val_mse <= opts['target_mse']):
+                    state['reached_at'] = (epoch + 1, time.perf_counter() - train_start)
+        state['history'].append(record)
+        state['elapsed'] = time.perf_counter() - train_start
+
+        if opts['log_every']:
+            val_col = f", Val MSE: {record['val_mse']:.4f}" if 'val_mse' in record else ""
+            print(f"Epoch [{epoch+1}/{epochs}], Loss: {avg_loss:.4f}{val_col}, "
+                  f"{record['samples_per_sec']:.1f} 样本/秒 ({epoch_time:.2f}s)")
+        elif (epoch+1) % 10 == 0:
+            print(f"Epoch [{epoch+1}/{epochs}], Loss: {avg_loss:.4f}")
+
+        if opts['patience'] and state['bad_evals'] >= opts['patience']:
+            print(f"⏹️  验证 MSE 连续 {state['bad_evals']} 次没有改善，在第 {epoch + 1} 个 epoch 早停 "
+                  f"(最优: epoch {state['best_epoch']}, Val MSE {state['best_val']:.4f})")
+            save('last.pt', epoch + 1)
+            stopped_early = True
+            break
+        if opts['checkpoint_every'] and ((epoch + 1) % opts['checkpoint_every'] == 0 or epoch + 1 == epochs):
+            save('last.pt', epoch + 1)
+
+    history = state['history']
+    # 首个 epoch 含编译 / 工作进程启动开销，稳态吞吐从第 2 个 epoch 起计算
+    steady = history[1:] or history
+    if history:
+        print(f"⏱️  训练总耗时: {state['elapsed']:.2f}s | 稳态吞吐: "
+              f"{sum(r['samples_per_sec'] for r in steady) / max(len(steady), 1):.1f} 样本/秒")
+    if opts['target_mse'] is not None:
+        if state['reached_at']:
+            print(f"🎯 验证 MSE <= {opts['target_mse']} 用时: {state['reached_at'][1]:.2f}s "
+                  f"(epoch {state['reached_at'][0]})")
+        else:
+            print(f"🎯 未达到目标验证 MSE {opts['target_mse']}")
+
+    # 恢复验证集上最优的参数，再报告各预测步的测试误差
+    if state['best_val'] is not None:
+        model.load_state_dict(best_state)
+        print(f"🏆 使用验证最优参数 (epoch {state['best_epoch']}, Val MSE {state['best_val']:.4f})"
+              + ("" if not stopped_early else "，已早停"))
+    step_mse = evaluate(run_model, test_loader, device, horizon, opts['bf16'])
+    if step_mse is not None:
+        for h, mse in enumerate(step_mse.tolist()):
+            print(f"📏 预测第 {h + 1} 步 MSE: {mse:.4f}")
 
     # 可视化结果
-    model.eval()
-    with torch.no_grad():
-        # 取一个 batch 看看预测效果
-        test_x, test_y = next(iter(test_loader))
-        pred = model(test_x.to(device)).cpu().numpy()
-        true = test_y.squeeze(1).numpy()
-        
-        plt.figure(figsize=(10, 5))
-        plt.plot(true[0], label='Actual Flow', alpha=0.7, marker='o')
-        plt.plot(pred[0], label='Predicted Flow', alpha=0.7, marker='x')
-        plt.title("Path Flow Prediction (Top 50 Paths)")
-        plt.xlabel("Path ID")
-        plt.ylabel("Vehicle Count / min")
-        plt.legend()
-        plt.show()
+    if plot and len(test_db):
+        model.eval()
+        with torch.no_grad():
+            # 取一个 batch 看看第 1 个预测步的效果
+            test_x, test_y = next(iter(test_loader))
+            pred = model(test_x.to(device)).cpu().numpy()
+            true = test_y.numpy()
+            
+            plt.figure(figsize=(10, 5))
+            plt.plot(true[0, 0], label='Actual Flow', alpha=0.7, marker='o')
+            plt.plot(pred[0, 0], label='Predicted Flow', alpha=0.7, marker='x')
+            plt.title(f"Path Flow Prediction (Top {num_nodes} Paths, step 1/{horizon})")
+            plt.xlabel("Path ID")
+            plt.ylabel("Vehicle Count / min")
+            plt.legend()
+            plt.show()
 
     print("✅ 训练完成！")
+    model.history = history
+    return model
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="训练路径流量 ST-GCN")
+    parser.add_argument('--data', default="model_inputs/st_batch_data", help="step5 张量存储目录或旧版 .pt")
+    parser.add_argument('--window-size', type=int, default=5)
+    parser.add_argument('--horizon', type=int, default=1, help="一次输出的预测步数")
+    parser.add_argument('--target-feature', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--no-plot', action='store_true')
+    parser.add_argument('--model', choices=['simple', 'tcn'], default='simple')
+    parser.add_argument('--blocks', type=int, default=2, help="tcn: ST 块数")
+    parser.add_argument('--kernel-size', type=int, default=2, help="tcn: 时间卷积核大小")
+    parser.add_argument('--dilations', type=int, nargs='+', default=None, help="tcn: 每个块的空洞率")
+    ckpt = parser.add_argument_group('检查点 / 早停')
+    ckpt.add_argument('--checkpoint-dir', default=None, help="保存 last.pt / best.pt 的目录")
+    ckpt.add_argument('--no-checkpoint', action='store_true', help="不保存检查点（覆盖默认的 checkpoints 目录）")
+    ckpt.add_argument('--checkpoint-every', type=int, default=None)
+    ckpt.add_argument('--resume', default=None, help="从检查点继续训练")
+    ckpt.add_argument('--patience', type=int, default=None, help="早停耐心（0 = 不早停）")
+    ckpt.add_argument('--min-delta', type=float, default=None)
+    ckpt.add_argument('--val-ratio', type=float, default=None)
+    ckpt.add_argument('--test-ratio', type=float, default=None)
+    perf = parser.add_argument_group('训练性能选项')
+    perf.add_argument('--perf', action='store_true', help="性能模式：多进程加载 + bf16 + 每 epoch 吞吐报告")
+    perf.add_argument('--num-workers', type=int, default=None)
+    perf.add_argument('--no-persistent-workers', action='store_true')
+    perf.add_argument('--bf16', action=argparse.BooleanOptionalAction, default=None, help="bfloat16 autocast")
+    perf.add_argument('--compile', action='store_true', help="使用 torch.compile")
+    perf.add_argument('--accum-steps', type=int, default=None, help="梯度累积步数")
+    perf.add_argument('--log-every', type=int, default=None, help="每 N 个优化步打印一次损失")
+    perf.add_argument('--eval-every', type=int, default=None, help="每 N 个 epoch 评估一次验证集")
+    perf.add_argument('--target-mse', type=float, default=None, help="报告达到该验证 MSE 的用时")
+    perf.add_argument('--report', default=None, help="写出运行报告 <prefix>.json / .parquet（见 run_profile）")
+    perf.add_argument('--profile', default=None, help="用 cProfile 采集的热点，逗号分隔，如 step6.forward_backward")
+    args = parser.parse_args()
+    model_kwargs = None
+    if args.model == 'tcn':
+        model_kwargs = {'num_blocks': args.blocks, 'kernel_size': args.kernel_size, 'dilations': args.dilations}
+
+    train_options = dict(PERF_PRESET if args.perf else TRAIN_DEFAULTS)
+    overrides = {'num_workers': args.num_workers, 'bf16': args.bf16, 'accum_steps': args.accum_steps,
+                 'log_every': args.log_every, 'eval_every': args.eval_every, 'target_mse': args.target_mse,
+                 'checkpoint_dir': args.checkpoint_dir, 'checkpoint_every': args.checkpoint_every,
+                 'resume': args.resume, 'patience': args.patience, 'min_delta': args.min_delta,
+                 'val_ratio': args.val_ratio, 'test_ratio': args.test_ratio}
+    train_options.update({k: v for k, v in overrides.items() if v is not None})
+    if args.compile:
+        train_options['compile'] = True
+    if args.no_persistent_workers:
+        train_options['persistent_workers'] = False
+    if args.no_checkpoint:
+        train_options['checkpoint_dir'] = None
+    if args.report:
+        run_profile.enable(args.report, args.profile, meta={'data': args.data, 'train_options': train_options})
+    with run_profile.stage('step6_train', inputs=[args.data]):
+        main(args.data, args.window_size, args.horizon, args.target_feature,
+             args.batch_size, args.epochs, args.lr, plot=not args.no_plot,
+             model_name=args.model, model_kwargs=model_kwargs, train_options=train_options)
+    if args.report:
+        run_profile.write_report()
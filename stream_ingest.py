@@ -0,0 +1,316 @@
+import pandas as pd
+import numpy as np
+import os
+import time
+import queue
+import argparse
+
+from edge_index import load_edge_index, EDGE_CODE_DTYPE
+from path_counter import path_key, key_to_path, path_label, load_global_counts, select_top_k
+
+# ==========================================
+# 流式接入：轨迹点增量到达 -> 逐点匹配路段 -> 按车辆压缩路径 -> 每分钟输出 Top-K 路径计数向量
+# 与批处理 step3 -> step4 -> step5 对应：
+#   - 匹配使用同一份磁盘网格索引的最近路段（HMM 需要整条轨迹的后续点，不适合在线场景）
+#   - 每辆车只保留压缩后的路段编码序列（连续重复的路段只记一次，与 compress_paths 一致），
+#     车辆超过 track_timeout_sec 没有新点即视为行程结束，路段数 >= 2 时计入其开始时间所在的时间步
+#   - 某个时间步内开始的行程全部结束后输出该时间步；最多等待 max_delay_sec，之后才结束的行程记为迟到
+# 常驻内存只有活跃车辆的状态与尚未输出的时间步，与数据总时长无关
+# ==========================================
+STREAM_COLUMNS = ['track_id', 'lat', 'lon', 'speed', 'timestamp']
+_NS = 1_000_000_000
+
+class _Track:
+    __slots__ = ('edges', 'start', 'last_seen')
+
+    def __init__(self, edge, start):
+        self.edges = [edge]
+        self.start = start
+        self.last_seen = start
+
+class StreamingPathCounter:
+    """
+    index: edge_index.EdgeIndex；top_paths: Top-K 路径（path_counter 的路径键或路段编码序列），决定计数向量的顺序
+    origin: 时间步的起点（默认取第一个点所在的整 time_step_sec 边界）
+    on_emit: 可选回调 (时间步开始时间 pd.Timestamp, 计数向量 np.ndarray(K,))
+    """
+
+    def __init__(self, index, top_paths, time_step_sec=60, track_timeout_sec=60, max_delay_sec=300,
+                 min_path_len=2, origin=None, on_emit=None):
+        self.index = index
+        self.top_keys = [p if isinstance(p, bytes) else path_key(p) for p in top_paths]
+        self.key_pos = {k: i for i, k in enumerate(self.top_keys)}
+        self.step_ns = int(time_step_sec * _NS)
+        self.timeout_ns = int(track_timeout_sec * _NS)
+        self.max_delay_ns = int(max_delay_sec * _NS)
+        self.min_path_len = min_path_len
+        self.origin = None if origin is None else pd.Timestamp(origin).value
+        self.on_emit = on_emit
+
+        self.tracks = {}
+        self.pending = {}          # 时间步 -> 计数向量（尚未输出）
+        self.next_step = 0         # 下一个待输出的时间步
+        self.watermark = None      # 已见到的最大事件时间 (ns)
+        self.stats = {'points': 0, 'paths': 0, 'top_paths': 0, 'late_paths': 0,
+                      'out_of_order': 0, 'evicted': 0, 'emitted_steps': 0}
+
+    # ---------- 输入 ----------
+    def process(self, df):
+        """处理一批轨迹点 (track_id, lat, lon, timestamp)，返回本批触发输出的 [(时间步开始时间, 计数向量)]"""
+        if len(df) == 0:
+            return []
+        ts = pd.to_datetime(df['timestamp']).values.astype('datetime64[ns]').astype(np.int64)
+        tracks = df['track_id'].to_numpy()
+        codes = self.index.nearest(df['lon'].to_numpy(), df['lat'].to_numpy())[4].astype(EDGE_CODE_DTYPE)
+        if self.origin is None:
+            self.origin = int(ts.min()) // self.step_ns * self.step_ns
+        self.stats['points'] += len(df)
+
+        # 批内按 (车辆, 时间) 排序后逐车辆处理，连续重复路段在批内先向量化去掉
+        order = np.lexsort((ts, tracks))
+        tracks, ts, codes = tracks[order], ts[order], codes[order]
+        bounds = np.flatnonzero(np.r_[True, tracks[1:] != tracks[:-1], True])
+        for s, e in zip(bounds[:-1], bounds[1:]):
+            self._update_track(tracks[s], ts[s:e], codes[s:e])
+
+        batch_max = int(ts.max())
+        if self.watermark is None or batch_max > self.watermark:
+            self.watermark = batch_max
+        self._evict(self.watermark - self.timeout_ns)
+        return self._emit_ready()
+
+    def _update_track(self, track_id, ts, codes):
+        state = self.tracks.get(track_id)
+        if state is not None:
+            # 同一车辆的点应按时间到达，早于已处理时间的点直接丢弃
+            fresh = ts >= state.last_seen
+            if not fresh.all():
+                self.stats['out_of_order'] += int((~fresh).sum())
+                ts, codes = ts[fresh], codes[fresh]
+                if len(ts) == 0:
+                    return
+            if ts[0] - state.last_seen > self.timeout_ns:
+                # 中断超过超时时间：上一段行程结束，从这里开始新的行程
+                self._finalize(self.tracks.pop(track_id))
+                state = None
+        if state is None:
+            state = self.tracks[track_id] = _Track(int(codes[0]), int(ts[0]))
+        keep = np.r_[codes[0] != state.edges[-1], codes[1:] != codes[:-1]]
+        state.edges.extend(codes[keep].tolist())
+        state.last_seen = int(ts[-1])
+
+    # ---------- 行程结束与计数 ----------
+    def _finalize(self, state):
+        if len(state.edges) < self.min_path_len:
+            return
+        self.stats['paths'] += 1
+        pos = self.key_pos.get(path_key(state.edges))
+        if pos is None:
+            return
+        self.stats['top_paths'] += 1
+        step = (state.start - self.origin) // self.step_ns
+        if step < self.next_step:
+            self.stats['late_paths'] += 1
+            return
+        counts = self.pending.get(step)
+        if counts is None:
+            counts = self.pending[step] = np.zeros(len(self.top_keys), dtype=np.float32)
+        counts[pos] += 1
+
+    def _evict(self, cutoff):
+        expired = [tid for tid, st in self.tracks.items() if st.last_seen < cutoff]
+        for tid in expired:
+            self._finalize(self.tracks.pop(tid))
+        self.stats['evicted'] += len(expired)
+
+    def _emit_ready(self, final=False):
+        if self.watermark is None:
+            return []
+        # 仍活跃的行程中最早的开始时间步：它及之后的时间步计数还可能增加
+        open_step = min(((st.start - self.origin) // self.step_ns for st in self.tracks.values()), default=None)
+        out = []
+        while True:
+            step_end = self.origin + (self.next_step + 1) * self.step_ns
+            if final:
+                ready = step_end <= self.watermark + self.step_ns
+            else:
+                ready = step_end <= self.watermark and (
+                    open_step is None or open_step > self.next_step or self.watermark >= step_end + self.max_delay_ns)
+            if not ready:
+                break
+            counts = self.pending.pop(self.next_step, None)
+            if counts is None:
+                counts = np.zeros(len(self.top_keys), dtype=np.float32)
+            start = pd.Timestamp(self.origin + self.next_step * self.step_ns)
+            out.append((start, counts))
+            if self.on_emit is not None:
+                self.on_emit(start, counts)
+            self.next_step += 1
+        self.stats['emitted_steps'] += len(out)
+        return out
+
+    def flush(self):
+        """数据流结束：结束全部活跃行程并输出剩余时间步"""
+        for tid in list(self.tracks):
+            self._finalize(self.tracks.pop(tid))
+        return self._emit_ready(final=True)
+
+    @property
+    def active_tracks(self):
+        return len(self.tracks)
+
+# ==========================================
+# 数据源：每次产出一批轨迹点 DataFrame
+# ==========================================
+def replay_parquet(file_path, batch_sec=1.0, speedup=0.0):
+    """
+    按时间顺序回放 processed_data 中的轨迹文件，每批为 batch_sec 秒内的点
+    speedup > 0 时按事件时间的 speedup 倍速 sleep，0 表示尽快回放
+    """
+    df = pd.read_parquet(file_path, columns=STREAM_COLUMNS).sort_values('timestamp', kind='stable')
+    ts = df['timestamp'].values.astype('datetime64[ns]').astype(np.int64)
+    batch_no = (ts - ts[0]) // int(batch_sec * _NS)
+    bounds = np.flatnonzero(np.r_[True, batch_no[1:] != batch_no[:-1], True])
+    wall_start = time.perf_counter()
+    for s, e in zip(bounds[:-1], bounds[1:]):
+        if speedup > 0:
+            delay = (ts[s] - ts[0]) / _NS / speedup - (time.perf_counter() - wall_start)
+            if delay > 0:
+                time.sleep(delay)
+        yield df.iloc[s:e]
+
+def tail_csv(file_path, poll_sec=0.5, idle_timeout_sec=None, max_rows=10_000):
+    """
+    跟随读取不断追加的 CSV（表头 track_id,lat,lon,speed,timestamp），类似 tail -f
+    idle_timeout_sec: 连续这么久没有新行则结束（None 表示一直等待）
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        header = f.readline().strip().split(',')
+        rows, partial, idle_since = [], '', time.time()
+        while True:
+            line = f.readline()
+            if line:
+                partial += line
+                if not partial.endswith('\n'):
+                    continue  # 写入方尚未写完这一行
+                rows.append(partial.rstrip('\n').split(','))
+                partial = ''
+                if len(rows) < max_rows:
+                    continue
+            if rows:
+                yield _rows_to_frame(rows, header)
+                rows, idle_since = [], time.time()
+            elif idle_timeout_sec is not None and time.time() - idle_since > idle_timeout_sec:
+                return
+            else:
+                time.sleep(poll_sec)
+
+def drain_queue(q, max_rows=10_000, poll_sec=0.5):
+    """
+    从 queue.Queue 读取轨迹点（本地 socket / 消息队列的替身）
+    元素为 (track_id, lat, lon, speed, timestamp) 元组或 DataFrame，收到 None 时结束
+    """
+    while True:
+        try:
+            item = q.get(timeout=poll_sec)
+        except queue.Empty:
+            continue
+        rows, frames, done = [], [], item is None
+        while not done:
+            if isinstance(item, pd.DataFrame):
+                frames.append(item[STREAM_COLUMNS])
+            else:
+                rows.append(item)
+            if len(rows) >= max_rows:
+                break
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                break
+            done = item is None
+        if rows:
+            frames.append(pd.DataFrame(rows, columns=STREAM_COLUMNS))
+        if frames:
+            yield pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if done:
+            return
+
+def _rows_to_frame(rows, header):
+    df = pd.DataFrame(rows, columns=header)
+    return pd.DataFrame({
+        'track_id': pd.to_numeric(df['track_id']),
+        'lat': df['lat'].astype(float),
+        'lon': df['lon'].astype(float),
+        'speed': pd.to_numeric(df['speed'], errors='coerce') if 'speed' in df else np.nan,
+        'timestamp': pd.to_datetime(df['timestamp']),
+    })
+
+def load_top_paths(store=None, path_dir="path_data", top_k=50, index=None):
+    """
+    Top-K 路径：优先使用 step5 存储中的 path_labels（与训练 / 推理的节点顺序一致），否则由路径计数重新选取
+    存储的路径标签必须是整数路段编码，且（给出 index 时）路段字典与当前路网一致，否则需要重新运行 step3-5
+    """
+    if store is not None:
+        from st_store import load_st_data
+        data = load_st_data(store)
+        labels = data['path_labels']
+        if not all(isinstance(e, (int, np.integer)) for p in labels for e in p):
+            raise ValueError(f"{store} 的路径标签不是整数路段编码（旧版 'u_v' 字符串），请重新运行 step3-5")
+        edge_dict = (data.get('meta') or {}).get('edge_dict_sha1')
+        if index is not None and edge_dict is not None and edge_dict != index.graph_sha1:
+            raise ValueError(f"{store} 的路段字典与当前路网不一致，请重新运行 step3-5")
+        return [path_key(p) for p in labels]
+    counts, total, _ = load_global_counts(path_dir)
+    return list(select_top_k(counts, total, k=top_k))
+
+def run_stream(source, counter, report_every=5):
+    """消费数据源直到结束，打印每个输出时间步的概况，返回 [(时间步开始时间, 计数向量)]"""
+    results = []
+    start = time.perf_counter()
+    for batch in source:
+        for step_start, counts in counter.process(batch):
+            results.append((step_start, counts))
+            if len(results) % report_every == 0:
+                rate = counter.stats['points'] / max(time.perf_counter() - start, 1e-9)
+                print(f"⏱️  {step_start} | Top-K 行程数: {int(counts.sum())} | 活跃车辆: {counter.active_tracks} | "
+                      f"{rate:,.0f} 点/秒")
+    results.extend(counter.flush())
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式轨迹接入：实时匹配路段并输出每分钟 Top-K 路径计数")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument('--replay', help="按时间顺序回放的 processed_data parquet 文件")
+    src.add_argument('--tail', help="持续追加的 CSV 文件 (track_id,lat,lon,speed,timestamp)")
+    parser.add_argument('--speedup', type=float, default=0.0, help="回放倍速（0 = 尽快）")
+    parser.add_argument('--idle-timeout', type=float, default=None, help="--tail 连续无新数据多少秒后结束")
+    parser.add_argument('--graph', default="athens_road_network.graphml")
+    parser.add_argument('--store', default=None, help="step5 张量存储，使用其 path_labels 作为 Top-K 路径")
+    parser.add_argument('--path-dir', default="path_data")
+    parser.add_argument('--top-k', type=int, default=50)
+    parser.add_argument('--time-step', type=int, default=60, help="时间步长（秒）")
+    parser.add_argument('--track-timeout', type=float, default=60.0, help="车辆多少秒无新点视为行程结束")
+    parser.add_argument('--max-delay', type=float, default=300.0, help="时间步最多等待未结束行程的秒数")
+    parser.add_argument('--output', default=None, help="可选：将输出的计数向量保存为 parquet")
+    args = parser.parse_args()
+
+    index = load_edge_index(args.graph)
+    top_paths = load_top_paths(args.store, args.path_dir, args.top_k, index)
+    counter = StreamingPathCounter(index, top_paths, args.time_step,
+                                   args.track_timeout, args.max_delay)
+    if args.replay:
+        source = replay_parquet(args.replay, speedup=args.speedup)
+    else:
+        source = tail_csv(args.tail, idle_timeout_sec=args.idle_timeout)
+
+    print(f"🚀 流式接入开始 | Top-K 路径数: {len(top_paths)} | 时间步: {args.time_step}s | 超时: {args.track_timeout}s")
+    results = run_stream(source, counter)
+    print(f"✅ 结束: {counter.stats['points']} 个点 | {counter.stats['paths']} 条路径 "
+          f"(Top-K {counter.stats['top_paths']}, 迟到 {counter.stats['late_paths']}) | 输出 {len(results)} 个时间步")
+    if args.output and results:
+        out = pd.DataFrame(np.stack([c for _, c in results]),
+                           columns=[path_label(key_to_path(k)) for k in counter.top_keys],
+                           index=pd.DatetimeIndex([t for t, _ in results], name='time'))
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        out.to_parquet(args.output)
+        print(f"💾 已保存: {args.output}")
@@ -0,0 +1,192 @@
+import numpy as np
+import os
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+from scipy.signal import lfilter
+
+from edge_index import load_edge_index
+
+# ==========================================
+# 合成 pNEUMA 数据：沿 athens_road_network.graphml 的真实路段生成轨迹，写出与原始数据相同格式的
+# ';' 分隔 csv（每车一行：4 个静态字段 + 每个采样点 6 个字段 lat, lon, speed, lon_acc, lat_acc, time）
+# 车辆从一个共享的路线池中按 Zipf 分布选择路线，不同文件之间的高频路径可以重复出现，
+# step5 的 Top-P 路径、step6 的训练与原始数据的规模特征接近；仓库不附带原始数据时用于离线基准测试
+# ==========================================
+HEADER = "track_id; type; traveled_d; avg_speed; lat; lon; speed; lon_acc; lat_acc; time\n"
+VEHICLE_TYPES = ('Car', 'Taxi', 'Motorcycle', 'Bus', 'Medium Vehicle', 'Heavy Vehicle')
+VEHICLE_SHARES = (0.5, 0.25, 0.15, 0.03, 0.05, 0.02)
+# pNEUMA 的录制时段：每天 08:00 - 10:30，每个无人机每半小时一个文件
+SLOTS = ('0800', '0830', '0900', '0930', '1000')
+NUM_DRONES = 10
+
+def synthetic_file_names(num_files, start_date='20181024'):
+    """按 日期 / 无人机 / 半小时 顺序生成文件名，如 20181024_d1_0830_0900.csv（step1 从文件名取基准时间）"""
+    day0 = datetime.strptime(start_date, '%Y%m%d')
+    names = []
+    for i in range(num_files):
+        day = day0 + timedelta(days=i // (NUM_DRONES * len(SLOTS)))
+        drone = i // len(SLOTS) % NUM_DRONES + 1
+        start = datetime.strptime(SLOTS[i % len(SLOTS)], '%H%M')
+        end = start + timedelta(minutes=30)
+        names.append(f"{day:%Y%m%d}_d{drone}_{start:%H%M}_{end:%H%M}.csv")
+    return names
+
+class RouteSampler:
+    """在路段索引上随机游走生成路线（不走回头路、不重复路段），并给出路线的平面折线"""
+
+    def __init__(self, index):
+        self.index = index
+        edges = np.arange(index.num_edges)
+        # 线段按边编号连续存放：边 e 的折线为 segments[seg_start[e]:seg_end[e]]
+        self.seg_start = np.searchsorted(index.seg_edge, edges, side='left')
+        self.seg_end = np.searchsorted(index.seg_edge, edges, side='right')
+        # 出边查询：按起点排序后二分
+        self.out_order = np.argsort(index.edge_u, kind='stable')
+        self.out_u = index.edge_u[self.out_order]
+
+    def out_edges(self, node):
+        lo, hi = np.searchsorted(self.out_u, [node, node + 1])
+        return self.out_order[lo:hi]
+
+    def polyline(self, route):
+        """路线 -> (折线顶点 (m, 2)，各顶点的累计里程)"""
+        parts = []
+        for i, e in enumerate(route):
+            segs = self.index.segments[self.seg_start[e]:self.seg_end[e]]
+            pts = np.vstack([segs[:1, :2], segs[:, 2:4]])
+            parts.append(pts if i == 0 else pts[1:])
+        xy = np.vstack(parts)
+        cum = np.r_[0.0, np.cumsum(np.hypot(*np.diff(xy, axis=0).T))]
+        return xy, cum
+
+    def random_route(self, rng, min_len_m, max_len_m, max_tries=50):
+        """随机游走直到总长度达到目标值；碰到死路且不足 2 条路段时重试"""
+        for _ in range(max_tries):
+            target = rng.uniform(min_len_m, max_len_m)
+            e = int(rng.integers(self.index.num_edges))
+            route, length = [e], 0.0
+            while True:
+                length += self.index.edge_length[e]
+                if length >= target:
+                    break
+                nxt = [c for c in self.out_edges(self.index.edge_v[e])
+                       if c not in route and self.index.edge_v[c] != self.index.edge_u[e]]
+                if not nxt:
+                    break
+                e = int(rng.choice(nxt))
+                route.append(e)
+            if len(route) >= 2:
+                return route
+        return route
+
+@lru_cache(maxsize=4)
+def _route_pool(graph_file, num_routes, seed, min_len_m=200.0, max_len_m=1500.0):
+    """共享路线池（同一 seed 下各文件、各进程一致）：返回 (sampler, 折线列表, Zipf 选择概率)"""
+    index = load_edge_index(graph_file)
+    sampler = RouteSampler(index)
+    rng = np.random.default_rng(seed)
+    lines = [sampler.polyline(sampler.random_route(rng, min_len_m, max_len_m)) for _ in range(num_routes)]
+    weights = 1.0 / np.arange(1, num_routes + 1) ** 1.1
+    return sampler, lines, weights / weights.sum()
+
+def vehicle_trajectory(rng, index, xy, cum, t0, duration_sec, hz=25, max_trip_sec=900, pos_noise_m=0.2):
+    """
+    沿折线 (index 投影平面) 行驶的一辆车：逐秒速度 = 巡航速度 × AR(1) 波动，随机插入停车（信号灯 / 拥堵），再插值到 hz
+    返回 (n, 6) 数组 lat, lon, speed(km/h), lon_acc, lat_acc, time(s)，以及行驶距离（米）
+    """
+    num_sec = int(min(duration_sec - t0, max_trip_sec)) + 1
+    cruise = np.clip(rng.normal(28.0, 8.0), 8.0, 55.0)
+    factor = lfilter([1.0], [1.0, -0.9], rng.normal(0.0, 0.05, num_sec))
+    speed_sec = cruise * np.clip(1.0 + factor, 0.3, 1.4)
+    for _ in range(rng.poisson(cum[-1] / 500.0)):
+        s = int(rng.integers(num_sec))
+        speed_sec[s:s + int(rng.integers(5, 40))] = 0.0
+
+    dt = 1.0 / hz
+    t = np.arange(0.0, num_sec - 1, dt)
+    speed = np.interp(t, np.arange(num_sec), speed_sec)
+    dist = np.r_[0.0, np.cumsum(speed[:-1] / 3.6 * dt)]
+    n = max(int(np.searchsorted(dist, cum[-1], side='right')), 1)
+    t, speed, dist = t[:n], speed[:n], dist[:n]
+
+    x = np.interp(dist, cum, xy[:, 0]) + rng.normal(0.0, pos_noise_m, n)
+    y = np.interp(dist, cum, xy[:, 1]) + rng.normal(0.0, pos_noise_m, n)
+    lon, lat = index.unproject(x, y)
+    lon_acc = np.gradient(speed / 3.6, dt) if n > 1 else np.zeros(n)
+    lat_acc = rng.normal(0.0, 0.2, n)
+    return np.column_stack([lat, lon, speed, lon_acc, lat_acc, t0 + t]), dist[-1]
+
+def write_synthetic_file(path, graph_file="athens_road_network.graphml", num_vehicles=1000, duration_sec=1800,
+                         hz=25, seed=0, num_routes=400, route_seed=0):
+    """写出一个合成 pNEUMA 文件（先写临时文件再重命名），返回 (车辆数, 采样点数)"""
+    sampler, lines, weights = _route_pool(graph_file, num_routes, route_seed)
+    rng = np.random.default_rng(seed)
+    types = rng.choice(len(VEHICLE_TYPES), num_vehicles, p=VEHICLE_SHARES)
+    routes = rng.choice(len(lines), num_vehicles, p=weights)
+    # 出发时间按 hz 采样间隔对齐，与真实数据的时间戳网格一致
+    starts = np.sort(np.round(rng.uniform(0, duration_sec - 10, num_vehicles) * hz) / hz)
+
+    tmp = path + '.tmp'
+    num_points = 0
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(HEADER)
+        for tid, (vt, r, t0) in enumerate(zip(types, routes, starts), start=1):
+            dyn, traveled = vehicle_trajectory(rng, sampler.index, *lines[r], t0, duration_sec, hz)
+            # 一次 % 格式化整行的全部采样点（逐点 f-string 慢一个数量级）
+            body = ("%.6f; %.6f; %.4f; %.4f; %.4f; %.6f; " * len(dyn)) % tuple(dyn.ravel())
+            f.write(f"{tid}; {VEHICLE_TYPES[vt]}; {traveled:.2f}; {dyn[:, 2].mean():.6f}; {body}\n")
+            num_points += len(dyn)
+    os.replace(tmp, path)
+    return num_vehicles, num_points
+
+def _file_task(kwargs):
+    start = time.perf_counter()
+    vehicles, points = write_synthetic_file(**kwargs)
+    return {'file': os.path.basename(kwargs['path']), 'vehicles': vehicles, 'points': points,
+            'seconds': time.perf_counter() - start, 'mb': os.path.getsize(kwargs['path']) / 1024 ** 2}
+
+def generate_dataset(output_dir, num_files=1, vehicles_per_file=1000, duration_sec=1800, hz=25,
+                     graph_file="athens_road_network.graphml", seed=0, num_routes=400, workers=1,
+                     overwrite=False):
+    """
+    生成 num_files 个 30 分钟的合成文件（文件名见 synthetic_file_names），workers > 1 时按文件并行
+    已存在的同名文件默认跳过（基准测试重复运行时复用），返回全部文件路径
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, name) for name in synthetic_file_names(num_files)]
+    tasks = [dict(path=p, graph_file=graph_file, num_vehicles=vehicles_per_file, duration_sec=duration_sec,
+                  hz=hz, seed=seed * 100_003 + i, num_routes=num_routes, route_seed=seed)
+             for i, p in enumerate(paths) if overwrite or not os.path.exists(p)]
+    if not tasks:
+        return paths
+
+    print(f"🧪 生成 {len(tasks)} 个合成 pNEUMA 文件 ({vehicles_per_file} 辆车 / {duration_sec}s / {hz}Hz) -> {output_dir}")
+    start = time.perf_counter()
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            stats = list(pool.map(_file_task, tasks))
+    else:
+        stats = [_file_task(t) for t in tasks]
+    total_mb = sum(s['mb'] for s in stats)
+    print(f"✅ 合成完成: {sum(s['points'] for s in stats)} 个采样点, {total_mb:.1f} MB, "
+          f"耗时 {time.perf_counter() - start:.2f}s")
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="沿真实路网生成 pNEUMA 格式的合成轨迹 csv")
+    parser.add_argument('--output', default='dataset_synth')
+    parser.add_argument('--files', type=int, default=1, help="文件数（每个文件 = 一个无人机的半小时录制）")
+    parser.add_argument('--vehicles', type=int, default=1000, help="每个文件的车辆数")
+    parser.add_argument('--duration-sec', type=int, default=1800)
+    parser.add_argument('--hz', type=int, default=25)
+    parser.add_argument('--routes', type=int, default=400, help="共享路线池大小")
+    parser.add_argument('--graph-file', default='athens_road_network.graphml')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--overwrite', action='store_true')
+    args = parser.parse_args()
+    generate_dataset(args.output, args.files, args.vehicles, args.duration_sec, args.hz, args.graph_file,
+                     args.seed, args.routes, args.workers, args.overwrite)
@@ -1,135 +1,184 @@
 import pandas as pd
 import numpy as np
-import csv
 import time
 import os
 import glob
-from datetime import datetime, timedelta
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from step1_parse_pneuma import parsed_output_path, run_batch_parser, NUM_STATIC_FIELDS, DYNAMIC_WIDTH
+from traj_dataset import query_trajectories
+
+# ==========================================
+# step1 解析结果核对：逐车辆比较原始 csv 与 processed_data
+#   点数    处理后点数 == ceil(原始采样点数 / sampling_rate)
+#   时长    处理后 (末点 - 首点) 与原始 (末采样 - 首采样) 的误差 < 1.5 秒
+#   坐标    处理后首点纬度与原始首个采样一致 (1e-6)
+# 原始文件只顺序扫描一遍，每行只切出首个采样和末个采样的字段；处理结果只读 3 列，
+# 按 (track_id, timestamp) 排序后用分组边界一次得到每辆车的统计，不再逐车过滤整表
+# 多个文件按文件并行，不通过的车辆写入 parquet 报告
+# ==========================================
+DURATION_TOL_SEC = 1.5
+COORD_TOL = 1e-6
 
 # ==========================================
-# 模块 1: 核心解析逻辑
+# 模块 1: 原始文件单遍扫描
 # ==========================================
-def get_absolute_base_time(file_name):
-    """从文件名解析绝对时间基准"""
-    try:
-        parts = file_name.split('_')
-        return datetime.strptime(f"{parts[0]}{parts[2]}", "%Y%m%d%H%M")
-    except:
+def _raw_record(line):
+    """一行 -> (track_id, 采样点数, 首采样纬度, 首采样时间, 末采样时间)；字段不足时返回 None"""
+    s = line.rstrip().rstrip(';')
+    num_fields = s.count(';') + 1
+    if num_fields < NUM_STATIC_FIELDS:
         return None
+    n = (num_fields - NUM_STATIC_FIELDS) // DYNAMIC_WIDTH
+    if n == 0:
+        return int(s.split(';', 1)[0]), 0, np.nan, np.nan, np.nan
+    # 只切开头的静态字段 + 首个采样、末尾的残缺字段 + 末个采样的时间，不拆分整行
+    head = s.split(';', NUM_STATIC_FIELDS + DYNAMIC_WIDTH)
+    extra = num_fields - NUM_STATIC_FIELDS - n * DYNAMIC_WIDTH
+    tail = s.rsplit(';', extra + 1)
+    return (int(head[0]), n, float(head[NUM_STATIC_FIELDS]),
+            float(head[NUM_STATIC_FIELDS + 5]), float(tail[-(extra + 1)]))
 
-def run_batch_parser(input_folder='dataset', output_folder='processed_data', sampling_rate=25):
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    all_files = sorted(glob.glob(os.path.join(input_folder, "*.csv")))
-    print(f"🚀 发现 {len(all_files)} 个原始文件，开始解析...")
-
-    for file_path in all_files:
-        file_name = os.path.basename(file_path)
-        base_dt = get_absolute_base_time(file_name)
-        trajectories_list = []
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f, delimiter=';')
-            next(reader) # skip header
-            for row in reader:
-                row = [x.strip() for x in row if x.strip()]
-                if len(row) < 10: continue
-                
-                track_id = int(row[0])
-                dynamic_data = row[10:]
-                for i in range(0, len(dynamic_data), 6 * sampling_rate):
-                    chunk = dynamic_data[i : i + 6]
-                    if len(chunk) == 6:
-                        rel_time = float(chunk[5])
-                        abs_time = base_dt + timedelta(seconds=rel_time) if base_dt else rel_time
-                        trajectories_list.append({
-                            'track_id': track_id,
-                            'lat': float(chunk[0]),
-                            'lon': float(chunk[1]),
-                            'timestamp': abs_time
-                        })
-        
-        df_t = pd.DataFrame(trajectories_list)
-        out_p = os.path.join(output_folder, file_name.replace('.csv', '.parquet'))
-        df_t.to_parquet(out_p, engine='pyarrow')
-        print(f"✅ 文件 {file_name} 已转换至 Parquet.")
+def scan_raw(raw_csv_path):
+    """顺序扫描原始 csv 一遍，返回每辆车一行的 DataFrame"""
+    rows = []
+    with open(raw_csv_path, 'r', encoding='utf-8') as f:
+        f.readline()  # 表头
+        for line in f:
+            rec = _raw_record(line)
+            if rec is not None:
+                rows.append(rec)
+    return pd.DataFrame(rows, columns=['track_id', 'raw_points', 'raw_first_lat', 'raw_t0', 'raw_t1'])
 
 # ==========================================
-# 模块 2: 自动化核对逻辑
+# 模块 2: 处理结果按车辆汇总
 # ==========================================
-def verify_random_samples(parquet_path, num_samples=10):
-    df = pd.read_parquet(parquet_path)
-    all_ids = df['track_id'].unique()
-    sampled_ids = np.random.choice(all_ids, size=min(num_samples, len(all_ids)), replace=False)
-    
-    samples = []
-    for tid in sampled_ids:
-        track_data = df[df['track_id'] == tid].sort_values('timestamp')
-        samples.append({
-            'track_id': tid,
-            'count': len(track_data),
-            'start': track_data['timestamp'].min(),
-            'end': track_data['timestamp'].max(),
-            'p_first_lat': track_data['lat'].iloc[0]
-        })
-    return samples
-
-def verify_against_raw(raw_csv_path, sampled_ids):
-    verification_results = {}
-    with open(raw_csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f, delimiter=';')
-        next(reader)
-        for row in reader:
-            row = [x.strip() for x in row if x.strip()]
-            if not row: continue
-            tid = int(row[0])
-            if tid in sampled_ids:
-                dyn = row[10:]
-                verification_results[tid] = {
-                    'raw_total_points': len(dyn) // 6,
-                    'raw_duration': float(dyn[-1]) - float(dyn[5]),
-                    'raw_first_lat': float(dyn[0])
-                }
-    return verification_results
+def summarize_processed(parquet_path):
+    """每辆车的 点数 / 首末时间 / 首点纬度（按 track_id, timestamp 排序后取分组边界）"""
+    df = query_trajectories(parquet_path, columns=['track_id', 'timestamp', 'lat'])
+    tid = df['track_id'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, tid[1:] != tid[:-1]]) if len(tid) else np.array([], dtype=np.int64)
+    ends = np.r_[starts[1:], len(tid)] - 1
+    ts = df['timestamp'].to_numpy()
+    return pd.DataFrame({
+        'track_id': tid[starts],
+        'count': ends - starts + 1,
+        'start': ts[starts],
+        'end': ts[ends],
+        'first_lat': df['lat'].to_numpy()[starts],
+    })
 
 # ==========================================
-# 模块 3: 运行主程序与生成报告
+# 模块 3: 逐车辆比对
 # ==========================================
-if __name__ == "__main__":
-    # 1. 解析数据
-    run_batch_parser()
-
-    # 2. 选取一个文件进行深度核对
-    test_file = '20181024_d1_0830_0900' # 修改为你 dataset 下的文件名
-    raw_path = f'dataset/{test_file}.csv'
-    parquet_path = f'processed_data/{test_file}.parquet'
-
-    if os.path.exists(raw_path) and os.path.exists(parquet_path):
-        print(f"\n" + "="*90)
-        print(f"📊 随机抽样对比报告: {test_file}")
-        print(f"{'Track_ID':<10} | {'点数(处理/原始)':<15} | {'时间差误差(s)':<15} | {'首点坐标':<10} | {'结论'}")
-        print("-" * 90)
+def verify_file(raw_csv_path, parquet_path, sampling_rate=25):
+    """
+    返回每辆车一行的核对表：expected_count / count、duration_err、coord_ok 及总体 status
+    status: PASS / FAIL / MISSING_PROCESSED（原始有点但处理结果中没有）/ MISSING_RAW（处理结果多出的车辆）
+    """
+    raw = scan_raw(raw_csv_path)
+    proc = summarize_processed(parquet_path)
+    # 没有任何采样点的车辆 step1 不输出，不参与核对
+    raw = raw[raw['raw_points'] > 0]
+    df = raw.merge(proc, on='track_id', how='outer', indicator=True)
+
+    df['expected_count'] = (df['raw_points'] + sampling_rate - 1) // sampling_rate
+    df['raw_duration'] = df['raw_t1'] - df['raw_t0']
+    df['duration'] = (df['end'] - df['start']).dt.total_seconds()
+    df['duration_err'] = (df['duration'] - df['raw_duration']).abs()
+    df['count_ok'] = df['count'] == df['expected_count']
+    df['duration_ok'] = df['duration_err'] < DURATION_TOL_SEC
+    df['coord_ok'] = (df['first_lat'] - df['raw_first_lat']).abs() < COORD_TOL
+
+    df['status'] = np.where(df['count_ok'] & df['duration_ok'] & df['coord_ok'], 'PASS', 'FAIL')
+    df.loc[df['_merge'] == 'left_only', 'status'] = 'MISSING_PROCESSED'
+    df.loc[df['_merge'] == 'right_only', 'status'] = 'MISSING_RAW'
+    df.insert(0, 'file', os.path.basename(raw_csv_path))
+    return df.drop(columns=['_merge', 'raw_t0', 'raw_t1']).sort_values('track_id', ignore_index=True)
+
+def _verify_task(args):
+    start = time.perf_counter()
+    df = verify_file(*args)
+    return df, time.perf_counter() - start
 
-        samples = verify_random_samples(parquet_path, 10)
-        raw_infos = verify_against_raw(raw_path, [s['track_id'] for s in samples])
-
-        for s in samples:
-            tid = s['track_id']
-            raw = raw_infos.get(tid)
-            if not raw: continue
-
-            # 点数判定 (25Hz -> 1Hz)
-            theory_count = (raw['raw_total_points'] + 24) // 25
-            # 时间跨度判定
-            p_dur = (s['end'] - s['start']).total_seconds()
-            err = abs(p_dur - raw['raw_duration'])
-            # 坐标判定
-            coord_ok = abs(s['p_first_lat'] - raw['raw_first_lat']) < 1e-6
-            
-            status = "✅ PASS" if err < 1.5 and coord_ok else "❌ FAIL"
-            
-            print(f"{tid:<10} | {s['count']}/{theory_count:<12} | {err:<15.4f} | {'Matched' if coord_ok else 'Shifted':<10} | {status}")
-        print("="*90)
+def verify_all(raw_dir='dataset', processed_dir='processed_data', sampling_rate=25, workers=1, files=None,
+               report_path=None):
+    """
+    核对 raw_dir 下的每个 csv 与其 step1 输出，workers > 1 时按文件并行
+    返回全部车辆的核对表；report_path 给出时把不通过的车辆写入 parquet
+    """
+    raw_files = sorted(files if files is not None else glob.glob(os.path.join(raw_dir, "*.csv")))
+    tasks = []
+    for raw_path in raw_files:
+        parquet_path = parsed_output_path(raw_path, processed_dir)
+        if os.path.exists(parquet_path):
+            tasks.append((raw_path, parquet_path, sampling_rate))
+        else:
+            print(f"⚠️ {os.path.basename(raw_path)} 没有对应的解析结果: {parquet_path}")
+    if not tasks:
+        print("❌ 没有可核对的文件，请确认 step1 已运行。")
+        return None
+
+    print(f"🔎 核对 {len(tasks)} 个文件 (workers={workers})...")
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_verify_task, tasks))
     else:
-        print("\n无法进行核对，请检查文件名配置。")
\ No newline at end of file
+        results = [_verify_task(t) for t in tasks]
+
+    for (df, seconds), (raw_path, _, _) in zip(results, tasks):
+        counts = df['status'].value_counts()
+        print(f"   {os.path.basename(raw_path):<32} | 车辆 {len(df):>6} | 通过 {counts.get('PASS', 0):>6} | "
+              f"不通过 {len(df) - counts.get('PASS', 0):>5} | {seconds:.2f}s")
+    report = pd.concat([df for df, _ in results], ignore_index=True)
+
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+        mismatches = report[report['status'] != 'PASS']
+        tmp = report_path + '.tmp'
+        mismatches.to_parquet(tmp, index=False)
+        os.replace(tmp, report_path)
+        print(f"📝 不通过的车辆 ({len(mismatches)}) 已写入: {report_path}")
+    return report
+
+# ==========================================
+# 模块 4: 运行主程序与生成报告
+# ==========================================
+def print_report(report, num_rows=10):
+    """汇总各项检查的失败数，并按旧版表格格式列出前 num_rows 个不通过的车辆"""
+    missing = report['status'].str.startswith('MISSING')
+    both = report[~missing]
+    print(f"\n" + "="*90)
+    print(f"📊 核对汇总: 共 {len(report)} 辆车 | 通过 {(report['status'] == 'PASS').sum()} | "
+          f"点数不符 {(~both['count_ok']).sum()} | 时长误差 {(~both['duration_ok']).sum()} | "
+          f"首点偏移 {(~both['coord_ok']).sum()} | 缺失 {missing.sum()}")
+    bad = report[report['status'] != 'PASS'].head(num_rows)
+    if len(bad):
+        print(f"{'文件':<28} | {'Track_ID':<10} | {'点数(处理/原始)':<15} | {'时间差误差(s)':<15} | {'首点坐标':<10} | {'结论'}")
+        print("-" * 90)
+        for r in bad.itertuples():
+            count = f"{r.count:.0f}/{r.expected_count:.0f}"
+            print(f"{r.file:<28} | {r.track_id:<10} | {count:<15} | {r.duration_err:<15.4f} | "
+                  f"{'Matched' if r.coord_ok else 'Shifted':<10} | ❌ {r.status}")
+    print("="*90)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="逐车辆核对原始 csv 与 step1 解析结果")
+    parser.add_argument('--raw-dir', default='dataset')
+    parser.add_argument('--processed-dir', default='processed_data')
+    parser.add_argument('--files', nargs='+', default=None, help="只核对指定的原始 csv")
+    parser.add_argument('--sampling-rate', type=int, default=25)
+    parser.add_argument('--workers', type=int, default=1, help="按文件并行的进程数")
+    parser.add_argument('--report', default=os.path.join('reports', 'verify_mismatches.parquet'),
+                        help="不通过车辆的 parquet 报告")
+    parser.add_argument('--parse', action='store_true', help="核对前先运行 step1 解析")
+    args = parser.parse_args()
+
+    if args.parse:
+        run_batch_parser(args.raw_dir, args.processed_dir, args.sampling_rate, workers=args.workers, files=args.files)
+    start = time.perf_counter()
+    report = verify_all(args.raw_dir, args.processed_dir, args.sampling_rate, args.workers, args.files, args.report)
+    if report is not None:
+        print_report(report)
+        print(f"⏱️  核对耗时: {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,91 @@
+import pandas as pd
+import numpy as np
+import os
+import glob
+import tempfile
+
+from step5_build_st_features_batch import build_st_features_batch
+from st_store import load_st_data
+
+# ==========================================
+# 回归核对：
+#   per_file 模式下向量化 step5 与旧版 iterrows 实现在 path_data 上的输出必须完全一致
+#   continuous 模式下与逐行程的绝对时间分桶结果一致，且 Top-P 路径的行程一条不丢
+# ==========================================
+def legacy_build(path_files, num_top_paths=50, time_step_sec=60):
+    """旧版 build_st_features_batch 的核心逻辑（apply(tuple) + iterrows）"""
+    all_path_series = []
+    for f in path_files:
+        temp_df = pd.read_parquet(f)
+        temp_df['path_tuple'] = temp_df['edge_id'].apply(tuple)
+        all_path_series.append(temp_df['path_tuple'])
+    global_paths = pd.concat(all_path_series).value_counts().head(num_top_paths).index.tolist()
+    path_to_idx = {path: i for i, path in enumerate(global_paths)}
+
+    st_chunks = []
+    for file_path in path_files:
+        df = pd.read_parquet(file_path)
+        df['path_tuple'] = df['edge_id'].apply(tuple)
+        start_t = df['timestamp'].min()
+        num_steps = 15
+        X_chunk = np.zeros((num_steps, num_top_paths, 1))
+        for _, row in df.iterrows():
+            if row['path_tuple'] in path_to_idx:
+                t_idx = int((row['timestamp'] - start_t).total_seconds() // time_step_sec)
+                p_idx = path_to_idx[row['path_tuple']]
+                if 0 <= t_idx < num_steps:
+                    X_chunk[t_idx, p_idx, 0] += 1
+        st_chunks.append(X_chunk)
+
+    A_path = np.zeros((num_top_paths, num_top_paths))
+    for i in range(num_top_paths):
+        for j in range(num_top_paths):
+            if set(global_paths[i]) & set(global_paths[j]):
+                A_path[i, j] = 1
+    return {'x_list': st_chunks, 'adj': A_path, 'path_labels': global_paths}
+
+def test_step5_matches_legacy(input_dir="path_data", time_step_sec=60):
+    path_files = sorted(glob.glob(os.path.join(input_dir, "*_paths.parquet")))
+    assert path_files, "找不到 path_data，请先运行 step4"
+
+    expected = legacy_build(path_files, time_step_sec=time_step_sec)
+    with tempfile.TemporaryDirectory() as out_dir:
+        output_path = build_st_features_batch(input_dir, out_dir, time_step_sec=time_step_sec, time_axis='per_file')
+        actual = load_st_data(output_path, mmap=False)
+
+    assert actual['path_labels'] == expected['path_labels']
+    assert np.array_equal(actual['adj'].toarray(), expected['adj'])
+    assert len(actual['x_list']) == len(expected['x_list'])
+    for a, e in zip(actual['x_list'], expected['x_list']):
+        assert a.shape == e.shape and np.array_equal(a, e)
+
+def check_continuous_time_axis(input_dir="path_data", time_step_sec=60):
+    """构建连续时间轴并逐桶核对，返回有效步掩码（供 __main__ 打印空档统计）"""
+    path_files = sorted(glob.glob(os.path.join(input_dir, "*_paths.parquet")))
+    with tempfile.TemporaryDirectory() as out_dir:
+        output_path = build_st_features_batch(input_dir, out_dir, time_step_sec=time_step_sec)
+        actual = load_st_data(output_path, mmap=False)
+
+    df = pd.concat([pd.read_parquet(f, columns=['edge_id', 'timestamp']) for f in path_files], ignore_index=True)
+    path_to_idx = {p: i for i, p in enumerate(actual['path_labels'])}
+    p_idx = df['edge_id'].apply(lambda e: path_to_idx.get(tuple(e), -1)).to_numpy()
+    origin = df['timestamp'].min().floor(f"{time_step_sec}s")
+    t_idx = ((df['timestamp'] - origin) // pd.Timedelta(seconds=time_step_sec)).to_numpy()
+
+    x = actual['x_list']
+    assert len(x) == 1 and len(actual['mask']) == len(x[0])
+    expected = np.zeros(x[0].shape[:2])
+    np.add.at(expected, (t_idx[p_idx >= 0], p_idx[p_idx >= 0]), 1)
+    assert np.array_equal(x[0][..., 0], expected)
+    assert x[0][..., 0].sum() == (p_idx >= 0).sum()
+    return actual['mask']
+
+def test_continuous_time_axis(input_dir="path_data", time_step_sec=60):
+    check_continuous_time_axis(input_dir, time_step_sec)
+
+if __name__ == "__main__":
+    for step in [60, 30]:
+        test_step5_matches_legacy(time_step_sec=step)
+        print(f"✅ time_step_sec={step}: 向量化输出与旧版实现完全一致")
+        mask = check_continuous_time_axis(time_step_sec=step)
+        print(f"✅ time_step_sec={step}: 连续时间轴 {len(mask)} 步（空档 {int((~mask).sum())} 步），行程无丢失")
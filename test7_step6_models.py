@@ -0,0 +1,41 @@
+import numpy as np
+import torch
+
+from step6_stgcn_trainer import build_model, default_dilations
+
+# ==========================================
+# 冒烟检查：step6 命令行默认配置下各模型都能构建并完成一次前向
+#   默认 window_size=5, --blocks 2, --kernel-size 2（见 step6_stgcn_trainer 的 argparse）
+# ==========================================
+CLI_DEFAULTS = {'window_size': 5, 'horizon': 1, 'num_blocks': 2, 'kernel_size': 2}
+
+def _forward(name, window_size, horizon, num_nodes=6, in_channels=1, **kwargs):
+    rng = np.random.default_rng(0)
+    adj = (rng.random((num_nodes, num_nodes)) < 0.3).astype(np.float32)
+    model = build_model(name, adj, num_nodes, in_channels, window_size, horizon, hidden_channels=8, **kwargs)
+    out = model(torch.randn(3, window_size, num_nodes, in_channels))
+    assert out.shape == (3, horizon, num_nodes)
+    return model
+
+def test_tcn_default_config_builds():
+    model = _forward('tcn', CLI_DEFAULTS['window_size'], CLI_DEFAULTS['horizon'],
+                     num_blocks=CLI_DEFAULTS['num_blocks'], kernel_size=CLI_DEFAULTS['kernel_size'], dilations=None)
+    assert model.receptive_field <= CLI_DEFAULTS['window_size']
+    _forward('simple', CLI_DEFAULTS['window_size'], CLI_DEFAULTS['horizon'])
+
+def test_default_dilations_fit_window():
+    for window_size in range(3, 25):
+        for num_blocks in range(1, 5):
+            for kernel_size in (2, 3):
+                dilations = default_dilations(num_blocks, kernel_size, window_size)
+                rf = 1 + sum(2 * (kernel_size - 1) * d for d in dilations)
+                assert rf <= window_size or dilations == [1]
+    # 窗口足够大时保持 1, 2, 4, ... 的增长
+    assert default_dilations(3, 2, 16) == [1, 2, 4]
+
+if __name__ == "__main__":
+    test_tcn_default_config_builds()
+    print(f"✅ 默认配置 {CLI_DEFAULTS}: tcn 空洞率 "
+          f"{default_dilations(CLI_DEFAULTS['num_blocks'], CLI_DEFAULTS['kernel_size'], CLI_DEFAULTS['window_size'])}，前向正常")
+    test_default_dilations_fit_window()
+    print("✅ 默认空洞率的感受野均不超过 window_size")
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import os
+import glob
+import tempfile
+
+from edge_index import load_edge_index
+from st_store import load_st_data, save_st_store
+from stream_ingest import StreamingPathCounter, replay_parquet, load_top_paths
+
+# ==========================================
+# 流式接入核对：以 model_inputs/st_batch_data 的 path_labels 为 Top-K 路径，逐文件回放 processed_data，
+# 超时 / 最大等待设为无穷大时，按存储的时间原点对齐后的每分钟计数必须与 step5 的张量完全一致
+# ==========================================
+def stream_store_counts(store="model_inputs/st_batch_data", processed_dir="processed_data",
+                        graph_file="athens_road_network.graphml"):
+    """返回 (流式计数 (T, K), step5 存储中的计数 (T, K))"""
+    data = load_st_data(store, mmap=False)
+    index = load_edge_index(graph_file)
+    top_paths = load_top_paths(store, index=index)
+    origin = pd.Timestamp(data['meta']['origin'])
+    step = pd.Timedelta(seconds=data['meta']['time_step_sec'])
+    expected = np.asarray(data['x'])[..., 0]
+    actual = np.zeros_like(expected)
+    # track_id 只在单个录制内唯一：每个文件一个计数器，结果按时间步相加
+    for f in sorted(p for p in glob.glob(os.path.join(processed_dir, "*.parquet")) if '_info' not in p):
+        counter = StreamingPathCounter(index, top_paths, step.total_seconds(), track_timeout_sec=1e9,
+                                       max_delay_sec=1e9, origin=origin)
+        results = []
+        for batch in replay_parquet(f):
+            results.extend(counter.process(batch))
+        results.extend(counter.flush())
+        for t, counts in results:
+            i = (t - origin) // step
+            if i < len(actual):
+                actual[i] += counts
+            else:
+                assert counts.sum() == 0
+    return actual, expected
+
+def test_stream_matches_store():
+    actual, expected = stream_store_counts()
+    assert expected.sum() > 0 and np.array_equal(actual, expected)
+
+def test_legacy_labels_rejected():
+    with tempfile.TemporaryDirectory() as d:
+        store = save_st_store(os.path.join(d, 'st'), [np.zeros((3, 1, 1))], np.zeros((1, 1)), [('1_2', '2_3')])
+        try:
+            load_top_paths(store)
+        except ValueError as e:
+            assert 'step3-5' in str(e)
+        else:
+            raise AssertionError("旧版字符串路径标签应当报错")
+
+if __name__ == "__main__":
+    actual, expected = stream_store_counts()
+    assert np.array_equal(actual, expected)
+    print(f"✅ 流式计数与 step5 存储一致: {expected.shape[0]} 个时间步, {int(expected.sum())} 条 Top-K 行程")
+    test_legacy_labels_rejected()
+    print("✅ 旧版字符串路径标签给出明确错误")
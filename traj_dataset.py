@@ -0,0 +1,147 @@
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import os
+import glob
+import argparse
+
+# ==========================================
+# 分区轨迹数据集：processed_data / matched_data 的逐录制文件按 hive 目录分区
+#   <root>/date=20181024/drone=d1/slot=0830_0900/20181024_d1_0830_0900[_matched].parquet
+# 文件内按 (track_id, timestamp) 排序，较小的 row group 带 min/max 统计，
+# 按车辆、按时间段的查询可以跳过无关的分区目录和 row group，只读取所需的列
+# 读取统一走 query_trajectories()：source 可以是分区根目录，也可以是单个 / 多个扁平 parquet 文件
+# ==========================================
+PARTITION_KEYS = ('date', 'drone', 'slot')
+PARTITIONING = ds.partitioning(pa.schema([(k, pa.string()) for k in PARTITION_KEYS]), flavor='hive')
+SORT_KEYS = [('track_id', 'ascending'), ('timestamp', 'ascending')]
+# 1Hz 下一个半小时文件约 6~10 万个点，按 16k 行分组即每组几百辆车
+DEFAULT_ROW_GROUP = 16_384
+
+def recording_partition(file_name):
+    """pNEUMA 文件名 -> 分区键，如 20181024_d1_0830_0900_matched.parquet -> {date, drone, slot}"""
+    parts = os.path.basename(file_name).split('.')[0].split('_')
+    if (len(parts) < 4 or not (len(parts[0]) == 8 and parts[0].isdigit())
+            or not all(len(p) == 4 and p.isdigit() for p in parts[2:4])):
+        raise ValueError(f"无法从文件名解析 日期 / 无人机 / 时段: {file_name}")
+    return {'date': parts[0], 'drone': parts[1], 'slot': f"{parts[2]}_{parts[3]}"}
+
+def partitionable(files):
+    """按文件名能否解析出分区键拆分文件列表，返回 (可分区的文件, 跳过的文件)；跳过的文件逐个打印警告"""
+    kept, skipped = [], []
+    for file_path in files:
+        try:
+            recording_partition(file_path)
+        except ValueError:
+            print(f"⚠️ 文件名不是 日期_无人机_开始_结束 格式，不写入分区数据集: {os.path.basename(file_path)}")
+            skipped.append(file_path)
+        else:
+            kept.append(file_path)
+    return kept, skipped
+
+def partition_path(file_path, root):
+    """扁平文件 -> 分区数据集中对应的文件路径（文件名保持不变）"""
+    keys = recording_partition(file_path)
+    return os.path.join(root, *(f"{k}={keys[k]}" for k in PARTITION_KEYS), os.path.basename(file_path))
+
+def write_partition(file_path, root, row_group_size=DEFAULT_ROW_GROUP):
+    """把一个扁平文件按 (track_id, timestamp) 排序后写入分区数据集（先写临时文件再替换），返回输出路径"""
+    table = pq.read_table(file_path)
+    table = table.sort_by([k for k in SORT_KEYS if k[0] in table.column_names])
+    output = partition_path(file_path, root)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    tmp = output + '.tmp'
+    sorting = pq.SortingColumn.from_ordering(table.schema, [k for k in SORT_KEYS if k[0] in table.column_names])
+    pq.write_table(table, tmp, row_group_size=row_group_size, write_statistics=True, sorting_columns=sorting)
+    os.replace(tmp, output)
+    return output
+
+def partition_files(files, root, row_group_size=DEFAULT_ROW_GROUP):
+    """files: 扁平 parquet（*_info 车辆元数据文件、文件名无法解析分区键的文件跳过），返回写出的路径列表"""
+    outputs = []
+    files, _ = partitionable(p for p in files if '_info' not in os.path.basename(p))
+    for file_path in files:
+        outputs.append(write_partition(file_path, root, row_group_size))
+        print(f"🗂️  已分区: {os.path.relpath(outputs[-1], root)}")
+    return outputs
+
+def _is_hive_path(path, root):
+    """path 相对 root 的目录中是否有 key=value 形式的分区目录"""
+    return any('=' in part for part in os.path.dirname(os.path.relpath(path, root)).split(os.sep))
+
+def open_trajectories(source):
+    """
+    分区根目录（含 key=value 子目录）-> hive 分区数据集；扁平文件目录 / 单个文件 / 文件列表 -> 普通 parquet 数据集
+    扁平目录不能按 hive 打开：分区键列全为 null，时间段查询附加的 date 条件会把所有行过滤掉
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        files = sorted(p for p in glob.glob(os.path.join(source, '**', '*.parquet'), recursive=True)
+                       if '_info' not in os.path.basename(p))
+        if any(_is_hive_path(p, source) for p in files):
+            return ds.dataset(files, format='parquet', partitioning=PARTITIONING, partition_base_dir=source)
+        return ds.dataset(files, format='parquet')
+    return ds.dataset(source, format='parquet')
+
+def _ts(value):
+    return pa.scalar(pd.Timestamp(value).as_unit('ns').to_datetime64(), type=pa.timestamp('ns'))
+
+def trajectory_filter(dataset, track_ids=None, start=None, end=None, date=None, drone=None, slot=None):
+    """
+    组合过滤表达式：分区键（date / drone / slot，可为单个值或列表）只在分区数据集上生效，
+    track_ids / [start, end) 时间范围下推到 row group 统计
+    """
+    names = set(dataset.schema.names)
+    expr = None
+
+    def add(e):
+        nonlocal expr
+        expr = e if expr is None else expr & e
+
+    for key, value in (('date', date), ('drone', drone), ('slot', slot)):
+        if value is not None and key in names:
+            values = [value] if isinstance(value, str) else list(value)
+            add(pc.field(key).isin(values))
+    if track_ids is not None:
+        add(pc.field('track_id').isin(pa.array(np.asarray(track_ids), type=dataset.schema.field('track_id').type)))
+    if start is not None:
+        add(pc.field('timestamp') >= _ts(start))
+        if 'date' in names:
+            add(pc.field('date') >= pd.Timestamp(start).strftime('%Y%m%d'))
+    if end is not None:
+        add(pc.field('timestamp') < _ts(end))
+        if 'date' in names:
+            add(pc.field('date') <= pd.Timestamp(end).strftime('%Y%m%d'))
+    return expr
+
+def query_trajectories(source, columns=None, track_ids=None, start=None, end=None, date=None, drone=None,
+                       slot=None, to_pandas=True):
+    """
+    按车辆 / 时间段 / 分区读取轨迹点，只读取 columns 中的列（默认全部数据列，不含分区键）
+    返回 DataFrame（to_pandas=False 时返回 pyarrow.Table），行按 (track_id, timestamp) 排序
+    注意 track_id 只在单个录制内唯一：按车辆查询分区数据集时应同时给出 date / drone / slot
+    """
+    dataset = open_trajectories(source)
+    if columns is None:
+        columns = [n for n in dataset.schema.names if n not in PARTITION_KEYS]
+    expr = trajectory_filter(dataset, track_ids, start, end, date, drone, slot)
+    table = dataset.to_table(columns=list(columns), filter=expr)
+    keys = [k for k in SORT_KEYS if k[0] in table.column_names]
+    if keys:
+        table = table.sort_by(keys)
+    return table.to_pandas() if to_pandas else table
+
+def list_tracks(source, **filters):
+    """满足过滤条件的全部 track_id（只读取 track_id 一列）"""
+    table = query_trajectories(source, columns=['track_id'], to_pandas=False, **filters)
+    return pc.unique(table['track_id']).to_numpy()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把逐录制的扁平 parquet 转为 date/drone/slot 分区数据集")
+    parser.add_argument('--input', default='processed_data', help="扁平 parquet 所在目录")
+    parser.add_argument('--output', default=os.path.join('trajectory_dataset', 'processed'))
+    parser.add_argument('--row-group-size', type=int, default=DEFAULT_ROW_GROUP)
+    args = parser.parse_args()
+    partition_files(sorted(glob.glob(os.path.join(args.input, '*.parquet'))), args.output, args.row_group_size)